@@ -0,0 +1,184 @@
+# ======================================================= #
+'''
+@ProjectName: SpatialMCDA
+@Author: FernandoCastano
+@Email: castano.fernando.martin@gmail.com
+@Version: 0.1.0
+'''
+# ------------------------------------------------------- #
+
+# ======================================================= #
+# Packages
+# ------------------------------------------------------- #
+import os
+import numpy as np
+from osgeo import gdal, ogr, osr
+
+# ======================================================= #
+# Main code
+# ------------------------------------------------------- #
+
+# Scales of the benchmark: cells per side of the rasters and
+# number of features of the vectors
+SCALES = {
+    "1k": {"cells": 1000, "features": 1000},
+    "4k": {"cells": 4000, "features": 10000},
+    "10k": {"cells": 10000, "features": 100000},
+    "40k": {"cells": 40000, "features": 1000000}
+    }
+
+# Reference system and upper left corner of the synthetic layers
+# (POSGAR 98 / Argentina 5, as the models of the project)
+EPSG = 22185
+ORIGIN = (5500000.0, 6200000.0)
+
+# Size of the pixels of the synthetic rasters (meters)
+PIXEL_SIZE = 10.0
+
+# Side of the blocks written at once
+BLOCK_SIZE = 512
+
+# Features written per transaction
+FEATURE_BATCH = 10000
+
+def _srs() -> osr.SpatialReference:
+    srs = osr.SpatialReference()
+    srs.ImportFromEPSG(EPSG)
+    return srs
+# End def
+
+def _create_raster(file_name: str, cells: int, dtype: int):
+    options = ['TILED=YES', f'BLOCKXSIZE={BLOCK_SIZE}', f'BLOCKYSIZE={BLOCK_SIZE}', 'COMPRESS=DEFLATE', 'BIGTIFF=IF_SAFER']
+    dataset = gdal.GetDriverByName('GTiff').Create(file_name, cells, cells, 1, dtype, options)
+    dataset.SetGeoTransform((ORIGIN[0], PIXEL_SIZE, 0, ORIGIN[1], 0, -PIXEL_SIZE))
+    dataset.SetProjection(_srs().ExportToWkt())
+    return dataset
+# End def
+
+def _blocks(cells: int):
+    """Blocks of the raster: xoff, yoff and the pixel coordinates."""
+    for yoff in range(0, cells, BLOCK_SIZE):
+        for xoff in range(0, cells, BLOCK_SIZE):
+            xsize, ysize = min(BLOCK_SIZE, cells - xoff), min(BLOCK_SIZE, cells - yoff)
+            y, x = np.mgrid[yoff:yoff + ysize, xoff:xoff + xsize]
+            yield xoff, yoff, x / cells, y / cells
+        # End for
+    # End for
+# End def
+
+def make_raster(file_name: str, cells: int, seed: int = 0) -> str:
+    """Smooth synthetic float32 raster (a sum of waves with random
+    phases), written block by block so the memory doesn't depend on
+    the size.
+
+    Args:
+        file_name (str): path_dir/name of the GeoTIFF.
+        cells (int): pixels per side.
+        seed (int, optional): seed of the phases. Defaults to 0.
+
+    Returns:
+        str: path of the raster.
+    """
+    phases = np.random.default_rng(seed).uniform(0, 2 * np.pi, 4)
+    dataset = _create_raster(file_name, cells, gdal.GDT_Float32)
+    band = dataset.GetRasterBand(1)
+    band.SetNoDataValue(-9999)
+    for xoff, yoff, x, y in _blocks(cells):
+        values = (
+            np.sin(7 * np.pi * x + phases[0]) + np.cos(5 * np.pi * y + phases[1])
+            + 0.5 * np.sin(23 * np.pi * x * y + phases[2]) + 0.25 * np.cos(41 * np.pi * (x - y) + phases[3])
+            )
+        band.WriteArray((100 * values).astype(np.float32), xoff, yoff)
+    # End for
+    dataset = None
+    return file_name
+# End def
+
+def make_mask(file_name: str, cells: int) -> str:
+    """Synthetic feasible region (byte raster with 0 and 1): a disk
+    that covers most of the extent, crossed by a "river".
+
+    Args:
+        file_name (str): path_dir/name of the GeoTIFF.
+        cells (int): pixels per side.
+
+    Returns:
+        str: path of the raster.
+    """
+    dataset = _create_raster(file_name, cells, gdal.GDT_Byte)
+    band = dataset.GetRasterBand(1)
+    for xoff, yoff, x, y in _blocks(cells):
+        inside = (x - 0.5) ** 2 + (y - 0.5) ** 2 < 0.45 ** 2
+        river = np.abs(y - 0.5 - 0.1 * np.sin(6 * np.pi * x)) < 0.02
+        band.WriteArray((inside & ~river).astype(np.uint8), xoff, yoff)
+    # End for
+    dataset = None
+    return file_name
+# End def
+
+def make_points(file_name: str, features: int, cells: int, seed: int = 0) -> str:
+    """Synthetic point shapefile, uniform over the extent of the
+    rasters, with a numeric field "value".
+
+    Args:
+        file_name (str): path_dir/name of the shapefile.
+        features (int): number of points.
+        cells (int): pixels per side of the extent.
+        seed (int, optional): seed of the points. Defaults to 0.
+
+    Returns:
+        str: path of the shapefile.
+    """
+    driver = ogr.GetDriverByName('ESRI Shapefile')
+    if os.path.exists(file_name): driver.DeleteDataSource(file_name)
+    dataset = driver.CreateDataSource(file_name)
+    layer = dataset.CreateLayer('points', _srs(), ogr.wkbPoint)
+    layer.CreateField(ogr.FieldDefn('value', ogr.OFTReal))
+    definition = layer.GetLayerDefn()
+
+    rng = np.random.default_rng(seed)
+    side = cells * PIXEL_SIZE
+    for start in range(0, features, FEATURE_BATCH):
+        size = min(FEATURE_BATCH, features - start)
+        xs = ORIGIN[0] + rng.uniform(0, side, size)
+        ys = ORIGIN[1] - rng.uniform(0, side, size)
+        values = rng.uniform(0, 100, size)
+        layer.StartTransaction()
+        for x, y, value in zip(xs, ys, values):
+            feature = ogr.Feature(definition)
+            feature.SetField('value', float(value))
+            point = ogr.Geometry(ogr.wkbPoint)
+            point.AddPoint_2D(float(x), float(y))
+            feature.SetGeometry(point)
+            layer.CreateFeature(feature)
+        # End for
+        layer.CommitTransaction()
+    # End for
+    dataset = None
+    return file_name
+# End def
+
+def generate(directory: str, scale: str, seed: int = 0) -> dict:
+    """Generate (once) the synthetic layers of a scale.
+
+    Args:
+        directory (str): folder of the layers.
+        scale (str): one of SCALES.
+        seed (int, optional): seed of the layers. Defaults to 0.
+
+    Returns:
+        dict: paths of the "raster", "mask" and "points" layers.
+    """
+    cells, features = SCALES[scale]["cells"], SCALES[scale]["features"]
+    folder = os.path.join(directory, f"{scale}_{seed}")
+    os.makedirs(folder, exist_ok=True)
+    paths = {
+        "raster": os.path.join(folder, 'raster.tif'),
+        "mask": os.path.join(folder, 'mask.tif'),
+        "points": os.path.join(folder, 'points.shp')
+        }
+    if not os.path.exists(paths["raster"]): make_raster(paths["raster"], cells, seed)
+    if not os.path.exists(paths["mask"]): make_mask(paths["mask"], cells)
+    if not os.path.exists(paths["points"]): make_points(paths["points"], features, cells, seed)
+    return paths
+# End def
@@ -0,0 +1,206 @@
+# ======================================================= #
+'''
+@ProjectName: SpatialMCDA
+@Author: FernandoCastano
+@Email: castano.fernando.martin@gmail.com
+@Version: 0.1.0
+'''
+# ------------------------------------------------------- #
+
+# ======================================================= #
+# Packages
+# ------------------------------------------------------- #
+import argparse
+import json
+import os
+import platform
+import shutil
+import subprocess
+import time
+from contextlib import contextmanager
+
+import numpy as np
+from osgeo import gdal
+
+from core import engine, utils
+from core.SMCDALayer import SMCDALayer
+from core.SMCDAModel import SMCDAModel
+from benchmarks.generators import SCALES, EPSG, PIXEL_SIZE, generate
+
+# ======================================================= #
+# Main code
+# ------------------------------------------------------- #
+
+@contextmanager
+def stage(timings: dict, name: str):
+    """Time a stage (wall seconds) into `timings`."""
+    start = time.perf_counter()
+    yield
+    timings[name] = round(time.perf_counter() - start, 4)
+# End def
+
+def cold() -> None:
+    """Forget the metadata already probed (as in a new process)."""
+    utils._PROBES.clear()
+# End def
+
+def build_model(paths: dict, output_dir: str, alias: str) -> SMCDAModel:
+    """Model of the benchmark: a raster and its complement, the
+    proximity to the points and a raster feasible region."""
+    model = SMCDAModel(alias, output_dir, EPSG)
+    model.add_criteria("environment", 2)
+    model.add_criteria("access", 1)
+    model.add_layer2criteria("environment", "raster", path=paths["raster"], weight=2)
+    model.add_layer2criteria("environment", "raster_neg", path=paths["raster"], positive=False, weight=1)
+    points = SMCDALayer(paths["points"])
+    points.calc_proximity(True, 20 * PIXEL_SIZE)
+    model.add_layer2criteria("access", "points", layer=points, weight=1)
+    model.add_layer2feasibleregion("mask", path=paths["mask"])
+    return model
+# End def
+
+def bench_scale(scale: str, directory: str, tile_size: int, workers: int, seed: int) -> dict:
+    """Time every stage of the model on the synthetic layers of a scale.
+
+    Args:
+        scale (str): one of SCALES.
+        directory (str): folder of the layers and outputs.
+        tile_size (int): side of the tile in pixels.
+        workers (int): number of processes.
+        seed (int): seed of the layers.
+
+    Returns:
+        dict: sizes and wall seconds of each stage.
+    """
+    timings = {}
+    with stage(timings, 'generate'):
+        paths = generate(directory, scale, seed)
+    # End with
+
+    # Layers and metadata
+    cold()
+    with stage(timings, 'layer_raster'):
+        SMCDALayer(paths["raster"])
+    # End with
+    cold()
+    with stage(timings, 'layer_vector'):
+        SMCDALayer(paths["points"], "value")
+    # End with
+    cold()
+    with stage(timings, 'get_raster_macrogeom'):
+        utils.get_raster_macrogeom(paths["raster"])
+    # End with
+    with stage(timings, 'get_raster_proj'):
+        utils.get_raster_proj(paths["raster"])
+    # End with
+    cold()
+    with stage(timings, 'get_vector_data'):
+        utils.get_vector_data(paths["points"])
+    # End with
+    with stage(timings, 'get_vector_macrogeom'):
+        utils.get_vector_macrogeom(paths["points"])
+    # End with
+
+    # Model from scratch (no cache)
+    output_dir = os.path.join(directory, f"{scale}_{seed}", 'output')
+    shutil.rmtree(output_dir, ignore_errors=True)
+    os.makedirs(output_dir)
+    model = build_model(paths, output_dir, f"bench_{scale}")
+    grid = model._build_grid(PIXEL_SIZE)
+    spec = model._build_spec(grid)
+    with stage(timings, 'plan'):
+        engine.build_stack(spec)
+    # End with
+
+    # Stages over the points, alone
+    points = spec["criterias"][1]["layers"][0]
+    rasterized = os.path.join(output_dir, 'rasterized.tif')
+    with stage(timings, 'rasterize'):
+        engine.rasterize_layer(points, grid, rasterized, tile_size)
+    # End with
+    with stage(timings, 'proximity'):
+        stage_spec = {"grid": grid, "source": rasterized, "dist": points["proximity"]["dist"]}
+        engine.write_tiles(engine.proximity_tile, stage_spec, os.path.join(output_dir, 'proximity.tif'), tile_size, workers)
+    # End with
+
+    # Stages of the engine
+    with stage(timings, 'prepare_layers'):
+        engine.prepare_layers(spec, tile_size, workers)
+    # End with
+    with stage(timings, 'occupancy'):
+        engine.build_occupancy(spec, tile_size, workers)
+    # End with
+    with stage(timings, 'statistics'):
+        engine.compute_stats(spec, tile_size, workers)
+    # End with
+    with stage(timings, 'normalize'):
+        engine.ensure_stack(spec, tile_size, workers)
+    # End with
+    with stage(timings, 'combine'):
+        engine.run(spec, os.path.join(output_dir, 'combine.tif'), tile_size, workers)
+    # End with
+
+    # End to end: from scratch and only changing the weights
+    shutil.rmtree(output_dir)
+    os.makedirs(output_dir)
+    cold()
+    with stage(timings, 'run_analysis'):
+        model.run_analysis(PIXEL_SIZE, tile_size, workers)
+    # End with
+    model.update_criteria("access", importance=3)
+    with stage(timings, 'run_analysis_weights'):
+        model.run_analysis(PIXEL_SIZE, tile_size, workers)
+    # End with
+
+    return {
+        "cells": SCALES[scale]["cells"],
+        "features": SCALES[scale]["features"],
+        "seconds": timings
+        }
+# End def
+
+def version() -> str:
+    """Commit of the working copy (None outside of git)."""
+    try:
+        return subprocess.run(
+            ['git', 'rev-parse', 'HEAD'], capture_output=True, text=True, check=True,
+            cwd=os.path.dirname(os.path.abspath(__file__))
+            ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+    # End try
+# End def
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description='Benchmarks of SpatialMCDA over synthetic layers.')
+    parser.add_argument('--scales', nargs='+', default=['1k'], choices=list(SCALES))
+    parser.add_argument('--directory', default='bench_data', help='folder of the synthetic layers and outputs')
+    parser.add_argument('--output', default='bench_output.json', help='JSON with the results')
+    parser.add_argument('--tile-size', type=int, default=512)
+    parser.add_argument('--workers', type=int, default=1)
+    parser.add_argument('--seed', type=int, default=0)
+    args = parser.parse_args()
+
+    results = {
+        "version": version(),
+        "time": time.strftime('%Y-%m-%dT%H:%M:%S'),
+        "platform": platform.platform(),
+        "python": platform.python_version(),
+        "gdal": gdal.__version__,
+        "numpy": np.__version__,
+        "tile_size": args.tile_size,
+        "workers": args.workers,
+        "scales": {}
+        }
+    for scale in args.scales:
+        results["scales"][scale] = bench_scale(scale, args.directory, args.tile_size, args.workers, args.seed)
+        print(scale, json.dumps(results["scales"][scale]["seconds"]))
+    # End for
+    with open(args.output, 'w') as file:
+        json.dump(results, file, indent=2)
+    # End with
+# End def
+
+if __name__ == '__main__':
+    main()
+# End if
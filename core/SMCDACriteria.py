@@ -13,7 +13,6 @@
 # from typing import Optional, Tuple, Union, overload
 from typing import Annotated, overload, Union
 from annotated_types import Ge
-from osgeo import gdal, ogr, osr
 from core.utils import *
 from core.messages import *
 from core.SMCDALayer import SMCDALayer
@@ -163,7 +162,7 @@ class SMCDACriteria:
             * `weight` (float, optional): Peso de la capa en el criterio. A diferencia del criterio, en este nivel no es difícil asignar pesos a las capas, ya que las características que representan son más homogéneas. No es obligatorio asignarlo en el momento de la creación, se puede incorporar y/o modificar luego de forma individual (con el método update_layer) o de forma conjunta (con el método asign_weights2layers). Si es obligatorio asignarle pesos a todas las capas antes de ejecutar su computo. No se exige que los pesos sumen `1`, esto se forzará al tipificar el resultado del criterio.
         """
         ...
-    def add_layer(self, alias: str = None, layer: SMCDALayer = None, path: str = None, FieldName: str = None, positive: bool = True, na: int = 0, weight: float = None) -> None:
+    def add_layer(self, alias: str = None, layer: SMCDALayer = None, path: str = None, FieldName: str = None, positive: bool = True, na: int = 0, weight: float = None, **kwargs) -> None:
 
         # Create key in layers dict
         self.layers[alias] = {}
@@ -175,7 +174,7 @@ class SMCDACriteria:
             
         else:
             # Create and add the SMCDALayer object
-            self.layers[alias]["object"] =  SMCDALayer(path, FieldName, positive, na)
+            self.layers[alias]["object"] =  SMCDALayer(path, FieldName, positive, na, **kwargs)
         # End if
         
         # Add the weight
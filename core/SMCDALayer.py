@@ -20,12 +20,16 @@ from core.messages import *
 # Layer class
 # ------------------------------------------------------- #
 
+# Attributes read from the file (deferred in lazy layers)
+LAZY_ATTRIBUTES = ["metadata", "ProjectionName", "geomdata", "sublayersinfo", "fields", "field"]
+
 class SMCDALayer:
     """
     ### Objetivo
     Organizar los insumos con la información georreferenciada. 
-    Por ahora solo admite las extensiones .shp y .tif (añadiré
-    otras si se requieren en el proyecto). La idea es tener 
+    Por ahora admite las extensiones .tif (ráster) y .shp, 
+    .gpkg y .fgb (vectores; añadiré otras si se requieren en 
+    el proyecto). La idea es tener 
     un control de que los atributos se encuentran bien 
     especificados y tener una los datos básicos para consultar 
     al añadirlos en el objeto del modelo.
@@ -39,7 +43,7 @@ class SMCDALayer:
 
         ## Parámetros:
             * `path` (str): En este parámetro se debe indicar la
-            ruta completa al archivo ".shp" o ".tif (incluido 
+            ruta completa al archivo ".tif", ".shp", ".gpkg" o ".fgb" (incluido 
             el nombre del archivo). Ejemplo: "C:/Descargas/prueba.tif". 
             * `FieldName` (str, optional): Este parámetro se utilizará únicamente en el caso de que la capa sea un archivo ".shp". Los elementos dentro de una capa vectorial tienen lo que se denominan "campos", los cuales reflejan características de estos objetos (es decir, variables). Esta función permite utilizar uno de estos campos. En caso de que no se utilice ningún campo, se utilizará el mismo valor para todos los objetos de la capa. Defaults to None.
             * `positive` (bool, optional): Indicar si la escala
@@ -70,30 +74,10 @@ class SMCDALayer:
         if(type(na) != int): raise RuntimeError(NEUTRAL_ERROR)
 
 
-        # Compatible files extensions for now: .tif, .shp
+        # Compatible files extensions: .tif, .shp, .gpkg, .fgb
         self.extension = get_file_extension(path)
-        # Add attributes if it has a compatible extension
-        if self.extension == 'tif':
-            #
-            self.driver = 'GTiff'
-            # Raster data
-            self.ProjectionName = get_raster_proj(path)
-            self.geomdata = get_raster_macrogeom(path)
-        elif self.extension == 'shp':
-            #
-            self.driver = 'ESRI Shapefile'
-            self.ProjectionName = get_vector_proj(path)
-            self.geomdata = get_vector_macrogeom(path)
-            self.sublayersinfo, self.fields = get_vector_data(path)
-            # FieldName
-            if FieldName is None: 
-                self.field = False
-            elif(FieldName in self.fields): self.field
-            else: raise RuntimeError(FIELD_ERROR)
-            # End if
-        else:
-            raise RuntimeError(EXTENSION_ERROR)
-        # End if
+        if self.extension in LAYER_DRIVERS: self.driver = LAYER_DRIVERS[self.extension]
+        else: raise RuntimeError(EXTENSION_ERROR)
 
         # na has to be 0 or 1
         if(na not in [0, 1]): raise RuntimeError(NEUTRAL_ERROR)
@@ -105,16 +89,34 @@ class SMCDALayer:
         self.file_name = os.path.basename(path)
         self.positive = positive
         self.na = na
-        self.buffer = { "compute": False, "dist": 0}
+        self.buffer = { "compute": False, "dist": 0, "method": 'auto'}
         self.proximity = {"compute": False, "dist": 0}
 
         
         # =========================== #
         # Next upgrades: more attributes?
         '''
-        Allowed kwargs options: for now, none.
+        Allowed kwargs options:
+            * `lazy` (bool): No lee el archivo al crear la capa.
+            La información de la capa (y la validación del 
+            `FieldName`) se obtiene al usarla por primera vez, 
+            al llamar a `load` o al validar el modelo. 
+            Defaults to `False`.
+            * `resampling` (str): Método con el que se alinea 
+            una capa ráster a la grilla del modelo (por ejemplo 
+            "near", "bilinear" o "average"). Defaults to "near".
+            * `clip` (tuple): Percentiles (por ejemplo `(2, 98)`) 
+            que se usan como mínimo y máximo al tipificar la capa, 
+            para que los valores extremos no compriman la escala. 
+            Defaults to None (mínimo y máximo de la capa).
+            * `sublayer` (str): Nombre de la subcapa de un vector 
+            con varias (por ejemplo una tabla de un GeoPackage). 
+            La capa se lee sólo de esa subcapa: su sistema de 
+            referencia, extensión, campos y objetos. Defaults to 
+            None (la primera subcapa con geometrías, así se omiten
+            tablas como `layer_styles` de QGIS).
         '''
-        allowed_args = []
+        allowed_args = ["lazy", "resampling", "clip", "sublayer"]
 
         #
         for element in kwargs.keys():
@@ -124,6 +126,63 @@ class SMCDALayer:
                 KWARGS_WARNING(element)
             # End if
         # End for
+
+        self.lazy = kwargs.get("lazy", False)
+        if(type(self.lazy) != bool): raise RuntimeError(BOOL_ERROR('lazy'))
+        self.resampling = kwargs.get("resampling", 'near')
+        if(self.resampling not in RESAMPLING_METHODS): raise RuntimeError(RESAMPLING_ERROR)
+        self.update_clip(kwargs.get("clip", None))
+        self.sublayer = kwargs.get("sublayer", None)
+        if((self.sublayer is not None) and (type(self.sublayer) != str)): raise RuntimeError(STR_ERROR('sublayer'))
+
+        # Layer data (read now or at first use)
+        self._FieldName = FieldName
+        self.loaded = False
+        if(not self.lazy): self.load()
+    # End def
+
+    # Start method
+    def load(self) -> None:
+        """
+        ## Descripción
+        Lee la información de la capa (con una sola apertura del 
+        archivo) y valida el `FieldName`. Las capas creadas con 
+        `lazy=True` lo ejecutan en su primer uso.
+        """
+        path = self.path
+        # Add attributes if it has a compatible extension
+        if self.extension == 'tif':
+            # Raster data (a single open of the file)
+            self.metadata = probe_layer(path)
+            self.ProjectionName = self.metadata.projection_name
+            self.geomdata = get_raster_macrogeom(path)
+            self.field = False
+        else:
+            # Vector data (a single open of the file), from its sublayer
+            self.metadata = probe_layer(path, self.sublayer)
+            self.ProjectionName = self.metadata.projection_name
+            self.geomdata = self.metadata.extent
+            self.sublayersinfo, self.fields = get_vector_data(path, self.sublayer)
+            # FieldName
+            if self._FieldName is None: 
+                self.field = False
+            elif(self._FieldName in self.fields): self.field = self._FieldName
+            else: raise RuntimeError(FIELD_ERROR)
+            # End if
+        # End if
+        self.loaded = True
+        return
+    # End def
+
+    # Start method
+    def __getattr__(self, name: str):
+        # Only called when the attribute doesn't exist: the data of
+        # a lazy layer is read at the first access.
+        if((name in LAZY_ATTRIBUTES) and (self.__dict__.get("loaded") is False)):
+            self.load()
+            return getattr(self, name)
+        # End if
+        raise AttributeError(name)
     # End def
 
     # Start method
@@ -134,7 +193,7 @@ class SMCDALayer:
 
         ## Parámetros:
             * `path` (str): En este parámetro se debe indicar la
-            ruta completa al archivo ".shp" o ".tif (incluido 
+            ruta completa al archivo ".tif", ".shp", ".gpkg" o ".fgb" (incluido 
             el nombre del archivo). Ejemplo: "C:/Descargas/prueba.tif". 
         """
         
@@ -142,27 +201,21 @@ class SMCDALayer:
         # path
         if(type(path) != str): raise RuntimeError(STR_ERROR('path'))
 
-        # Compatible files extensions for now: .tif, .shp
+        # Compatible files extensions: .tif, .shp, .gpkg, .fgb
         extension = get_file_extension(path)
-        # Add attributes if it has a compatible extension
-        if extension == 'tif':
-            #
-            self.driver = 'GTiff'
-            # Raster data
-            self.ProjectionName = get_raster_proj(path)
-            self.geomdata = get_raster_macrogeom(path)
-        elif extension == 'shp':
-            #
-            self.driver = 'ESRI Shapefile'
-            self.ProjectionName = get_vector_proj(path)
-            self.geomdata = get_vector_macrogeom(path)
-        else:
-            raise RuntimeError(EXTENSION_ERROR)
-        # End if
+        if extension in LAYER_DRIVERS: self.driver = LAYER_DRIVERS[extension]
+        else: raise RuntimeError(EXTENSION_ERROR)
 
+        # Keep the field (it is validated with the new file)
+        if(self.loaded): self._FieldName = self.field if self.field else None
         self.path = path
         self.file_name = os.path.basename(path)
-        self.extension = get_file_extension(path)
+        self.extension = extension
+
+        # Drop the data of the previous file
+        for name in LAZY_ATTRIBUTES: self.__dict__.pop(name, None)
+        self.loaded = False
+        if(not self.lazy): self.load()
 
         return
     # End def
@@ -211,6 +264,30 @@ class SMCDALayer:
         return
     # End def
 
+    # Start method
+    def update_clip(self, clip: Union[tuple, None]) -> None:
+        """
+        ## Descripción
+        Permite modificar el parámetro `clip` de una instancia.
+
+        ## Parámetros:
+            * `clip` (tuple | None): Percentiles (entre `0` y `100`)
+            que se usan como mínimo y máximo al tipificar la capa, 
+            por ejemplo `(2, 98)`. Los valores por fuera se truncan.
+            Con `None` se usan el mínimo y el máximo de la capa.
+        """
+        if(clip is None):
+            self.clip = None
+            return
+        # End if
+        if((type(clip) not in [tuple, list]) or (len(clip) != 2)): raise RuntimeError(CLIP_ERROR)
+        if(any(type(x) not in [int, float] for x in clip)): raise RuntimeError(CLIP_ERROR)
+        if(not (0 <= clip[0] < clip[1] <= 100)): raise RuntimeError(CLIP_ERROR)
+
+        self.clip = tuple(clip)
+        return
+    # End def
+
     # Start method
     def update_field(self, FieldName: Union[str, None]) -> None:
         """
@@ -231,23 +308,22 @@ class SMCDALayer:
             ingresar `None` en el parámetro.
         """
 
-        path = self.path
-        extension = self.extension
-        # Check if extension is .shp
-
         # Types
         if((type(FieldName).__name__ in ["str", "NoneType"])): pass
         else: raise RuntimeError(STR_ERROR('LayerName'))
+        # A lazy layer validates it when it is loaded
+        self._FieldName = FieldName
+        if(not self.loaded): return
         # check if is in list
-        if(FieldName is None): self.field
-        elif(FieldName in self.fields): self.field
+        if(FieldName is None): self.field = False
+        elif(FieldName in self.fields): self.field = FieldName
         else: raise RuntimeError(FIELD_ERROR)
         
         return
     # End def
     
     # Start method
-    def calc_buffer(self, compute: bool = False, dist: Annotated[float, Gt(0)] = 1):
+    def calc_buffer(self, compute: bool = False, dist: Annotated[float, Gt(0)] = 1, method: str = 'auto'):
         """
         ## Descripción
         Declara que se debe computar un buffer sobre la capa. Esto solo se puede realizar para capas vectoriales. Una mejora sería extenderlo para capas ráster (el proyecto no lo requiere). También conocido como zona de influencia. Se crea un nuevo objeto con el conjunto de puntos que se encuentran a una distancia menor a `dist`.
@@ -255,14 +331,24 @@ class SMCDALayer:
         ## Parámetros:
             * `compute` (bool):  Si se requiere aplicar el buffer a la capa. En caso de querer cancelar el requerimiento de aplicar el buffer, fijar este parámetro en False. Defaults to False.
             * `dist` (float, Greater than 0): Distancia en la que se considera que se encuentra en el radio de influencia del objeto (en la unidad de medida del sistema de coordenadas de la capa). Defaults to 1.
+            * `method` (str): Forma de computar el buffer. `"raster"` lo calcula sobre la grilla del modelo (distancia a los píxeles con objetos), su costo depende del tamaño de la grilla y no de la cantidad de objetos. `"vector"` aplica el buffer a cada geometría (exacto, solo para capas chicas). `"auto"` usa `"vector"` si la capa tiene pocos objetos. Defaults to `"auto"`.
+
+        El buffer es dicotómico (`1` dentro de la zona de influencia y `0` fuera de ella), no utiliza el `FieldName`. Si también se declaró la proximidad, se utiliza la proximidad.
         """
 
 
         # Upgrade: Check with the extent of the layers (crs unit
         #  of the model or the layer)
 
+        # Only for vectors
+        if(self.extension == 'tif'): raise RuntimeError(VECTOR_ERROR)
+        if(type(compute) != bool): raise RuntimeError(BOOL_ERROR('compute'))
+        if((type(dist) not in [int, float]) or (dist <= 0)): raise RuntimeError(DIST_ERROR)
+        if(method not in ['auto', 'raster', 'vector']): raise RuntimeError(BUFFER_ERROR)
+
         self.buffer["compute"] = compute
         self.buffer["dist"] = dist
+        self.buffer["method"] = method
         return
     # End def
     
@@ -280,8 +366,60 @@ class SMCDALayer:
         # Upgrade: Check with the extent of the layers (crs unit
         #  of the model or the layer)
 
-        self.buffer["compute"] = compute
-        self.buffer["dist"] = dist
+        # Only for vectors
+        if(self.extension == 'tif'): raise RuntimeError(VECTOR_ERROR)
+        if(type(compute) != bool): raise RuntimeError(BOOL_ERROR('compute'))
+        if((type(dist) not in [int, float]) or (dist <= 0)): raise RuntimeError(DIST_ERROR)
+
+        self.proximity["compute"] = compute
+        self.proximity["dist"] = dist
         return
     # End def
+
+    # Start method
+    def spec(self) -> dict:
+        """
+        ## Descripción
+        Devuelve la información que necesita el motor de cómputo 
+        para leer la capa. Es un diccionario simple (picklable) 
+        para poder enviarlo a otros procesos.
+        """
+        return {
+            "path": self.path,
+            "kind": 'raster' if self.extension == 'tif' else 'vector',
+            "wkt": self.metadata.srs_wkt,
+            "resampling": self.resampling,
+            "field": self.field,
+            "sublayer": self.metadata.sublayer,
+            "features": self.metadata.feature_count,
+            "extent": self.metadata.extent,
+            "clip": self.clip,
+            "positive": self.positive,
+            "na": self.na,
+            "buffer": dict(self.buffer),
+            "proximity": dict(self.proximity)
+            }
+    # End def
+
+    # Start method
+    def to_dict(self) -> dict:
+        """
+        ## Descripción
+        Devuelve la configuración de la capa que define su 
+        resultado (archivo, subcapa, campo, escala, imputación, 
+        remuestreo, recorte y buffer/proximidad) como un 
+        diccionario serializable en JSON.
+        """
+        return {
+            "path": os.path.abspath(self.path),
+            "FieldName": self.field if self.field else None,
+            "sublayer": self.metadata.sublayer,
+            "positive": self.positive,
+            "na": self.na,
+            "resampling": self.resampling,
+            "clip": None if self.clip is None else list(self.clip),
+            "buffer": dict(self.buffer),
+            "proximity": dict(self.proximity)
+            }
+    # End def
 # End class
\ No newline at end of file
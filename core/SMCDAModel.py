@@ -11,16 +11,21 @@
 # Packages and utils
 # ------------------------------------------------------- #
 
-from typing import Annotated, overload
+from typing import Annotated, Callable, overload
 from annotated_types import Ge
 
 import os
-from pyproj import CRS
-from osgeo import gdal, ogr, osr
+import json
 from core.SMCDACriteria import SMCDACriteria, check_importance
 from core.SMCDALayer import SMCDALayer
 from core.utils import *
 from core.messages import *
+from core.profiling import Profiler, ProfileReport, profile
+from core.cache import CACHE_DIR, CACHE_SIZE, file_fingerprint, find_result, make_key, save_result
+
+# The engine (and numpy) are loaded when a model is run
+engine = LazyModule('core.engine')
+zonal = LazyModule('core.zonal')
 
 
 # ======================================================= #
@@ -36,8 +41,9 @@ class SMCDAModel:
     de una forma amigable sin caer en fallos de especificación.
 
     ### Aspectos técnicos
-    Por ahora solo admite las extensiones .shp y .tif (añadiré
-    otras si se requieren en el proyecto). Utiliza los paquetes
+    Por ahora admite las extensiones .tif (ráster) y .shp, 
+    .gpkg y .fgb (vectores; añadiré otras si se requieren en 
+    el proyecto). Utiliza los paquetes
     gdal y ogr para manipular a las capas (permite extender a
     otras extensiones).
     """
@@ -54,7 +60,7 @@ class SMCDAModel:
         Crea una instancia de la clase `SMCDAModel`. La utilidad de 
         esta clase es la de organizar la información del modelo y 
         los elementos que se deben utilizar. Por ahora solo soporta
-        capas con extensiones `.shp` y `.tif`.
+        capas con extensiones `.tif`, `.shp`, `.gpkg` y `.fgb`.
 
         ## Parámetros:
             * `alias` (str, optional): Nombre con el que el 
@@ -102,7 +108,7 @@ class SMCDAModel:
         if(os.path.exists(output_dir)): pass
         else: raise RuntimeError(DIR_ERROR)
         # crs
-        CRS(epsg)
+        check_epsg(epsg)
         
         # =========================== #
         # Add attributes
@@ -179,7 +185,7 @@ class SMCDAModel:
         if((epsg is None) | (type(epsg) is int)): pass
         else: raise RuntimeError(INT_ERROR('epsg'))
         ### Valid parameters
-        CRS(epsg)
+        check_epsg(epsg)
         
         # =========================== #
         # Update Attribute
@@ -281,24 +287,173 @@ class SMCDAModel:
     # End def
 
     # Start method
-    @overload
-    def add_layer2criteria(self, ):
+    def add_layer2criteria(self, criteria_alias: str, alias: str, layer: SMCDALayer = None, path: str = None, FieldName: str = None, positive: bool = True, na: int = 0, weight: float = None, **kwargs) -> None:
         """
         ## Descripción
+        Agrega una capa a un criterio del modelo. Se puede pasar 
+        un objeto `SMCDALayer` ya creado o los parámetros para 
+        crearlo.
 
         ## Parámetros:
-            * `current_criteria_alias` (str): Alias actual del criterio 
-            que se quiere modificar.
-            * `new_criteria_alias` (str): Nuevo alias del criterio. 
-            * `importance` (str): Importancia del criterio. 
+            * `criteria_alias` (str): Alias del criterio al que 
+            se agrega la capa.
+            * `alias` (str): Nombre con el que el programa se va 
+            a referir a la capa.
+            * `layer` (SMCDALayer, optional): Capa ya creada. 
+            Defaults to None.
+            * `path`, `FieldName`, `positive`, `na`: Parámetros 
+            para crear la capa (ver `SMCDALayer`).
+            * `weight` (float, optional): Peso de la capa en el 
+            criterio. Defaults to None.
+            * `kwargs`: Opciones de `SMCDALayer` (por ejemplo 
+            `lazy=True`).
         """
+        if(criteria_alias not in self.criterias): raise RuntimeError(CRITERIA_ERROR)
+        self.criterias[criteria_alias].add_layer(alias, layer, path, FieldName, positive, na, weight, **kwargs)
         return
     # End def
 
-    def add_layer2feasibleregion(self, ):
+    # Start method
+    def add_layer2feasibleregion(self, alias: str, layer: SMCDALayer = None, path: str = None, FieldName: str = None, na: int = 0, **kwargs) -> None:
+        """
+        ## Descripción
+        Agrega una capa a la región factible. Estas capas 
+        multiplican a todo el indicador, por lo que se recomienda
+        que sean dicotómicas (valores `0` y `1`).
+
+        ## Parámetros:
+            * `alias` (str): Nombre con el que el programa se va 
+            a referir a la capa.
+            * `layer` (SMCDALayer, optional): Capa ya creada. 
+            Defaults to None.
+            * `path`, `FieldName`, `na`: Parámetros para crear 
+            la capa (ver `SMCDALayer`).
+            * `kwargs`: Opciones de `SMCDALayer` (por ejemplo 
+            `lazy=True`).
+        """
+        ### If exists the alias
+        if(alias in self.feasible_region): raise RuntimeError(ALIAS2_ERROR)
+
+        self.feasible_region[alias] = {}
+        if(layer is not None):
+            if(type(layer) == SMCDALayer): self.feasible_region[alias]["object"] = layer
+            else: raise RuntimeError(LAYER_ERROR)
+        else:
+            self.feasible_region[alias]["object"] = SMCDALayer(path, FieldName, True, na, **kwargs)
+        # End if
         return
     # End def
 
+    # Start method
+    def add_layers(self, criteria_alias: str, specs: list, workers: int = PROBE_WORKERS) -> None:
+        """
+        ## Descripción
+        Agrega varias capas a un criterio de una sola vez. Los 
+        metadatos de todos los archivos se leen en paralelo (en 
+        hilos, GDAL libera el GIL mientras lee), y luego se 
+        validan los campos y el sistema de referencia de cada 
+        capa. Si hay errores se informan todos juntos y no se 
+        agrega ninguna capa.
+
+        ## Parámetros:
+            * `criteria_alias` (str): Alias del criterio al que 
+            se agregan las capas.
+            * `specs` (list): Un diccionario por capa con la 
+            clave `alias` y los parámetros de `add_layer2criteria`
+            (`layer` o `path`, `FieldName`, `positive`, `na`, 
+            `weight` y las opciones de `SMCDALayer`).
+            * `workers` (int, optional): Cantidad de hilos que 
+            leen los metadatos. Defaults to `PROBE_WORKERS`.
+        """
+        # =========================== #
+        # Checks
+        if(criteria_alias not in self.criterias): raise RuntimeError(CRITERIA_ERROR)
+        if(type(specs) != list): raise RuntimeError(LIST_ERROR('specs'))
+        if((type(workers) != int) or (workers < 1)): raise RuntimeError(PINT_ERROR('workers'))
+        criteria = self.criterias[criteria_alias]
+
+        # =========================== #
+        # Layers (the files are read below, all at once)
+        errors, layers = [], {}
+        for idx, spec in enumerate(specs):
+            spec = dict(spec) if type(spec) is dict else {}
+            alias = spec.pop("alias", None)
+            name = f"{criteria_alias}/{alias if type(alias) is str else idx}"
+            try:
+                if(type(alias) is not str): raise RuntimeError(STR_ERROR('alias'))
+                if(not alias.replace('_', '').isalnum()): raise RuntimeError(ALIAS_ERROR)
+                if((alias in criteria.layers) or (alias in layers)): raise RuntimeError(ALIAS2_ERROR)
+                weight = spec.pop("weight", None)
+                layer = spec.pop("layer", None)
+                if(layer is None):
+                    lazy = spec.pop("lazy", False)
+                    layer = SMCDALayer(lazy = True, **spec)
+                    layer.lazy = lazy
+                elif(type(layer) != SMCDALayer): raise RuntimeError(LAYER_ERROR)
+                # End if
+                layers[alias] = (layer, weight)
+            except Exception as error:
+                errors.append(f"{name}: {error}")
+            # End try
+        # End for
+
+        # Metadata of every file, concurrently
+        probe_layers([x.path for x, _ in layers.values() if not x.loaded], workers)
+        for alias, (layer, _) in layers.items():
+            try:
+                if(not layer.loaded): layer.load()
+                if(layer.ProjectionName is None): raise RuntimeError(CRS_ERROR)
+            except Exception as error:
+                errors.append(f"{criteria_alias}/{alias}: {error}")
+            # End try
+        # End for
+        if(errors): raise RuntimeError(VALIDATION_ERROR(errors))
+
+        # =========================== #
+        # Add the layers
+        for alias, (layer, weight) in layers.items():
+            criteria.add_layer(alias, layer, weight = weight)
+        # End for
+        return
+    # End def
+
+    # Start method
+    def add_directory(self, criteria_alias: str, directory: str, pattern: str = '*', weight: float = None, 
+        workers: int = PROBE_WORKERS, **kwargs) -> list:
+        """
+        ## Descripción
+        Agrega a un criterio todas las capas (.tif, .shp, .gpkg y .fgb) de 
+        una carpeta cuyo nombre coincide con un patrón (ver 
+        `add_layers`). El alias de cada capa es el nombre del 
+        archivo sin la extensión.
+
+        ## Parámetros:
+            * `criteria_alias` (str): Alias del criterio al que 
+            se agregan las capas.
+            * `directory` (str): Carpeta con las capas.
+            * `pattern` (str, optional): Patrón de los nombres 
+            (por ejemplo "censo_*"). Defaults to `'*'`.
+            * `weight` (float, optional): Peso de cada capa. 
+            Defaults to None.
+            * `workers` (int, optional): Cantidad de hilos que 
+            leen los metadatos. Defaults to `PROBE_WORKERS`.
+            * `kwargs`: Parámetros comunes a todas las capas 
+            (`FieldName`, `positive`, `na` y las opciones de 
+            `SMCDALayer`).
+
+        ## Retorna:
+            * `list`: Alias de las capas agregadas.
+        """
+        if(type(directory) != str): raise RuntimeError(STR_ERROR('directory'))
+        if(type(pattern) != str): raise RuntimeError(STR_ERROR('pattern'))
+        paths = find_layers(directory, pattern) if os.path.isdir(directory) else []
+        if(not paths): raise RuntimeError(DIRECTORY_ERROR)
+
+        specs = [dict(kwargs, alias = file_alias(x), path = x, weight = weight) for x in paths]
+        self.add_layers(criteria_alias, specs, workers)
+        return [x["alias"] for x in specs]
+    # End def
+
     def delete_layer(self):
         return
     # End def
@@ -319,21 +474,625 @@ class SMCDAModel:
         return
     # End def
 
-    def run_analysis():
-        """            
-        * `pixel_size` (float, optional): El resultado 
-        de la ejecución es una capa ráster con píxeles
-        cuadrados. Es recomendable especificar el tamaño 
-        del píxel, ya que permitirá controla el trade-off
-        entre detalle y tiempo de cómputo, también es 
-        recomendable tener clara la unidad de medida del 
-        sistema de coordenadas, por las dudas se agrega un
-        tope superior de max(X / 10^6, Y/ 10^6). Defaults 
-        to min(X / 5000, Y / 5000)
+    # Start method
+    def validate(self) -> None:
+        """
+        ## Descripción
+        Valida todo el modelo en una sola pasada: lee las capas 
+        que todavía no se leyeron (capas `lazy`), valida sus 
+        campos y revisa que los criterios tengan importancia y 
+        las capas pesos. Informa todos los errores juntos.
         """
+        errors = []
+        # Layers
+        layers = [(f"feasible_region/{k}", v["object"]) for k, v in self.feasible_region.items()]
+        for criteria in self.criterias.values():
+            layers.extend([(f"{criteria.alias}/{k}", v["object"]) for k, v in criteria.layers.items()])
+        # End for
+        for name, layer in layers:
+            try:
+                if(not layer.loaded): layer.load()
+            except Exception as error:
+                errors.append(f"{name}: {error}")
+            # End try
+        # End for
+        # Importances and weights
+        for criteria in self.criterias.values():
+            if(not criteria.layers): continue
+            if(criteria.importance is None): errors.append(f"{criteria.alias}: {IMPORTANCE_ERROR}")
+            for k, v in criteria.layers.items():
+                if(v["weight"] is None): errors.append(f"{criteria.alias}/{k}: {WEIGHT_ERROR}")
+            # End for
+        # End for
+
+        if(errors): raise RuntimeError(VALIDATION_ERROR(errors))
         return
     # End def
 
+    # Start method
+    def run_analysis(self, pixel_size: float = None, tile_size: int = 512, workers: int = 1, cache_size: int = CACHE_SIZE,
+                     compress: str = 'DEFLATE', dtype: str = 'float32', cog: bool = False, reuse: bool = True) -> str:
+        """
+        ## Descripción
+        Ejecuta el modelo. Las capas se leen, tipifican, combinan
+        y escriben por ventanas (tiles) de una grilla común, por
+        lo que la memoria utilizada depende del tamaño del tile
+        y no de la extensión del modelo. El resultado se guarda
+        en `output_dir` con el nombre `<alias>.tif`.
+
+        ## Parámetros:
+            * `pixel_size` (float, optional): El resultado 
+            de la ejecución es una capa ráster con píxeles
+            cuadrados. Es recomendable especificar el tamaño 
+            del píxel, ya que permitirá controla el trade-off
+            entre detalle y tiempo de cómputo, también es 
+            recomendable tener clara la unidad de medida del 
+            sistema de coordenadas, por las dudas se agrega un
+            tope superior de max(X / 10^6, Y/ 10^6). Defaults 
+            to min(X / 5000, Y / 5000)
+            * `tile_size` (int, optional): Lado (en píxeles) de 
+            las ventanas que se procesan. Tiene que ser múltiplo 
+            de 16. Defaults to 512.
+            * `workers` (int, optional): Cantidad de procesos que
+            evalúan los tiles en paralelo (cada proceso abre sus 
+            propios archivos). Los resultados se escriben en orden. 
+            Defaults to 1.
+            * `cache_size` (int, optional): Tamaño máximo (en bytes)
+            de cada caché que se guarda en `output_dir/.smcda_cache`
+            (por ejemplo, las capas vectoriales rasterizadas). Al 
+            superarlo se eliminan los archivos usados hace más 
+            tiempo. Defaults to 10 GB.
+            * `compress` (str, optional): Compresión del resultado
+            ("NONE", "DEFLATE", "LZW" o "ZSTD"), se comprime en 
+            paralelo y con el predictor acorde al tipo de dato. Las
+            overviews internas se arman mientras se escriben los 
+            tiles, por lo que el resultado se puede ver sin pasos 
+            extra (gdaladdo). Defaults to "DEFLATE".
+            * `dtype` (str, optional): Tipo de dato del resultado, 
+            "float32" o "uint16" (el indicador en [0, 1] escalado a 
+            [0, 65535], la escala queda en los metadatos de la banda).
+            Defaults to "float32".
+            * `cog` (bool, optional): Reordena el archivo como un 
+            Cloud Optimized GeoTIFF estricto (reutiliza las overviews,
+            pero copia los bloques). Defaults to False.
+            * `reuse` (bool, optional): Si el resultado en 
+            `output_dir` se calculó con un modelo idéntico (ver
+            `fingerprint`) y con las mismas opciones, y no se 
+            modificó, se devuelve sin calcular nada. El modelo 
+            queda registrado en `<alias>_model.json`. Defaults 
+            to True.
+
+        ## Retorna:
+            * `str`: Ruta del ráster resultante.
+        """
+        # =========================== #
+        # Checks
+        if((self.alias is None) | (self.output_dir is None)): raise RuntimeError(RUN_ERROR)
+        if((type(tile_size) is not int) or (tile_size <= 0) or (tile_size % 16 != 0)): raise RuntimeError(TILE_ERROR)
+        if((type(workers) is not int) or (workers < 1)): raise RuntimeError(PINT_ERROR('workers'))
+        if((type(cache_size) is not int) or (cache_size < 1)): raise RuntimeError(PINT_ERROR('cache_size'))
+        if(compress not in engine.RESULT_COMPRESSIONS): raise RuntimeError(COMPRESS_ERROR)
+        if(dtype not in engine.RESULT_DTYPES): raise RuntimeError(DTYPE_ERROR)
+        if(type(cog) is not bool): raise RuntimeError(BOOL_ERROR('cog'))
+        if(type(reuse) is not bool): raise RuntimeError(BOOL_ERROR('reuse'))
+        self.validate()
+
+        # =========================== #
+        # Previous result of the same model
+        grid = self._build_grid(pixel_size)
+        output = os.path.join(self.output_dir, f"{self.alias}.tif")
+        record = os.path.join(self.output_dir, f"{self.alias}_model.json")
+        model = self._model_dict(grid)
+        options = {"tile_size": tile_size, "compress": compress, "dtype": dtype, "cog": cog}
+        key = make_key(model = model, options = options)
+        if(reuse and find_result(record, key, output) is not None): return output
+
+        # =========================== #
+        # Execute
+        spec = self._build_spec(grid, cache_size)
+        engine.run(spec, output, tile_size, workers, compress, dtype, cog)
+        save_result(record, key, output, model)
+        return output
+    # End def
+
+    # Start method
+    def run_preview(self, pixel_size: float = None, factor: int = 8, margin: float = 0.1, tile_size: int = 512, 
+                    workers: int = 1, cache_size: int = CACHE_SIZE, compress: str = 'DEFLATE', dtype: str = 'float32', 
+                    cog: bool = False) -> dict:
+        """
+        ## Descripción
+        Ejecuta el modelo de lo grueso a lo fino. Primero lo 
+        ejecuta con píxeles `factor` veces más grandes (los 
+        rásters se leen de sus overviews), lo que da una vista 
+        previa rápida en `<alias>_preview.tif`. Luego calcula con
+        el `pixel_size` completo sólo los tiles cuya vista previa
+        está a menos de `margin` del máximo del indicador; el 
+        resto de `<alias>_refined.tif` tiene los valores de la 
+        vista previa. Las capas se tipifican con los rangos de la
+        vista previa, por lo que los valores refinados pueden 
+        diferir levemente de los de `run_analysis`.
+
+        ## Parámetros:
+            * `pixel_size` (float, optional): Tamaño del píxel del
+            resultado refinado (ver `run_analysis`).
+            * `factor` (int, optional): Cuántas veces más grande es
+            el píxel de la vista previa. Defaults to 8.
+            * `margin` (float, optional): Distancia al máximo del 
+            indicador (entre 0 y 1) de las zonas que se refinan. 
+            Defaults to 0.1.
+            * `tile_size`, `workers`, `cache_size`, `compress`,
+            `dtype`, `cog`: Ver `run_analysis`.
+
+        ## Retorna:
+            * `dict`: Rutas de la vista previa (`preview`) y del 
+            resultado refinado (`refined`), cantidad de tiles 
+            refinados (`tiles`) y total (`total`).
+        """
+        # =========================== #
+        # Checks
+        if((self.alias is None) | (self.output_dir is None)): raise RuntimeError(RUN_ERROR)
+        if((type(factor) is not int) or (factor < 2)): raise RuntimeError(FACTOR_ERROR)
+        if((type(margin) not in [int, float]) or not (0 < margin < 1)): raise RuntimeError(FRACTION_ERROR('margin'))
+        if((type(tile_size) is not int) or (tile_size <= 0) or (tile_size % 16 != 0)): raise RuntimeError(TILE_ERROR)
+        if((type(workers) is not int) or (workers < 1)): raise RuntimeError(PINT_ERROR('workers'))
+        if((type(cache_size) is not int) or (cache_size < 1)): raise RuntimeError(PINT_ERROR('cache_size'))
+        if(compress not in engine.RESULT_COMPRESSIONS): raise RuntimeError(COMPRESS_ERROR)
+        if(dtype not in engine.RESULT_DTYPES): raise RuntimeError(DTYPE_ERROR)
+        if(type(cog) is not bool): raise RuntimeError(BOOL_ERROR('cog'))
+        self.validate()
+
+        # =========================== #
+        # Execute
+        grid = self._build_grid(pixel_size)
+        # Same origin, pixels `factor` times larger
+        coarse = engine.Grid(grid.x_min, grid.y_max, grid.px_size * factor, 
+            -(-grid.cols // factor), -(-grid.rows // factor), grid.wkt)
+        preview = os.path.join(self.output_dir, f"{self.alias}_preview.tif")
+        output = os.path.join(self.output_dir, f"{self.alias}_refined.tif")
+        return engine.run_refined(
+            self._build_spec(grid, cache_size), self._build_spec(coarse, cache_size), 
+            preview, output, tile_size, workers, margin, compress, dtype, cog
+            )
+    # End def
+
+    # Start method
+    def profile_analysis(self, hook: Callable = None, **kwargs) -> ProfileReport:
+        """
+        ## Descripción
+        Ejecuta el modelo (ver `run_analysis`) midiendo cada etapa
+        (planificar, reproyectar, rasterizar, buffer/proximidad, 
+        estadísticas, tipificar, combinar y escribir) y cada capa:
+        tiempo real y de CPU (incluidos los procesos `workers`), 
+        bytes leídos y escritos, pico de memoria (RSS) del proceso
+        hasta esa etapa (es acumulado) y cuánto lo aumentó la etapa,
+        y uso de la caché de bloques de GDAL. El reporte se guarda en 
+        `output_dir` con el nombre `<alias>_profile.json`.
+
+        ## Parámetros:
+            * `hook` (Callable, optional): Función que recibe cada
+            registro (`StageRecord`) apenas termina su etapa, por
+            ejemplo para enviarlo a un sistema de monitoreo. Si 
+            falla, se emite una advertencia y la ejecución sigue.
+            Defaults to None.
+            * `**kwargs`: Parámetros de `run_analysis`. Por defecto
+            `reuse=False`, para medir la ejecución aunque el resultado
+            ya exista.
+
+        ## Retorna:
+            * `ProfileReport`: El reporte (ver core/profiling.py).
+        """
+        if((hook is not None) and not callable(hook)): raise RuntimeError(HOOK_ERROR)
+        kwargs.setdefault('reuse', False)
+        with Profiler(hook) as profiler:
+            with profile('run'):
+                output = self.run_analysis(**kwargs)
+            # End with
+        # End with
+        report = ProfileReport(profiler.records, output)
+        report.save(os.path.join(self.output_dir, f"{self.alias}_profile.json"))
+        return report
+    # End def
+
+    # Start method
+    def run_sensitivity(self, n_samples: int = 1000, perturbation: float = 0.2, top: float = 0.1, seed: int = None,
+                        pixel_size: float = None, tile_size: int = 512, workers: int = 1, cache_size: int = CACHE_SIZE) -> dict:
+        """
+        ## Descripción
+        Análisis de sensibilidad de Monte Carlo de las importancias
+        y los pesos. Cada `importance` y cada `weight` se multiplica
+        por un factor uniforme en [1 - perturbation, 1 + perturbation]
+        (y se vuelven a normalizar). Cada tile de las capas tipificadas
+        se lee una sola vez y se multiplica por la matriz con todos los
+        pesos; las estadísticas por píxel se acumulan en línea, por lo 
+        que la memoria no crece con la cantidad de muestras. Se guardan
+        en `output_dir` los rásters:
+            * `<alias>_mean.tif`: media del indicador.
+            * `<alias>_std.tif`: desvío estándar del indicador.
+            * `<alias>_stability.tif`: fracción de las muestras en las
+            que el píxel está entre el `top` de los mejores de la región
+            factible (0 fuera de ella).
+
+        ## Parámetros:
+            * `n_samples` (int, optional): Cantidad de vectores de pesos.
+            Defaults to 1000.
+            * `perturbation` (float, optional): Perturbación relativa 
+            de las importancias y los pesos, entre 0 y 1. Defaults to 0.2.
+            * `top` (float, optional): Fracción de los mejores píxeles
+            factibles de cada muestra, entre 0 y 1. Defaults to 0.1.
+            * `seed` (int, optional): Semilla de los números aleatorios.
+            Defaults to None.
+            * `pixel_size`, `tile_size`, `workers`, `cache_size`: Ver
+            `run_analysis`.
+
+        ## Retorna:
+            * `dict`: Rutas de los rásters ("mean", "std", "stability").
+        """
+        # =========================== #
+        # Checks
+        if((self.alias is None) | (self.output_dir is None)): raise RuntimeError(RUN_ERROR)
+        if((type(n_samples) is not int) or (n_samples < 1)): raise RuntimeError(PINT_ERROR('n_samples'))
+        if((type(perturbation) not in [int, float]) or not (0 < perturbation < 1)): raise RuntimeError(FRACTION_ERROR('perturbation'))
+        if((type(top) not in [int, float]) or not (0 < top < 1)): raise RuntimeError(FRACTION_ERROR('top'))
+        if((seed is not None) and (type(seed) is not int)): raise RuntimeError(INT_ERROR('seed'))
+        if((type(tile_size) is not int) or (tile_size <= 0) or (tile_size % 16 != 0)): raise RuntimeError(TILE_ERROR)
+        if((type(workers) is not int) or (workers < 1)): raise RuntimeError(PINT_ERROR('workers'))
+        if((type(cache_size) is not int) or (cache_size < 1)): raise RuntimeError(PINT_ERROR('cache_size'))
+        self.validate()
+
+        # =========================== #
+        # Execute
+        grid = self._build_grid(pixel_size)
+        spec = self._build_spec(grid, cache_size)
+        outputs = {x: os.path.join(self.output_dir, f"{self.alias}_{x}.tif") for x in ["mean", "std", "stability"]}
+        return engine.run_sensitivity(spec, outputs, tile_size, workers, n_samples, perturbation, top, seed)
+    # End def
+
+    # Start method
+    def query_point(self, x: float, y: float, pixel_size: float = None, tile_size: int = 512, 
+                    workers: int = 1, cache_size: int = CACHE_SIZE) -> dict:
+        """
+        ## Descripción
+        Consulta el valor del indicador y de cada capa tipificada
+        en un punto. Los valores se leen de la pila de capas
+        tipificadas que se guarda (mapeada en memoria) en 
+        `output_dir/.smcda_cache`, si no existe se calcula.
+
+        ## Parámetros:
+            * `x` (float): Coordenada x, en el sistema de referencia
+            del modelo.
+            * `y` (float): Coordenada y, en el sistema de referencia
+            del modelo.
+            * `pixel_size`, `tile_size`, `workers`, `cache_size`: Ver
+            `run_analysis`.
+
+        ## Retorna:
+            * `dict`: "indicator" y, para cada criterio, el valor 
+            tipificado de sus capas ({criteria: {layer: valor}}).
+            Los valores ya están multiplicados por la región factible.
+        """
+        # =========================== #
+        # Checks
+        if((self.alias is None) | (self.output_dir is None)): raise RuntimeError(RUN_ERROR)
+        if(type(x) not in [int, float]): raise RuntimeError(FLOAT_ERROR('x'))
+        if(type(y) not in [int, float]): raise RuntimeError(FLOAT_ERROR('y'))
+        if((type(tile_size) is not int) or (tile_size <= 0) or (tile_size % 16 != 0)): raise RuntimeError(TILE_ERROR)
+        if((type(workers) is not int) or (workers < 1)): raise RuntimeError(PINT_ERROR('workers'))
+        if((type(cache_size) is not int) or (cache_size < 1)): raise RuntimeError(PINT_ERROR('cache_size'))
+        self.validate()
+
+        # =========================== #
+        # Execute
+        grid = self._build_grid(pixel_size)
+        spec = self._build_spec(grid, cache_size)
+        engine.ensure_stack(spec, tile_size, workers)
+        return engine.query_point(spec, x, y)
+    # End def
+
+    # Start method
+    def top_sites(self, k: int, min_separation: float = 0, pixel_size: float = None, tile_size: int = 512, 
+                  workers: int = 1, cache_size: int = CACHE_SIZE) -> list:
+        """
+        ## Descripción
+        Busca las `k` mejores ubicaciones (celdas con mayor 
+        indicador) separadas al menos por `min_separation`, sin 
+        escribir ni guardar en memoria el ráster del resultado: 
+        los tiles se evalúan de a uno (desde el stack de capas 
+        tipificadas si ya existe) y sólo se conserva un heap 
+        acotado de candidatos. La selección es aproximada (greedy
+        sobre los candidatos de los tiles); si quedan menos de `k`
+        ubicaciones se repite la búsqueda de las faltantes, por lo
+        que sólo se devuelven menos de `k` si no hay más celdas
+        factibles a `min_separation` de las elegidas.
+
+        ## Parámetros:
+            * `k` (int): Cantidad de ubicaciones.
+            * `min_separation` (float, optional): Distancia mínima
+            entre ubicaciones (en la unidad del sistema de 
+            coordenadas del modelo). Defaults to 0.
+            * `pixel_size`, `tile_size`, `workers`, `cache_size`:
+            Ver `run_analysis`.
+
+        ## Retorna:
+            * `list`: Un diccionario por ubicación, de la mejor a 
+            la peor, con sus coordenadas (`x`, `y`, centro de la 
+            celda), `row`, `col`, el indicador (`score`) y el aporte
+            de cada criterio (`contributions`, suman el indicador).
+        """
+        # =========================== #
+        # Checks
+        if((self.alias is None) | (self.output_dir is None)): raise RuntimeError(RUN_ERROR)
+        if((type(k) is not int) or (k < 1)): raise RuntimeError(PINT_ERROR('k'))
+        if((type(min_separation) not in [int, float]) or (min_separation < 0)): raise RuntimeError(SEPARATION_ERROR)
+        if((type(tile_size) is not int) or (tile_size <= 0) or (tile_size % 16 != 0)): raise RuntimeError(TILE_ERROR)
+        if((type(workers) is not int) or (workers < 1)): raise RuntimeError(PINT_ERROR('workers'))
+        if((type(cache_size) is not int) or (cache_size < 1)): raise RuntimeError(PINT_ERROR('cache_size'))
+        self.validate()
+
+        # =========================== #
+        # Execute
+        grid = self._build_grid(pixel_size)
+        spec = self._build_spec(grid, cache_size)
+        return engine.top_sites(spec, k, min_separation, tile_size, workers)
+    # End def
+
+    # Start method
+    def zonal_statistics(self, zones: str, output: str = None, percentiles: tuple = (50, 90), pixel_size: float = None, 
+                         tile_size: int = 512, workers: int = 1, cache_size: int = CACHE_SIZE, sublayer: str = None) -> str:
+        """
+        ## Descripción
+        Resume el indicador en cada zona de una capa de polígonos
+        (por ejemplo radios censales o departamentos): superficie, 
+        proporción factible (indicador > 0), media, máximo y 
+        percentiles del indicador en las celdas factibles. Usa el 
+        resultado de `run_analysis` (que no se recalcula si el 
+        modelo no cambió); las zonas se rasterizan una sola vez 
+        sobre la misma grilla y se agregan tile por tile, por lo 
+        que decenas de miles de zonas no cuestan más que una.
+
+        ## Parámetros:
+            * `zones` (str): Ruta de la capa de zonas (.shp, .gpkg
+            o .fgb).
+            * `output` (str, optional): Ruta del resultado: una 
+            tabla ".csv" con los atributos de las zonas o una copia
+            de los polígonos (".shp", ".gpkg" o ".fgb") con las 
+            estadísticas como campos. Defaults to 
+            `<output_dir>/<alias>_zones.csv`.
+            * `percentiles` (tuple, optional): Percentiles del 
+            indicador (calculados con un histograma de 
+            `ZONE_BINS` clases). Defaults to (50, 90).
+            * `pixel_size`, `tile_size`, `workers`, `cache_size`:
+            Ver `run_analysis`.
+            * `sublayer` (str, optional): Subcapa de las zonas. 
+            Defaults to None (la primera con geometrías).
+
+        ## Retorna:
+            * `str`: Ruta del resultado.
+        """
+        # =========================== #
+        # Checks
+        if((self.alias is None) | (self.output_dir is None)): raise RuntimeError(RUN_ERROR)
+        if(type(zones) != str): raise RuntimeError(STR_ERROR('zones'))
+        if(get_file_extension(zones) not in LAYER_DRIVERS or get_file_extension(zones) == 'tif'): raise RuntimeError(EXTENSION_ERROR)
+        if(output is None): output = os.path.join(self.output_dir, f"{self.alias}_zones.csv")
+        if(type(output) != str): raise RuntimeError(STR_ERROR('output'))
+        if(get_file_extension(output) not in ['csv', 'shp', 'gpkg', 'fgb']): raise RuntimeError(ZONES_OUTPUT_ERROR)
+        if((sublayer is not None) and (type(sublayer) != str)): raise RuntimeError(STR_ERROR('sublayer'))
+        sublayer = probe_layer(zones, sublayer).sublayer
+        if((type(percentiles) not in [tuple, list]) or any((type(x) not in [int, float]) or not (0 <= x <= 100) for x in percentiles)):
+            raise RuntimeError(PERCENTILES_ERROR)
+        # End if
+
+        # =========================== #
+        # Execute
+        result = self.run_analysis(pixel_size, tile_size, workers, cache_size)
+        grid = self._build_grid(pixel_size)
+        cache = os.path.join(self.output_dir, CACHE_DIR)
+        stats = zonal.zonal_statistics(result, zones, grid, cache, cache_size, tile_size, workers, tuple(percentiles), sublayer)
+        return zonal.write_zones(zones, stats, output, sublayer)
+    # End def
+
+    # Start method
+    def print_plan(self, pixel_size: float = None) -> 'engine.Plan':
+        """
+        ## Descripción
+        Imprime el plan de ejecución del modelo sin ejecutarlo: el
+        grafo de operaciones (leer, reproyectar, rasterizar, buffer
+        o proximidad, tipificar, transformar y combinar) con el 
+        volumen de I/O estimado de cada una. Las operaciones idénticas
+        (por ejemplo, la misma capa en varios criterios o en la región
+        factible) son un único nodo y se calculan una sola vez. 
+        No escribe ningún archivo.
+
+        ## Parámetros:
+            * `pixel_size` (float, optional): Ver `run_analysis`.
+
+        ## Retorna:
+            * `Plan`: El plan (ver core/planner.py).
+        """
+        if(self.output_dir is None): raise RuntimeError(RUN_ERROR)
+        self.validate()
+        grid = self._build_grid(pixel_size)
+        # Without side effects: no spatial index is created
+        plan = engine.build_stack(self._build_spec(grid, index=False))
+        print(plan)
+        return plan
+    # End def
+
+    # Start method
+    def to_dict(self, pixel_size: float = None) -> dict:
+        """
+        ## Descripción
+        Forma canónica del modelo: sistema de referencia, tamaño 
+        del píxel, región factible, criterios con su importancia
+        y capas con su configuración (campo, peso, `positive`, 
+        `na`, buffer/proximidad, etc.) y la huella (sha256) del 
+        contenido de cada archivo. Dos modelos con la misma forma
+        canónica producen el mismo resultado.
+
+        ## Parámetros:
+            * `pixel_size` (float, optional): Ver `run_analysis`.
+
+        ## Retorna:
+            * `dict`: El modelo serializable en JSON.
+        """
+        self.validate()
+        return self._model_dict(self._build_grid(pixel_size))
+    # End def
+
+    # Start method
+    def to_json(self, pixel_size: float = None) -> str:
+        """
+        ## Descripción
+        Forma canónica del modelo (ver `to_dict`) en JSON, con las
+        claves ordenadas.
+        """
+        return json.dumps(self.to_dict(pixel_size), indent=2, sort_keys=True)
+    # End def
+
+    # Start method
+    def fingerprint(self, pixel_size: float = None) -> str:
+        """
+        ## Descripción
+        Huella del modelo: sha256 de su forma canónica (ver 
+        `to_dict`). Cambia si cambia cualquier parámetro que 
+        afecte al resultado o el contenido de algún archivo.
+        """
+        return make_key(model = self.to_dict(pixel_size))
+    # End def
+
+    # Start method
+    def _model_dict(self, grid: 'engine.Grid') -> dict:
+        """
+        ## Descripción
+        Arma la forma canónica del modelo (ver `to_dict`) para 
+        una grilla. Las huellas de los archivos se memorizan en 
+        `output_dir/.smcda_cache`, por lo que los archivos que no
+        cambiaron no se vuelven a leer.
+        """
+        cache = None if self.output_dir is None else os.path.join(self.output_dir, CACHE_DIR)
+        def layer_dict(layer: SMCDALayer, **items) -> dict:
+            return dict(layer.to_dict(), fingerprint = file_fingerprint(layer.path, cache), **items)
+        # End def
+        return {
+            "epsg": self.epsg,
+            "pixel_size": grid.px_size,
+            "feasible_region": {k: layer_dict(v["object"]) for k, v in self.feasible_region.items()},
+            "criterias": {
+                c.alias: {
+                    "importance": c.importance,
+                    "layers": {k: layer_dict(v["object"], weight = v["weight"]) for k, v in c.layers.items()}
+                    }
+                for c in self.criterias.values() if c.layers
+                }
+            }
+    # End def
+
+    # Start method
+    def _build_grid(self, pixel_size: float = None) -> 'engine.Grid':
+        """
+        ## Descripción
+        Arma la grilla común del resultado: el sistema de coordenadas
+        del modelo (o el de la primera capa si no se declaró), la
+        extensión y el tamaño del píxel. La extensión es la unión 
+        de las extensiones de las capas de la región factible (ver
+        el README), las capas de los criterios sólo se leen en esa
+        zona y fuera de ellas se imputa `na`. Si el modelo no tiene 
+        región factible, es la unión de todas las capas. Se calcula
+        con los metadatos ya leídos de las capas.
+        """
+        feasible = [x["object"] for x in self.feasible_region.values()]
+        layers = list(feasible)
+        for criteria in self.criterias.values():
+            layers.extend([x["object"] for x in criteria.layers.values()])
+        # End for
+        if(not layers): raise RuntimeError(EMPTY_ERROR)
+
+        # Reference system
+        if(self.epsg is None): wkt = layers[0].metadata.srs_wkt
+        else: wkt = get_epsg_wkt(self.epsg)
+
+        # Union of the extents (in the reference system of the model)
+        extents = [transform_extent(x.metadata.extent, x.metadata.srs_wkt, wkt) for x in (feasible or layers)]
+        extent = (
+            min(x[0] for x in extents), min(x[1] for x in extents),
+            max(x[2] for x in extents), max(x[3] for x in extents)
+            )
+
+        # Pixel size
+        X = extent[2] - extent[0]
+        Y = extent[3] - extent[1]
+        if(pixel_size is None): pixel_size = min(X / 5000, Y / 5000)
+        if(pixel_size < max(X / 10**6, Y / 10**6)): raise RuntimeError(PIXEL_ERROR)
+
+        return engine.build_grid(extent, pixel_size, wkt)
+    # End def
+
+    # Start method
+    def _build_spec(self, grid: 'engine.Grid', cache_size: int = CACHE_SIZE, index: bool = True) -> dict:
+        """
+        ## Descripción
+        Traduce el modelo a la especificación (picklable) que 
+        utiliza el motor de cómputo. Los pesos de los criterios 
+        y de las capas se normalizan para que sumen `1`.
+
+        ## Parámetros:
+            * `grid` (Grid): Grilla del resultado.
+            * `cache_size` (int, optional): Ver `run_analysis`.
+            * `index` (bool, optional): Crear el índice espacial 
+            (.qix) de los shapefiles que no lo tienen. Con `False`
+            no se escribe ningún archivo (por ejemplo, para mostrar
+            el plan). Defaults to True.
+        """
+        # Feasible region
+        feasible = []
+        for alias, x in self.feasible_region.items():
+            layer = x["object"].spec()
+            layer["alias"] = alias
+            feasible.append(layer)
+        # End for
+
+        # Criterias (only the ones with layers)
+        criterias = [c for c in self.criterias.values() if c.layers]
+        if(not criterias): raise RuntimeError(EMPTY_ERROR)
+        if(any(c.importance is None for c in criterias)): raise RuntimeError(IMPORTANCE_ERROR)
+        importance = sum(c.importance for c in criterias)
+
+        specs = []
+        for criteria in criterias:
+            weights = [x["weight"] for x in criteria.layers.values()]
+            if(any(w is None for w in weights)): raise RuntimeError(WEIGHT_ERROR)
+            layers = []
+            for alias, x in criteria.layers.items():
+                layer = x["object"].spec()
+                layer["alias"] = alias
+                layer["weight"] = x["weight"] / sum(weights)
+                layers.append(layer)
+            # End for
+            specs.append({
+                "alias": criteria.alias,
+                "weight": criteria.importance / importance,
+                "layers": layers
+                })
+        # End for
+
+        # Features of the vectors inside the grid (e.g. to choose the
+        # buffer method of a layer that covers much more than the model)
+        for layer in feasible + [x for c in specs for x in c["layers"]]:
+            if((layer["kind"] != 'vector') or (not layer["wkt"])): continue
+            if(index): ensure_spatial_index(layer["path"])
+            extent = transform_extent(grid.extent, grid.wkt, layer["wkt"])
+            layer["features"] = count_features(layer["path"], extent, layer["sublayer"])
+        # End for
+
+        return {
+            "grid": grid,
+            "feasible": feasible,
+            "criterias": specs,
+            "cache": os.path.join(self.output_dir, CACHE_DIR),
+            "cache_size": cache_size
+            }
+    # End def
+
     # Start method
     def __str__(self):
         text  = "\n# ==================================== #"
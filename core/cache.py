@@ -0,0 +1,227 @@
+# ======================================================= #
+'''
+@ProjectName: SpatialMCDA
+@Author: FernandoCastano
+@Email: castano.fernando.martin@gmail.com
+@Version: 0.1.0
+'''
+# ------------------------------------------------------- #
+
+# ======================================================= #
+# Packages
+# ------------------------------------------------------- #
+import hashlib
+import json
+from core.utils import *
+
+# ======================================================= #
+# Main code
+# ------------------------------------------------------- #
+
+# Name of the cache folder inside the output_dir of the model
+CACHE_DIR = '.smcda_cache'
+
+# Default size of each cache (bytes)
+CACHE_SIZE = 10 * 1024**3
+
+# Content hashes already computed: "path|mtime|size" -> sha256
+_HASHES = {}
+
+# Keys of the hashes kept in each index (hashes.json) already loaded
+_INDEXES = {}
+
+def file_fingerprint(file_name: str, directory: str = None) -> str:
+    """Hash of the content of a layer (all of its files). It is
+    memoized by path, modification time and size, so an unchanged
+    file is only read once. If a directory is given, the memo is also
+    kept there (hashes.json, only with the files hashed for that
+    directory), so later runs don't read it again.
+
+    Args:
+        file_name (str): path_dir/name of the layer.
+        directory (str, optional): folder of the persistent memo.
+        Defaults to None.
+
+    Returns:
+        str: hexadecimal sha256 of the content.
+    """
+    index, entries = None, set()
+    if directory is not None:
+        index = os.path.join(directory, 'hashes.json')
+        if index not in _INDEXES:
+            _INDEXES[index] = set()
+            if os.path.exists(index):
+                with open(index) as file:
+                    stored = json.load(file)
+                # End with
+                _HASHES.update(stored)
+                _INDEXES[index].update(stored)
+            # End if
+        # End if
+        entries = _INDEXES[index]
+    # End if
+
+    digest = hashlib.sha256()
+    new = False
+    for part in layer_files(file_name):
+        stat = os.stat(part)
+        key = f"{os.path.abspath(part)}|{stat.st_mtime_ns}|{stat.st_size}"
+        if key not in _HASHES:
+            part_digest = hashlib.sha256()
+            with open(part, 'rb') as file:
+                for chunk in iter(lambda: file.read(1024**2), b''):
+                    part_digest.update(chunk)
+                # End for
+            # End with
+            _HASHES[key] = part_digest.hexdigest()
+        # End if
+        if (index is not None) and (key not in entries):
+            entries.add(key)
+            new = True
+        # End if
+        digest.update(_HASHES[key].encode())
+    # End for
+
+    if new:
+        os.makedirs(directory, exist_ok=True)
+        with open(index + '.tmp', 'w') as file:
+            json.dump({x: _HASHES[x] for x in sorted(entries)}, file)
+        # End with
+        os.replace(index + '.tmp', index)
+    # End if
+    return digest.hexdigest()
+# End def
+
+def make_key(**items) -> str:
+    """Build a cache key from json serializable items.
+
+    Returns:
+        str: hexadecimal sha256 of the items.
+    """
+    text = json.dumps(items, sort_keys=True, default=str)
+    return hashlib.sha256(text.encode()).hexdigest()
+# End def
+
+def find_result(record: str, key: str, output: str) -> str:
+    """Output of a previous run with the same key. The record (JSON
+    written by save_result) stores the key of the run and the version
+    of the output, so a result that was modified or overwritten by
+    another run is not reused.
+
+    Args:
+        record (str): path of the record.
+        key (str): key of the run.
+        output (str): path of the output.
+
+    Returns:
+        str: path of the output, or None if it can't be reused.
+    """
+    if not (os.path.exists(record) and os.path.exists(output)): return None
+    try:
+        with open(record) as file:
+            data = json.load(file)
+        # End with
+    except (OSError, ValueError):
+        return None
+    # End try
+    stat = os.stat(output)
+    if data.get("fingerprint") != key: return None
+    if data.get("output") != {"mtime_ns": stat.st_mtime_ns, "size": stat.st_size}: return None
+    return output
+# End def
+
+def save_result(record: str, key: str, output: str, model: dict) -> str:
+    """Write the record of a run: its key, the version of its output
+    and the model that produced it (see find_result).
+
+    Args:
+        record (str): path of the record.
+        key (str): key of the run.
+        output (str): path of the output.
+        model (dict): canonical form of the model.
+
+    Returns:
+        str: path of the record.
+    """
+    stat = os.stat(output)
+    data = {
+        "fingerprint": key,
+        "output": {"mtime_ns": stat.st_mtime_ns, "size": stat.st_size},
+        "model": model
+        }
+    with open(record + '.tmp', 'w') as file:
+        json.dump(data, file, indent=2, sort_keys=True)
+    # End with
+    os.replace(record + '.tmp', record)
+    return record
+# End def
+
+def disk_usage(path: str) -> int:
+    """Bytes of disk used by a file: the allocated blocks where the
+    system reports them (the sparse stacks and results only use the
+    tiles that were written), else its apparent size.
+    """
+    stat = os.stat(path)
+    blocks = getattr(stat, 'st_blocks', None)
+    return stat.st_size if blocks is None else blocks * 512
+# End def
+
+class FileCache:
+    """
+    Folder of files identified by a key, bounded in size. Every
+    hit refreshes the modification time of the file, so the least
+    recently used ones are evicted first.
+    """
+
+    def __init__(self, directory: str, extension: str, max_bytes: int = CACHE_SIZE) -> None:
+        self.directory = directory
+        self.extension = extension
+        self.max_bytes = max_bytes
+        os.makedirs(directory, exist_ok=True)
+    # End def
+
+    def path(self, key: str) -> str:
+        """Path of the entry of the key (it may not exist)."""
+        return os.path.join(self.directory, f"{key}.{self.extension}")
+    # End def
+
+    def get(self, key: str) -> str:
+        """Path of the entry of the key, or None if it is not cached."""
+        path = self.path(key)
+        if not os.path.exists(path): return None
+        os.utime(path)
+        return path
+    # End def
+
+    def temporary(self, key: str) -> str:
+        """Path where the entry has to be written before `commit`."""
+        return os.path.join(self.directory, f"{key}.tmp.{self.extension}")
+    # End def
+
+    def commit(self, key: str) -> str:
+        """Move a written temporary entry to its place (an interrupted
+        write never leaves a broken entry).
+        """
+        os.replace(self.temporary(key), self.path(key))
+        return self.path(key)
+    # End def
+
+    def evict(self, keep: set = frozenset()) -> None:
+        """Remove the least recently used entries until the disk used
+        by the folder (see disk_usage) fits in max_bytes. The keys in
+        `keep` are never removed.
+        """
+        entries = []
+        for name in os.listdir(self.directory):
+            path = os.path.join(self.directory, name)
+            entries.append((os.stat(path).st_mtime, disk_usage(path), name, path))
+        # End for
+        total = sum(x[1] for x in entries)
+        for mtime, size, name, path in sorted(entries):
+            if total <= self.max_bytes: break
+            if name.split('.')[0] in keep: continue
+            os.remove(path)
+            total -= size
+        # End for
+    # End def
+# End class
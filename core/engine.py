@@ -0,0 +1,1965 @@
+# ======================================================= #
+'''
+@ProjectName: SpatialMCDA
+@Author: FernandoCastano
+@Email: castano.fernando.martin@gmail.com
+@Version: 0.1.0
+'''
+# ------------------------------------------------------- #
+
+# ======================================================= #
+# Packages
+# ------------------------------------------------------- #
+import heapq
+import math
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+from typing import Iterator, NamedTuple
+import numpy as np
+from core.utils import *
+from core.messages import *
+from core.cache import FileCache, file_fingerprint, layer_files, make_key
+from core.planner import Plan, build_plan, buffer_method
+from core.profiling import Usage, active, profile, usage
+from core.stats import StreamingStats, load_stats, save_stats, stored_stats
+
+# ======================================================= #
+# Grid
+# ------------------------------------------------------- #
+
+class Grid(NamedTuple):
+    """Common output grid of the model. Every layer is read, already
+    aligned, into windows of this grid.
+    """
+    x_min: float
+    y_max: float
+    px_size: float
+    cols: int
+    rows: int
+    wkt: str
+
+    @property
+    def geotransform(self) -> tuple:
+        return (self.x_min, self.px_size, 0.0, self.y_max, 0.0, -self.px_size)
+    # End def
+
+    @property
+    def extent(self) -> tuple:
+        x_max = self.x_min + self.cols * self.px_size
+        y_min = self.y_max - self.rows * self.px_size
+        return self.x_min, y_min, x_max, self.y_max
+    # End def
+# End class
+
+def same_pixels(geotransform: tuple, grid: Grid, tolerance: float = 1e-6) -> bool:
+    """Whether the pixels of a raster are pixels of the grid: same
+    size, no rotation and an origin on the lines of the grid (so
+    aligning it only copies its values).
+
+    Args:
+        geotransform (tuple): geotransform of the raster.
+        grid (Grid): grid of the model.
+        tolerance (float, optional): relative tolerance, in pixels.
+        Defaults to 1e-6.
+
+    Returns:
+        bool: True if the raster lies on the grid.
+    """
+    x0, px_x, rot_x, y0, rot_y, px_y = geotransform
+    if (rot_x != 0) or (rot_y != 0): return False
+    if abs(px_x - grid.px_size) > tolerance * grid.px_size: return False
+    if abs(-px_y - grid.px_size) > tolerance * grid.px_size: return False
+    shift_x = (x0 - grid.x_min) / grid.px_size
+    shift_y = (grid.y_max - y0) / grid.px_size
+    return (abs(shift_x - round(shift_x)) <= tolerance) and (abs(shift_y - round(shift_y)) <= tolerance)
+# End def
+
+def build_grid(extent: tuple, px_size: float, wkt: str) -> Grid:
+    """Lay out a grid of square pixels that covers the extent.
+
+    Args:
+        extent (tuple): x_min, y_min, x_max, y_max in wkt units.
+        px_size (float): side of the pixel in wkt units.
+        wkt (str): WKT of the spatial reference system of the grid.
+
+    Returns:
+        Grid: the output grid.
+    """
+    x_min, y_min, x_max, y_max = extent
+    cols = max(1, math.ceil((x_max - x_min) / px_size))
+    rows = max(1, math.ceil((y_max - y_min) / px_size))
+    return Grid(x_min, y_max, px_size, cols, rows, wkt)
+# End def
+
+def iter_windows(grid: Grid, tile_size: int) -> Iterator[tuple]:
+    """Iterate over the tile windows of the grid, row by row.
+
+    Args:
+        grid (Grid): output grid.
+        tile_size (int): side of the tile in pixels.
+
+    Yields:
+        tuple: xoff, yoff, xsize, ysize (in pixels).
+    """
+    for yoff in range(0, grid.rows, tile_size):
+        ysize = min(tile_size, grid.rows - yoff)
+        for xoff in range(0, grid.cols, tile_size):
+            xsize = min(tile_size, grid.cols - xoff)
+            yield xoff, yoff, xsize, ysize
+        # End for
+    # End for
+# End def
+
+def window_bounds(grid: Grid, window: tuple) -> tuple:
+    """Get the extent covered by a window of the grid.
+
+    Args:
+        grid (Grid): output grid.
+        window (tuple): xoff, yoff, xsize, ysize.
+
+    Returns:
+        tuple: x_min, y_min, x_max, y_max.
+    """
+    xoff, yoff, xsize, ysize = window
+    x_min = grid.x_min + xoff * grid.px_size
+    y_max = grid.y_max - yoff * grid.px_size
+    return x_min, y_max - ysize * grid.px_size, x_min + xsize * grid.px_size, y_max
+# End def
+
+def extent_window(grid: Grid, extent: tuple, pad: int = 0) -> tuple:
+    """Get the window of the grid that covers an extent (expanded by
+    `pad` pixels and clipped to the grid).
+
+    Args:
+        grid (Grid): output grid.
+        extent (tuple): x_min, y_min, x_max, y_max in grid units.
+        pad (int, optional): pixels added on each side. Defaults to 0.
+
+    Returns:
+        tuple: xoff, yoff, xsize, ysize (sizes of 0 if the extent is
+        out of the grid).
+    """
+    x_min, y_min, x_max, y_max = extent
+    x0 = max(0, math.floor((x_min - grid.x_min) / grid.px_size) - pad)
+    y0 = max(0, math.floor((grid.y_max - y_max) / grid.px_size) - pad)
+    x1 = min(grid.cols, math.ceil((x_max - grid.x_min) / grid.px_size) + pad)
+    y1 = min(grid.rows, math.ceil((grid.y_max - y_min) / grid.px_size) + pad)
+    return x0, y0, max(0, x1 - x0), max(0, y1 - y0)
+# End def
+
+def intersect_windows(first: tuple, second: tuple) -> tuple:
+    """Intersection of two windows, or None if they don't overlap."""
+    x0, y0 = max(first[0], second[0]), max(first[1], second[1])
+    x1 = min(first[0] + first[2], second[0] + second[2])
+    y1 = min(first[1] + first[3], second[1] + second[3])
+    if (x1 <= x0) or (y1 <= y0): return None
+    return x0, y0, x1 - x0, y1 - y0
+# End def
+
+# ======================================================= #
+# Reading
+# ------------------------------------------------------- #
+
+# Datasets opened by this process (path -> version, handle). GDAL
+# handles are not shareable between processes, each one keeps its own.
+_DATASETS = {}
+
+def open_dataset(path: str):
+    """Open (once per process and version of the file) the dataset of
+    a layer. The version is the modification time and size of its
+    files, so a layer edited in place is opened again instead of read
+    through the stale handle.
+
+    Args:
+        path (str): path_dir/name of the layer.
+
+    Returns:
+        gdal.Dataset: the opened dataset (raster or vector).
+    """
+    version = tuple((x.st_mtime_ns, x.st_size) for x in map(os.stat, layer_files(path)))
+    cached = _DATASETS.get(path)
+    if (cached is None) or (cached[0] != version):
+        # The previous handle (if any) is closed when it is replaced
+        _DATASETS[path] = (version, gdal.OpenEx(path))
+    # End if
+    return _DATASETS[path][1]
+# End def
+
+def _mem_tile(grid: Grid, window: tuple, dtype: int = None):
+    """Create an in-memory raster that covers a window of the grid. By
+    default it is a float raster filled with NaN (no data).
+    """
+    x_min, y_min, x_max, y_max = window_bounds(grid, window)
+    dataset = gdal.GetDriverByName('MEM').Create('', window[2], window[3], 1, dtype or gdal.GDT_Float64)
+    dataset.SetGeoTransform((x_min, grid.px_size, 0.0, y_max, 0.0, -grid.px_size))
+    dataset.SetProjection(grid.wkt)
+    if dtype is None:
+        band = dataset.GetRasterBand(1)
+        band.SetNoDataValue(np.nan)
+        band.Fill(np.nan)
+    # End if
+    return dataset
+# End def
+
+def create_tiff(output: str, grid: Grid, tile_size: int):
+    """Create a tiled and compressed float32 GeoTIFF that covers the
+    grid, filled with NaN (no data). Used for the intermediate layers.
+    """
+    options = [
+        'TILED=YES', f'BLOCKXSIZE={tile_size}', f'BLOCKYSIZE={tile_size}',
+        'COMPRESS=DEFLATE', 'PREDICTOR=3', 'BIGTIFF=IF_SAFER'
+        ]
+    dataset = gdal.GetDriverByName('GTiff').Create(output, grid.cols, grid.rows, 1, gdal.GDT_Float32, options)
+    dataset.SetGeoTransform(grid.geotransform)
+    dataset.SetProjection(grid.wkt)
+    band = dataset.GetRasterBand(1)
+    band.SetNoDataValue(np.nan)
+    band.Fill(np.nan)
+    return dataset
+# End def
+
+def read_tile(layer: dict, grid: Grid, window: tuple) -> np.ndarray:
+    """Read a window of the grid from a layer already aligned to it
+    (see prepare_layers): a warped VRT of a raster, with the
+    resampling of the layer, or the rasterization of a vector.
+
+    Args:
+        layer (dict): layer specification with its "aligned" path.
+        grid (Grid): output grid.
+        window (tuple): xoff, yoff, xsize, ysize.
+
+    Returns:
+        np.ndarray: float64 values of the window, NaN where there is
+        no data.
+    """
+    band = open_dataset(layer["aligned"]).GetRasterBand(1)
+    if layer.get("coverage") is None: return band.ReadAsArray(*window).astype(np.float64)
+    # Only the part of the window covered by the layer is read
+    values = np.full((window[3], window[2]), np.nan)
+    part = intersect_windows(window, layer["coverage"])
+    if part is not None:
+        dx, dy = part[0] - window[0], part[1] - window[1]
+        values[dy:dy + part[3], dx:dx + part[2]] = band.ReadAsArray(*part)
+    # End if
+    return values
+# End def
+
+def burn_tile(source: str, field, grid: Grid, window: tuple, sublayer: str) -> np.ndarray:
+    """Burn the features of a sublayer of a vector onto a window of
+    the grid (the field value, or 1 when there is no field). A spatial
+    filter on the bounds of the window (which uses the spatial index
+    of the layer: .qix, GeoPackage or FlatGeobuf) makes OGR decode
+    only the features that intersect it.
+
+    Args:
+        source (str): path of the vector (in the reference system of
+        the grid, or a VRT that transforms it).
+        field (str | bool): field to burn, or False.
+        grid (Grid): output grid.
+        window (tuple): xoff, yoff, xsize, ysize.
+        sublayer (str): name of the sublayer (see utils.select_sublayer).
+
+    Returns:
+        np.ndarray: float64 values of the window, NaN where there are
+        no features.
+    """
+    dataset = _mem_tile(grid, window)
+    layer = open_dataset(source).GetLayerByName(sublayer)
+    options = [f'ATTRIBUTE={field}'] if field else []
+    burn = [] if field else [1]
+    layer.SetSpatialFilterRect(*window_bounds(grid, window))
+    gdal.RasterizeLayer(dataset, [1], layer, burn_values=burn, options=options)
+    layer.SetSpatialFilter(None)
+    return dataset.GetRasterBand(1).ReadAsArray()
+# End def
+
+def rasterize_tile(spec: dict, window: tuple) -> np.ndarray:
+    """Tile function of rasterize_layer (see burn_tile).
+
+    Args:
+        spec (dict): {"grid", "source", "field", "sublayer"} of the stage.
+        window (tuple): xoff, yoff, xsize, ysize.
+
+    Returns:
+        np.ndarray: float32 values of the window.
+    """
+    return burn_tile(spec["source"], spec["field"], spec["grid"], window, spec["sublayer"]).astype(np.float32)
+# End def
+
+def rasterize_layer(layer: dict, grid: Grid, output: str, tile_size: int, source: str = None, workers: int = 1,
+                    windows: list = None) -> str:
+    """Burn a vector layer onto the whole grid (the field value, or 1
+    when the layer has no field) and save it as a tiled GeoTIFF. It is
+    burned tile by tile, with a spatial filter on each tile, so only
+    the features inside the grid are decoded (a layer of the whole
+    country used in a model of a district reads only the district) and
+    the tiles without features cost an index lookup.
+
+    Args:
+        layer (dict): layer specification (see SMCDAModel).
+        grid (Grid): output grid.
+        output (str): path_dir/name of the GeoTIFF.
+        tile_size (int): side of the tile in pixels.
+        source (str, optional): dataset to read the features from (e.g.
+        the layer transformed to the grid). Defaults to the layer path.
+        workers (int, optional): number of processes. Defaults to 1.
+        windows (list, optional): windows to burn (see write_tiles).
+        Defaults to None (the whole grid).
+
+    Returns:
+        str: path of the output.
+    """
+    spec = {"grid": grid, "source": source or layer["path"], "field": layer["field"], "sublayer": layer["sublayer"]}
+    return write_tiles(rasterize_tile, spec, output, tile_size, workers, windows)
+# End def
+
+def halo_window(grid: Grid, window: tuple, halo: int) -> tuple:
+    """Expand a window by `halo` pixels on each side (clipped to the
+    grid).
+
+    Returns:
+        tuple: expanded window, (column, row) of the original window
+        inside the expanded one.
+    """
+    xoff, yoff, xsize, ysize = window
+    x0, y0 = max(0, xoff - halo), max(0, yoff - halo)
+    x1 = min(grid.cols, xoff + xsize + halo)
+    y1 = min(grid.rows, yoff + ysize + halo)
+    return (x0, y0, x1 - x0, y1 - y0), (xoff - x0, yoff - y0)
+# End def
+
+def distance_tile(source: str, grid: Grid, window: tuple, dist: float) -> np.ndarray:
+    """Distance from each pixel of the window to the nearest pixel
+    with data of an aligned raster (e.g. a rasterized vector), up to
+    `dist`. It uses GDAL ComputeProximity (linear in the number of
+    pixels) over the window expanded with a halo of `dist`, so the
+    features of the neighbour tiles are taken into account.
+
+    Args:
+        source (str): path of the raster aligned to the grid.
+        grid (Grid): output grid.
+        window (tuple): xoff, yoff, xsize, ysize.
+        dist (float): maximum distance (units of the grid).
+
+    Returns:
+        np.ndarray: distances (units of the grid), NaN beyond `dist`.
+    """
+    outer, (dx, dy) = halo_window(grid, window, math.ceil(dist / grid.px_size))
+    values = open_dataset(source).GetRasterBand(1).ReadAsArray(*outer)
+    # Pixels with features
+    target = _mem_tile(grid, outer, gdal.GDT_Byte)
+    target.GetRasterBand(1).WriteArray((~np.isnan(values)).astype(np.uint8))
+    # Distance to them
+    distance = _mem_tile(grid, outer, gdal.GDT_Float32)
+    options = ['VALUES=1', 'DISTUNITS=GEO', f'MAXDIST={dist}', 'NODATA=-1']
+    gdal.ComputeProximity(target.GetRasterBand(1), distance.GetRasterBand(1), options)
+    result = distance.GetRasterBand(1).ReadAsArray()[dy:dy + window[3], dx:dx + window[2]]
+    return np.where(result < 0, np.nan, result).astype(np.float64)
+# End def
+
+def proximity_tile(spec: dict, window: tuple) -> np.ndarray:
+    """Proximity of a window: the influence of the nearest feature,
+    1 over it and decreasing linearly to 0 at `dist` (0 beyond).
+
+    Args:
+        spec (dict): {"grid", "source", "dist"} of the stage.
+        window (tuple): xoff, yoff, xsize, ysize.
+
+    Returns:
+        np.ndarray: float32 proximity of the window.
+    """
+    distance = distance_tile(spec["source"], spec["grid"], window, spec["dist"])
+    return np.where(np.isnan(distance), 0.0, 1.0 - distance / spec["dist"]).astype(np.float32)
+# End def
+
+def buffer_tile(spec: dict, window: tuple) -> np.ndarray:
+    """Buffer of a window computed in raster space: 1 where the
+    distance to the nearest feature is at most `dist`, 0 elsewhere.
+    The cost depends on the pixels of the grid, not on the number of
+    features or vertices.
+
+    Args:
+        spec (dict): {"grid", "source", "dist"} of the stage.
+        window (tuple): xoff, yoff, xsize, ysize.
+
+    Returns:
+        np.ndarray: float32 buffer of the window.
+    """
+    distance = distance_tile(spec["source"], spec["grid"], window, spec["dist"])
+    return (~np.isnan(distance)).astype(np.float32)
+# End def
+
+def buffer_vector_tile(spec: dict, window: tuple) -> np.ndarray:
+    """Buffer of a window computed with the geometries (exact, for
+    small layers). The spatial filter (which uses the spatial index
+    of the layer when it has one) only returns the features closer
+    than `dist` to the window, and only those are buffered and burned.
+
+    Args:
+        spec (dict): {"grid", "source", "sublayer", "dist"} of the
+        stage, where source is the vector in the reference system of
+        the grid.
+        window (tuple): xoff, yoff, xsize, ysize.
+
+    Returns:
+        np.ndarray: float32 buffer of the window.
+    """
+    grid, dist = spec["grid"], spec["dist"]
+    x_min, y_min, x_max, y_max = window_bounds(grid, window)
+    # Buffered features near the window
+    memory = ogr.GetDriverByName('Memory').CreateDataSource('')
+    buffers = memory.CreateLayer('buffer', osr.SpatialReference(wkt=grid.wkt), ogr.wkbUnknown)
+    layer = open_dataset(spec["source"]).GetLayerByName(spec["sublayer"])
+    layer.SetSpatialFilterRect(x_min - dist, y_min - dist, x_max + dist, y_max + dist)
+    for feature in layer:
+        geometry = feature.GetGeometryRef()
+        if geometry is None: continue
+        buffer = ogr.Feature(buffers.GetLayerDefn())
+        buffer.SetGeometry(geometry.Buffer(dist))
+        buffers.CreateFeature(buffer)
+    # End for
+    layer.SetSpatialFilter(None)
+    # Burned onto the window (zeros elsewhere)
+    dataset = _mem_tile(grid, window, gdal.GDT_Float32)
+    gdal.RasterizeLayer(dataset, [1], buffers, burn_values=[1])
+    return dataset.GetRasterBand(1).ReadAsArray()
+# End def
+
+def write_tiles(function, spec: dict, output: str, tile_size: int, workers: int = 1, windows: list = None) -> str:
+    """Evaluate a tile function over the grid of the spec (or some of
+    its windows, the rest is left as no data) and save the result as
+    an intermediate GeoTIFF (see create_tiff).
+
+    Args:
+        function (callable): top level function (spec, window) -> array.
+        spec (dict): specification of the stage (with its "grid").
+        output (str): path_dir/name of the GeoTIFF.
+        tile_size (int): side of the tile in pixels.
+        workers (int, optional): number of processes. Defaults to 1.
+        windows (list, optional): windows to evaluate. Defaults to
+        None (every window of the grid).
+
+    Returns:
+        str: path of the output.
+    """
+    dataset = create_tiff(output, spec["grid"], tile_size)
+    band = dataset.GetRasterBand(1)
+    if windows is None: windows = list(iter_windows(spec["grid"], tile_size))
+    for window, values in zip(windows, map_tiles(function, spec, windows, workers)):
+        band.WriteArray(values, window[0], window[1])
+    # End for
+    dataset.FlushCache()
+    dataset = None
+    return output
+# End def
+
+def align_layer(layer: dict, grid: Grid, vrts: FileCache, cache: str = None) -> str:
+    """Get the VRT that aligns the layer to the grid (see
+    utils.reproject), reusing the ones cached in the output_dir.
+
+    Args:
+        layer (dict): layer specification (see SMCDAModel).
+        grid (Grid): output grid.
+        vrts (FileCache): cache of VRT definitions.
+        cache (str, optional): cache folder of the model (to keep the
+        hashes of the files). Defaults to None.
+
+    Returns:
+        str: path of the VRT.
+    """
+    key = make_key(
+        source = file_fingerprint(layer["path"], cache),
+        path = os.path.abspath(layer["path"]),
+        sublayer = layer["sublayer"],
+        resampling = layer["resampling"],
+        grid = [grid.x_min, grid.y_max, grid.px_size, grid.cols, grid.rows, grid.wkt]
+        )
+    path = vrts.get(key)
+    if path is None:
+        bounds, size = grid.extent, (grid.cols, grid.rows)
+        reproject(layer["path"], vrts.temporary(key), grid.wkt, bounds, size, layer["resampling"], layer["sublayer"])
+        path = vrts.commit(key)
+    # End if
+    return path
+# End def
+
+def layer_name(layer: dict) -> str:
+    """Name of a layer in the reports (its alias or its file)."""
+    return layer.get("alias") or os.path.basename(layer["path"])
+# End def
+
+# Pixels added around the window covered by a raster (the resampling
+# kernels and the reprojection can reach a bit beyond its extent)
+COVERAGE_PAD = 2
+
+def cover_windows(grid: Grid, windows: list, tile_size: int, halo: int = 0) -> list:
+    """Tiles of the grid that intersect some windows expanded by
+    `halo` pixels (see halo_window), in the order of iter_windows."""
+    tiles = set()
+    for window in windows:
+        (xoff, yoff, xsize, ysize), _ = halo_window(grid, window, halo)
+        for row in range(yoff // tile_size, (yoff + ysize - 1) // tile_size + 1):
+            for col in range(xoff // tile_size, (xoff + xsize - 1) // tile_size + 1):
+                tiles.add((col * tile_size, row * tile_size))
+            # End for
+        # End for
+    # End for
+    return [x for x in iter_windows(grid, tile_size) if x[:2] in tiles]
+# End def
+
+def prepare_layers(spec: dict, tile_size: int, workers: int = 1, windows: list = None) -> None:
+    """Align the layers of the model to the grid. Rasters are read
+    through a warped VRT. Vectors are burned onto the grid (through
+    a VRT that transforms them when they are in another reference
+    system), reusing the rasterizations cached in the output_dir. The
+    cache key is the content of the file, the field and the grid
+    (origin, pixel size, extent and reference system), so a rerun with
+    the same inputs skips the rasterization. Vectors with proximity
+    or buffer get that layer instead (also cached). Each layer gets
+    the path of its aligned raster in "aligned"; the layers that are
+    the same node of the plan (see build_stack) are aligned once.
+    Rasters also get the window of the grid they cover in "coverage",
+    so read_tile only reads that part of them (a national raster in
+    the model of a district reads the district). If only some windows
+    of the grid will be read, the vectors are only burned there (and
+    in the halo of their proximity or buffer), unless the whole grid
+    is already cached; those partial layers have their own keys.
+
+    Args:
+        spec (dict): model specification (see SMCDAModel).
+        tile_size (int): side of the tile in pixels.
+        workers (int, optional): number of processes for the tile
+        stages. Defaults to 1.
+        windows (list, optional): windows of the grid that will be
+        read. Defaults to None (the whole grid).
+    """
+    grid = spec["grid"]
+    layers = spec["feasible"] + [x for c in spec["criterias"] for x in c["layers"]]
+    vrts = FileCache(os.path.join(spec["cache"], 'vrt'), 'vrt', spec["cache_size"])
+    rasters = FileCache(os.path.join(spec["cache"], 'rasterized'), 'tif', spec["cache_size"])
+    used, done = set(), {}
+    for layer in layers:
+        with profile('align', layer_name(layer)):
+            # Window of the grid covered by a raster (the rest of the
+            # grid is never read from it)
+            if (layer["kind"] == 'raster') and layer["wkt"]:
+                extent = transform_extent(layer["extent"], layer["wkt"], grid.wkt)
+                layer["coverage"] = extent_window(grid, extent, COVERAGE_PAD)
+            # End if
+            # Same node of the plan: already aligned
+            if layer.get("aligned_key") in done:
+                layer["aligned"] = done[layer["aligned_key"]]
+                continue
+            # End if
+            # Rasters: aligned on the fly
+            if layer["kind"] == 'raster':
+                with profile('reproject', layer_name(layer)):
+                    layer["aligned"] = align_layer(layer, grid, vrts, spec["cache"])
+                # End with
+                used.add(os.path.basename(layer["aligned"]).split('.')[0])
+                done[layer.get("aligned_key")] = layer["aligned"]
+                continue
+            # End if
+            # Vectors: features in the reference system of the grid
+            # (read through their spatial index)
+            ensure_spatial_index(layer["path"])
+            source = layer["path"]
+            if not osr.SpatialReference(wkt=layer["wkt"]).IsSame(osr.SpatialReference(wkt=grid.wkt)):
+                with profile('reproject', layer_name(layer)):
+                    source = align_layer(layer, grid, vrts, spec["cache"])
+                # End with
+                used.add(os.path.basename(source).split('.')[0])
+            # End if
+            rasterized = make_key(
+                source = file_fingerprint(layer["path"], spec["cache"]),
+                sublayer = layer["sublayer"],
+                field = layer["field"],
+                grid = [grid.x_min, grid.y_max, grid.px_size, grid.cols, grid.rows, grid.wkt]
+                )
+            # Stage over the features (the proximity has priority over
+            # the buffer)
+            method = buffer_method(layer)
+            key, function, halo = rasterized, None, 0
+            if layer["proximity"]["compute"]:
+                dist = layer["proximity"]["dist"]
+                key = make_key(rasterized = rasterized, proximity = dist)
+                function, halo = proximity_tile, math.ceil(dist / grid.px_size)
+            elif method == 'raster':
+                dist = layer["buffer"]["dist"]
+                key = make_key(rasterized = rasterized, buffer = dist, method = method)
+                function, halo = buffer_tile, math.ceil(dist / grid.px_size)
+            elif method == 'vector':
+                dist = layer["buffer"]["dist"]
+                key = make_key(rasterized = rasterized, buffer = dist, method = method)
+                function = buffer_vector_tile
+            # End if
+            # Features burned onto the grid (not needed by the vector
+            # buffer). Only over some windows (and the halo their stage
+            # reads), unless the whole grid is already cached
+            if method != 'vector':
+                needed = None
+                if (windows is not None) and (rasters.get(rasterized) is None):
+                    needed = cover_windows(grid, windows, tile_size, halo)
+                    rasterized = make_key(rasterized = rasterized, windows = needed)
+                # End if
+                if rasters.get(rasterized) is None:
+                    with profile('rasterize', layer_name(layer)):
+                        rasterize_layer(layer, grid, rasters.temporary(rasterized), tile_size, source, workers, needed)
+                    # End with
+                    rasters.commit(rasterized)
+                # End if
+                used.add(rasterized)
+                if function is None: key = rasterized
+            # End if
+            if function is not None:
+                part = None
+                if (windows is not None) and (rasters.get(key) is None):
+                    part, key = windows, make_key(aligned = key, windows = windows)
+                # End if
+                if rasters.get(key) is None:
+                    if function is buffer_vector_tile:
+                        stage = {"grid": grid, "source": source, "sublayer": layer["sublayer"], "dist": dist}
+                    else:
+                        stage = {"grid": grid, "source": rasters.path(rasterized), "dist": dist}
+                    # End if
+                    with profile(function.__name__.split('_')[0], layer_name(layer)):
+                        write_tiles(function, stage, rasters.temporary(key), tile_size, workers, part)
+                    # End with
+                    rasters.commit(key)
+                # End if
+            # End if
+            used.add(key)
+            layer["aligned"] = rasters.path(key)
+            done[layer.get("aligned_key")] = layer["aligned"]
+        # End with
+    # End for
+    vrts.evict(keep=used)
+    rasters.evict(keep=used)
+# End def
+
+# ======================================================= #
+# Computation
+# ------------------------------------------------------- #
+
+def tile_stats(spec: dict, window: tuple) -> list:
+    """Statistics of the layers of a stage over the feasible cells of
+    a window (see tile_mask).
+
+    Args:
+        spec (dict): {"grid", "layers", "occupancy", "masks"} of the stage.
+        window (tuple): xoff, yoff, xsize, ysize.
+
+    Returns:
+        list: StreamingStats of each layer, in order.
+    """
+    mask = tile_mask(spec, window)
+    result = []
+    for layer in spec["layers"]:
+        stats = StreamingStats()
+        values = read_tile(layer, spec["grid"], window)
+        stats.update(values if mask is None else values[mask])
+        result.append(stats)
+    # End for
+    return result
+# End def
+
+def compute_stats(spec: dict, tile_size: int, workers: int = 1) -> None:
+    """Get the statistics of the criteria layers over the feasible
+    region, needed to normalize them: min, max, pixels without data
+    and a histogram (for the percentile clipping). For each aligned
+    layer they come from, in order: the ones saved by a previous run
+    (for the same feasible region), the exact statistics stored by
+    GDAL in the raster (when the grid covers the whole raster in its
+    own reference system, with the same pixels (see same_pixels), so
+    the `near` resampling only copies its values, and every window of
+    the grid is feasible), or a single
+    streaming pass shared by all the layers that need it. The pass
+    skips the windows without feasible cells and masks the partial
+    ones (see build_occupancy, which has to be built first). The
+    results are saved in the cache folder. Each layer gets its range
+    in "stats".
+
+    Args:
+        spec (dict): model specification with the "occupancy".
+        tile_size (int): side of the tile in pixels.
+        workers (int, optional): number of processes. Defaults to 1.
+    """
+    grid = spec["grid"]
+    folder = os.path.join(spec["cache"], 'stats')
+    os.makedirs(folder, exist_ok=True)
+    # Feasible region of the statistics (None: the whole grid)
+    region = None
+    if any(x != FULL for x in spec["occupancy"].values()):
+        region = make_key(
+            grid = [grid.x_min, grid.y_max, grid.px_size, grid.cols, grid.rows, grid.wkt],
+            feasible = [x["aligned_key"] for x in spec["feasible"]],
+            na = [x["na"] for x in spec["feasible"]]
+            )
+    # End if
+    # Aligned layers (the same data is used by several layers)
+    unique = {}
+    for criteria in spec["criterias"]:
+        for layer in criteria["layers"]:
+            unique.setdefault(layer["aligned"], []).append(layer)
+        # End for
+    # End for
+
+    found, pending = {}, []
+    for aligned, layers in unique.items():
+        layer = layers[0]
+        name = os.path.basename(aligned).split('.')[0]
+        if region is not None: name = make_key(aligned = name, region = region)
+        path = os.path.join(folder, name + '.json')
+        with profile('stored_stats', layer_name(layer)):
+            stats = load_stats(path)
+            if (stats is None) and (region is None) and (layer["kind"] == 'raster') and (layer["resampling"] == 'near'):
+                same_srs = osr.SpatialReference(wkt=layer["wkt"]).IsSame(osr.SpatialReference(wkt=grid.wkt))
+                x_min, y_min, x_max, y_max = layer["extent"]
+                g_min, g_max = grid.extent[:2], grid.extent[2:]
+                inside = (x_min >= g_min[0]) and (y_min >= g_min[1]) and (x_max <= g_max[0]) and (y_max <= g_max[1])
+                if same_srs and inside and same_pixels(probe_layer(layer["path"]).geotransform, grid):
+                    stats = stored_stats(layer["path"])
+                # End if
+                if stats is not None: save_stats(stats, path)
+            # End if
+        # End with
+        if stats is None: pending.append((aligned, path))
+        else: found[aligned] = stats
+    # End for
+
+    # One streaming pass for the rest, over the feasible windows
+    if pending:
+        stage = {
+            "grid": grid, "layers": [unique[x][0] for x, _ in pending],
+            "occupancy": spec["occupancy"], "masks": spec["masks"]
+            }
+        totals = [StreamingStats() for _ in pending]
+        with profile('stats_pass'):
+            for result in map_tiles(tile_stats, stage, occupied_windows(spec, tile_size), workers):
+                for total, part in zip(totals, result): total.merge(part)
+            # End for
+        # End with
+        for (aligned, path), stats in zip(pending, totals):
+            save_stats(stats, path)
+            found[aligned] = stats
+        # End for
+    # End if
+
+    # Range of the normalization
+    for aligned, layers in unique.items():
+        stats = found[aligned]
+        for layer in layers:
+            if stats.count == 0: layer["stats"] = (np.nan, np.nan)
+            elif layer["clip"]: layer["stats"] = (stats.percentile(layer["clip"][0]), stats.percentile(layer["clip"][1]))
+            else: layer["stats"] = (stats.min, stats.max)
+        # End for
+    # End for
+# End def
+
+def normalize(values: np.ndarray, layer: dict, transform: bool = True) -> np.ndarray:
+    """Rescale the layer to [0, 1] (the values out of the range, when
+    it was clipped by percentiles, are truncated), impute the no data
+    zones with `na` and, if the layer is not positive, take its
+    complement (1 - x).
+
+    Args:
+        values (np.ndarray): raw values of the window.
+        layer (dict): layer specification with its "stats".
+        transform (bool, optional): apply the complement of the layers
+        that are not positive. Defaults to True.
+
+    Returns:
+        np.ndarray: normalized values.
+    """
+    low, high = layer["stats"]
+    if high > low:
+        values = np.clip((values - low) / (high - low), 0.0, 1.0)
+    else:
+        # Constant layer (e.g. a vector without field)
+        values = np.where(np.isnan(values), np.nan, 1.0)
+    # End if
+    values = np.where(np.isnan(values), layer["na"], values)
+    if transform and not layer["positive"]: values = 1.0 - values
+    return values
+# End def
+
+def stack_weights(spec: dict, alpha: np.ndarray, omegas: list) -> np.ndarray:
+    """Weights of the bands of the stack for one or several sets of
+    importances and weights. A layer that is not positive contributes
+    w * z * (1 - x) = w * z - w * z * x, i.e. -w to its band and +w to
+    the band of the feasible region z.
+
+    Args:
+        spec (dict): model specification with the stack (see build_stack).
+        alpha (np.ndarray): weights of the criterias (samples, criterias).
+        omegas (list): weights of the layers of each criteria
+        (samples, layers of the criteria).
+
+    Returns:
+        np.ndarray: float64 matrix (samples, bands).
+    """
+    result = np.zeros((alpha.shape[0], spec["bands"]))
+    for p, criteria in enumerate(spec["criterias"]):
+        for k, layer in enumerate(criteria["layers"]):
+            weight = alpha[:, p] * omegas[p][:, k]
+            idx = spec["index"][layer["normalized_key"]]
+            if layer["positive"]:
+                result[:, idx] += weight
+            else:
+                result[:, idx] -= weight
+                result[:, -1] += weight
+            # End if
+        # End for
+    # End for
+    return result
+# End def
+
+def build_stack(spec: dict) -> Plan:
+    """Organize the criteria layers as a stack of normalized layers
+    (masked by the feasible region) and a vector of weights, so the
+    indicator is a single weighted reduction of the stack. The bands
+    are the normalize nodes of the plan of the model, so the layers
+    that only differ in their weight or `positive` share a band (the
+    complement is applied by the weights, see stack_weights). If a
+    layer is not positive, the last band is the feasible region z.
+    Adds "stack" (layers), "index" (normalize node -> band), "bands",
+    "weights" and "signature" (key of the data of the stack,
+    independent of the weights) to the spec.
+
+    Args:
+        spec (dict): model specification (see SMCDAModel).
+
+    Returns:
+        Plan: the plan of the model (see core/planner.py).
+    """
+    grid = spec["grid"]
+    plan = build_plan(spec)
+    index, stack = {}, []
+    for criteria in spec["criterias"]:
+        for layer in criteria["layers"]:
+            if layer["normalized_key"] in index: continue
+            index[layer["normalized_key"]] = len(stack)
+            stack.append(layer)
+        # End for
+    # End for
+    layers = [x for c in spec["criterias"] for x in c["layers"]]
+    spec["stack"] = stack
+    spec["index"] = index
+    spec["bands"] = len(stack) + (0 if all(x["positive"] for x in layers) else 1)
+    alpha = np.array([[c["weight"] for c in spec["criterias"]]])
+    omegas = [np.array([[x["weight"] for x in c["layers"]]]) for c in spec["criterias"]]
+    spec["weights"] = stack_weights(spec, alpha, omegas)[0]
+    spec["signature"] = make_key(
+        grid = [grid.x_min, grid.y_max, grid.px_size, grid.cols, grid.rows, grid.wkt],
+        feasible = [x["aligned_key"] for x in spec["feasible"]],
+        na = [x["na"] for x in spec["feasible"]],
+        stack = list(index),
+        bands = spec["bands"]
+        )
+    return plan
+# End def
+
+def feasible_tile(spec: dict, window: tuple) -> np.ndarray:
+    """Product of the feasible region layers over a window:
+    z = prod_j z_j (no data imputed with `na`).
+
+    Args:
+        spec (dict): model specification (see SMCDAModel).
+        window (tuple): xoff, yoff, xsize, ysize.
+
+    Returns:
+        np.ndarray: float64 values of z.
+    """
+    feasible = np.ones((window[3], window[2]))
+    for layer in spec["feasible"]:
+        values = read_tile(layer, spec["grid"], window)
+        feasible *= np.where(np.isnan(values), layer["na"], values)
+    # End for
+    return feasible
+# End def
+
+def stack_tile(spec: dict, window: tuple) -> np.ndarray:
+    """Normalized layers of the stack over a window, multiplied by the
+    feasible region: z * x_k, with z = prod_j z_j (and z itself as the
+    last band, if the stack has it). In a partial window only the
+    feasible cells (z != 0) are normalized; the rest are 0.
+
+    Args:
+        spec (dict): model specification (see SMCDAModel).
+        window (tuple): xoff, yoff, xsize, ysize.
+
+    Returns:
+        np.ndarray: float32 array (layers, rows, columns).
+    """
+    grid = spec["grid"]
+    feasible = feasible_tile(spec, window)
+    mask = feasible != 0
+    partial = not mask.all()
+    result = np.zeros((spec["bands"],) + feasible.shape, dtype=np.float32)
+    for idx, layer in enumerate(spec["stack"]):
+        values = read_tile(layer, grid, window)
+        if partial: result[idx][mask] = feasible[mask] * normalize(values[mask], layer, False)
+        else: result[idx] = feasible * normalize(values, layer, False)
+    # End for
+    if spec["bands"] > len(spec["stack"]): result[-1] = feasible
+    return result
+# End def
+
+def compute_tile(spec: dict, window: tuple) -> np.ndarray:
+    """Compute the indicator over a window of the grid:
+    (prod_j z_j) * (sum_p alpha_p sum_k omega_k x_k).
+
+    Args:
+        spec (dict): model specification (see SMCDAModel).
+        window (tuple): xoff, yoff, xsize, ysize.
+
+    Returns:
+        np.ndarray: float32 values of the indicator.
+    """
+    return np.tensordot(spec["weights"], stack_tile(spec, window), axes=1).astype(np.float32)
+# End def
+
+# Stacks opened by this process (memory-mapped, read only)
+_STACKS = {}
+
+def create_stack(path: str, grid: Grid, tile_size: int, layers: int) -> np.memmap:
+    """Create the on-disk stack of normalized layers: a tile-major
+    float32 .npy (rows of tiles, columns of tiles, layers, tile_size,
+    tile_size), so the layers of a window are contiguous and can be
+    sliced without copies. The file is sparse: the tiles that are
+    never written use no disk and read as 0.
+
+    Args:
+        path (str): path_dir/name of the .npy.
+        grid (Grid): grid of the model.
+        tile_size (int): side of the tile in pixels.
+        layers (int): number of layers of the stack.
+
+    Returns:
+        np.memmap: writable stack.
+    """
+    shape = (math.ceil(grid.rows / tile_size), math.ceil(grid.cols / tile_size), layers, tile_size, tile_size)
+    return np.lib.format.open_memmap(path, mode='w+', dtype=np.float32, shape=shape)
+# End def
+
+def open_stack(path: str) -> np.memmap:
+    """Open a stack memory-mapped (cached per process)."""
+    if path not in _STACKS: _STACKS[path] = np.load(path, mmap_mode='r')
+    return _STACKS[path]
+# End def
+
+def read_stack(path: str, window: tuple) -> np.ndarray:
+    """Read a window of a cached stack (layers, rows, columns). A
+    window of the tiling of the stack is a view of the mapped file
+    (no copy); other windows are assembled from the tiles they cross.
+    """
+    stack = open_stack(path)
+    size = stack.shape[-1]
+    xoff, yoff, xsize, ysize = window
+    if (xoff % size == 0) and (yoff % size == 0) and (xsize <= size) and (ysize <= size):
+        return stack[yoff // size, xoff // size, :, :ysize, :xsize]
+    # End if
+    result = np.empty((stack.shape[2], ysize, xsize), dtype=np.float32)
+    for row in range(yoff // size, (yoff + ysize - 1) // size + 1):
+        for col in range(xoff // size, (xoff + xsize - 1) // size + 1):
+            # Intersection of the window and the tile (grid coordinates)
+            x0, x1 = max(xoff, col * size), min(xoff + xsize, (col + 1) * size)
+            y0, y1 = max(yoff, row * size), min(yoff + ysize, (row + 1) * size)
+            result[:, y0 - yoff:y1 - yoff, x0 - xoff:x1 - xoff] = \
+                stack[row, col, :, y0 - row * size:y1 - row * size, x0 - col * size:x1 - col * size]
+        # End for
+    # End for
+    return result
+# End def
+
+def query_point(spec: dict, x: float, y: float) -> dict:
+    """Values of the layers and of the indicator at a point (in the
+    reference system of the grid), read from the mapped stack.
+
+    Args:
+        spec (dict): model specification with the "stack_path".
+        x (float): x coordinate.
+        y (float): y coordinate.
+
+    Returns:
+        dict: "indicator" and, for each criteria, the normalized value
+        of its layers ({criteria: {layer: value}}), already multiplied
+        by the feasible region.
+    """
+    grid = spec["grid"]
+    col = math.floor((x - grid.x_min) / grid.px_size)
+    row = math.floor((grid.y_max - y) / grid.px_size)
+    if not ((0 <= col < grid.cols) and (0 <= row < grid.rows)): raise RuntimeError(POINT_ERROR)
+    values = read_stack(spec["stack_path"], (col, row, 1, 1))[:, 0, 0].astype(np.float64)
+    result = {"indicator": float(spec["weights"] @ values)}
+    for criteria in spec["criterias"]:
+        result[criteria["alias"]] = {}
+        for layer in criteria["layers"]:
+            value = values[spec["index"][layer["normalized_key"]]]
+            if not layer["positive"]: value = values[-1] - value
+            result[criteria["alias"]][layer["alias"]] = float(value)
+        # End for
+    # End for
+    return result
+# End def
+
+def combine_tile(spec: dict, window: tuple) -> np.ndarray:
+    """Compute the indicator over a window from the cached stack of
+    normalized layers (only the weighted reduction, and only over the
+    feasible cells of a partial window).
+
+    Args:
+        spec (dict): model specification with the "stack_path".
+        window (tuple): xoff, yoff, xsize, ysize.
+
+    Returns:
+        np.ndarray: float32 values of the indicator.
+    """
+    stack = read_stack(spec["stack_path"], window).reshape((len(spec["weights"]), window[3], window[2]))
+    mask = tile_mask(spec, window)
+    if mask is None: return np.tensordot(spec["weights"], stack, axes=1).astype(np.float32)
+    result = np.zeros((window[3], window[2]), dtype=np.float32)
+    result[mask] = spec["weights"] @ stack[:, mask]
+    return result
+# End def
+
+# ======================================================= #
+# Feasible region index
+# ------------------------------------------------------- #
+
+# Occupancy of a window: no feasible cells, some, or all of them
+EMPTY, PARTIAL, FULL = 0, 1, 2
+
+def occupancy_tile(spec: dict, window: tuple) -> tuple:
+    """Occupancy of a window of the feasible region. The cells are
+    feasible where z != 0, read from the feasible layers or, if the
+    stack was already built ("stack_path"), where any layer of the
+    stack is not 0 (the indicator is 0 elsewhere for any weights).
+
+    Args:
+        spec (dict): model specification (see SMCDAModel).
+        window (tuple): xoff, yoff, xsize, ysize.
+
+    Returns:
+        tuple: state (EMPTY, PARTIAL or FULL) and, if PARTIAL, the
+        bit-packed mask of the window (else None).
+    """
+    if spec.get("stack_path") is not None:
+        stack = read_stack(spec["stack_path"], window).reshape((spec["bands"], window[3], window[2]))
+        mask = (stack != 0).any(axis=0)
+    else:
+        mask = feasible_tile(spec, window) != 0
+    # End if
+    if not mask.any(): return EMPTY, None
+    if mask.all(): return FULL, None
+    return PARTIAL, np.packbits(mask, axis=None)
+# End def
+
+def build_occupancy(spec: dict, tile_size: int, workers: int = 1) -> None:
+    """Build (or load) the occupancy index of the feasible region: the
+    state of every window and the bit-packed mask of the partial ones.
+    It is cached next to the stack, as `<signature>.<tile_size>.npz`.
+    Adds "occupancy" (window -> state) and "masks" (window -> packed
+    mask) to the spec; without feasible layers every window is FULL.
+
+    Args:
+        spec (dict): model specification (see build_stack).
+        tile_size (int): side of the tile in pixels.
+        workers (int, optional): number of processes that evaluate
+        the tiles. Defaults to 1.
+    """
+    spec["occupancy"], spec["masks"] = {}, {}
+    if not spec["feasible"]: return
+    indexes = FileCache(os.path.join(spec["cache"], 'normalized'), f'{tile_size}.npz', spec["cache_size"])
+    key = spec["signature"]
+    path = indexes.get(key)
+    if path is not None:
+        with np.load(path) as data:
+            offsets = data["offsets"]
+            for idx, (window, state) in enumerate(zip(data["windows"], data["states"])):
+                window = tuple(int(x) for x in window)
+                spec["occupancy"][window] = int(state)
+                if state == PARTIAL: spec["masks"][window] = data["bits"][offsets[idx]:offsets[idx + 1]]
+            # End for
+        # End with
+        return
+    # End if
+
+    windows = list(iter_windows(spec["grid"], tile_size))
+    states, bits, offsets = [], [], [0]
+    for window, (state, packed) in zip(windows, map_tiles(occupancy_tile, spec, windows, workers)):
+        spec["occupancy"][window] = state
+        states.append(state)
+        if packed is not None:
+            spec["masks"][window] = packed
+            bits.append(packed)
+        # End if
+        offsets.append(offsets[-1] + (0 if packed is None else packed.size))
+    # End for
+    bits = np.concatenate(bits) if bits else np.zeros(0, dtype=np.uint8)
+    with open(indexes.temporary(key), 'wb') as file:
+        np.savez_compressed(file, windows=np.array(windows), states=np.array(states, dtype=np.uint8), offsets=np.array(offsets), bits=bits)
+    # End with
+    indexes.commit(key)
+# End def
+
+def tile_mask(spec: dict, window: tuple) -> np.ndarray:
+    """Mask of the feasible cells of a PARTIAL window (None otherwise)."""
+    if spec["occupancy"].get(window, FULL) != PARTIAL: return None
+    mask = np.unpackbits(spec["masks"][window], count=window[2] * window[3])
+    return mask.reshape((window[3], window[2])).astype(bool)
+# End def
+
+def occupied_windows(spec: dict, tile_size: int) -> list:
+    """Windows of the grid with at least one feasible cell."""
+    return [x for x in iter_windows(spec["grid"], tile_size) if spec["occupancy"].get(x, FULL) != EMPTY]
+# End def
+
+# ======================================================= #
+# Execution
+# ------------------------------------------------------- #
+
+# Specification of the model in a worker process
+_SPEC = None
+
+def _init_worker(spec: dict) -> None:
+    """Initialize a worker process: keep the specification and drop
+    the dataset handles and mapped stacks inherited from the parent
+    (each worker opens its own ones).
+    """
+    global _SPEC
+    _SPEC = spec
+    _DATASETS.clear()
+    _STACKS.clear()
+# End def
+
+def _call(function, window: tuple):
+    """Evaluate a tile function in a worker process."""
+    return function(_SPEC, window)
+# End def
+
+def _call_measured(function, window: tuple) -> tuple:
+    """Evaluate a tile function in a worker process and measure the
+    CPU and I/O it used (for the profiler of the parent)."""
+    before = usage()
+    value = function(_SPEC, window)
+    after = usage()
+    used = Usage(after.cpu - before.cpu, after.read_bytes - before.read_bytes, after.write_bytes - before.write_bytes, after.peak_rss)
+    return value, used
+# End def
+
+def map_tiles(function, spec: dict, windows: Iterator[tuple], workers: int = 1) -> Iterator:
+    """Evaluate a tile function over the windows, in order. With more
+    than one worker the windows are sent to a process pool; only a
+    few tiles per worker are in flight, so the memory stays bounded.
+
+    Args:
+        function (callable): top level function (spec, window) -> result.
+        spec (dict): model specification (see SMCDAModel).
+        windows (Iterator[tuple]): windows of the grid.
+        workers (int, optional): number of processes. Defaults to 1.
+
+    Yields:
+        the result of each window, in the order of the windows.
+    """
+    if workers <= 1:
+        for window in windows:
+            yield function(spec, window)
+        # End for
+        return
+    # End if
+
+    profiler = active()
+
+    def result(future):
+        if profiler is None: return future.result()
+        value, used = future.result()
+        profiler.add_usage(used)
+        return value
+    # End def
+
+    call = _call if profiler is None else _call_measured
+    with ProcessPoolExecutor(workers, initializer=_init_worker, initargs=(spec,)) as executor:
+        pending = deque()
+        for window in windows:
+            pending.append(executor.submit(call, function, window))
+            if len(pending) >= 4 * workers: yield result(pending.popleft())
+        # End for
+        while pending:
+            yield result(pending.popleft())
+        # End while
+    # End with
+# End def
+
+# ======================================================= #
+# Result writer
+# ------------------------------------------------------- #
+
+# Compressions of the results (GDAL names)
+RESULT_COMPRESSIONS = ['NONE', 'DEFLATE', 'LZW', 'ZSTD']
+
+# Data types of the results
+RESULT_DTYPES = ['float32', 'uint16']
+
+# Largest value of the uint16 results (the indicator 1)
+UINT16_SCALE = 65535
+
+def overview_factors(grid: Grid, tile_size: int) -> list:
+    """Decimation factors of the internal overviews: powers of 2 until
+    the overview fits in a tile (and not beyond the tile size, so each
+    tile of the result maps to whole pixels of every overview).
+    """
+    factors = []
+    factor = 2
+    while (factor <= tile_size) and (max(grid.cols, grid.rows) > tile_size * factor // 2):
+        factors.append(factor)
+        factor *= 2
+    # End while
+    return factors
+# End def
+
+def create_result(output: str, grid: Grid, tile_size: int, compress: str = 'DEFLATE',
+                  dtype: str = 'float32', overviews: bool = True):
+    """Create the GeoTIFF of a result: tiled as the engine, compressed
+    by several threads (NUM_THREADS), with the predictor that suits
+    the data type and with empty internal overviews that are filled
+    by write_result in the same pass. It is sparse: the tiles that are
+    never written (windows without feasible cells) read as 0. With
+    dtype "uint16" the values in [0, 1] are stored scaled by
+    UINT16_SCALE (the scale is kept in the metadata of the band).
+
+    Args:
+        output (str): path_dir/name of the GeoTIFF.
+        grid (Grid): grid of the model.
+        tile_size (int): side of the tile in pixels.
+        compress (str, optional): one of RESULT_COMPRESSIONS. Defaults to 'DEFLATE'.
+        dtype (str, optional): one of RESULT_DTYPES. Defaults to 'float32'.
+        overviews (bool, optional): build internal overviews. Defaults to True.
+
+    Returns:
+        gdal.Dataset: the open result.
+    """
+    predictor = '3' if dtype == 'float32' else '2'
+    options = [
+        'TILED=YES', f'BLOCKXSIZE={tile_size}', f'BLOCKYSIZE={tile_size}',
+        'BIGTIFF=IF_SAFER', 'SPARSE_OK=TRUE', f'COMPRESS={compress}'
+        ]
+    if compress != 'NONE': options += [f'PREDICTOR={predictor}', 'NUM_THREADS=ALL_CPUS']
+    gdal_type = gdal.GDT_Float32 if dtype == 'float32' else gdal.GDT_UInt16
+    dataset = gdal.GetDriverByName('GTiff').Create(output, grid.cols, grid.rows, 1, gdal_type, options)
+    dataset.SetGeoTransform(grid.geotransform)
+    dataset.SetProjection(grid.wkt)
+    if dtype == 'uint16': dataset.GetRasterBand(1).SetScale(1 / UINT16_SCALE)
+    factors = overview_factors(grid, tile_size) if overviews else []
+    if factors:
+        # Internal overviews, compressed as the result, left empty
+        config = {'COMPRESS_OVERVIEW': compress, 'PREDICTOR_OVERVIEW': predictor, 'GDAL_NUM_THREADS': 'ALL_CPUS'}
+        previous = {x: gdal.GetConfigOption(x) for x in config}
+        for key, value in config.items(): gdal.SetConfigOption(key, value)
+        try:
+            dataset.BuildOverviews('NONE', factors)
+        finally:
+            for key, value in previous.items(): gdal.SetConfigOption(key, value)
+        # End try
+    # End if
+    return dataset
+# End def
+
+def downsample(values: np.ndarray) -> np.ndarray:
+    """Average blocks of 2x2 pixels (the incomplete blocks of the
+    border are averaged over the pixels they have)."""
+    rows, cols = values.shape
+    padded = np.full((rows + rows % 2, cols + cols % 2), np.nan)
+    padded[:rows, :cols] = values
+    blocks = padded.reshape((padded.shape[0] // 2, 2, padded.shape[1] // 2, 2))
+    count = (~np.isnan(blocks)).sum(axis=(1, 3))
+    total = np.nansum(blocks, axis=(1, 3))
+    return np.divide(total, count, out=np.full(total.shape, np.nan), where=count > 0)
+# End def
+
+def write_result(dataset, window: tuple, values: np.ndarray) -> None:
+    """Write a tile of a result and its block averages in every
+    overview (so no second pass is needed to build them).
+
+    Args:
+        dataset (gdal.Dataset): result (see create_result).
+        window (tuple): xoff, yoff, xsize, ysize.
+        values (np.ndarray): float values of the window.
+    """
+    band = dataset.GetRasterBand(1)
+    uint16 = band.DataType == gdal.GDT_UInt16
+
+    def encode(array: np.ndarray) -> np.ndarray:
+        if not uint16: return array.astype(np.float32)
+        array = np.nan_to_num(array, nan=0.0)
+        return np.round(np.clip(array, 0.0, 1.0) * UINT16_SCALE).astype(np.uint16)
+    # End def
+
+    band.WriteArray(encode(values), window[0], window[1])
+    level = values.astype(np.float64)
+    factor = 1
+    for idx in range(band.GetOverviewCount()):
+        level = downsample(level)
+        factor *= 2
+        band.GetOverview(idx).WriteArray(encode(level), window[0] // factor, window[1] // factor)
+    # End for
+# End def
+
+def finish_result(output: str, tile_size: int, compress: str = 'DEFLATE', cog: bool = False) -> str:
+    """Finish a closed result. With `cog` its blocks are reordered with
+    the COG driver (overviews first, IFDs at the beginning); the
+    existing overviews are reused, not recomputed.
+
+    Args:
+        output (str): path_dir/name of the GeoTIFF.
+        tile_size (int): side of the tile in pixels.
+        compress (str, optional): one of RESULT_COMPRESSIONS. Defaults to 'DEFLATE'.
+        cog (bool, optional): strict Cloud Optimized GeoTIFF layout.
+        Defaults to False.
+
+    Returns:
+        str: path of the result.
+    """
+    if not cog: return output
+    name, ext = os.path.splitext(output)
+    temporary = f"{name}.tmp{ext}"
+    options = [
+        f'BLOCKSIZE={tile_size}', f'COMPRESS={compress}', 'NUM_THREADS=ALL_CPUS',
+        'OVERVIEWS=FORCE_USE_EXISTING', 'BIGTIFF=IF_SAFER'
+        ]
+    if compress != 'NONE': options.append('PREDICTOR=YES')
+    gdal.Translate(temporary, output, format='COG', creationOptions=options)
+    os.replace(temporary, output)
+    return output
+# End def
+
+def ensure_stack(spec: dict, tile_size: int, workers: int = 1, result=None) -> str:
+    """Get the cached stack of normalized layers of the model, or build
+    it (aligning the layers and computing their statistics first). If
+    a result is given, the indicator is written to it in the same pass.
+
+    Args:
+        spec (dict): model specification (see SMCDAModel).
+        tile_size (int): side of the tile in pixels.
+        workers (int, optional): number of processes that evaluate
+        the tiles. Defaults to 1.
+        result (gdal.Dataset, optional): result (see create_result).
+        Defaults to None.
+
+    Returns:
+        str: path of the stack (also set as "stack_path" in the spec).
+    """
+    grid = spec["grid"]
+    build_stack(spec)
+    stacks = FileCache(os.path.join(spec["cache"], 'normalized'), 'npy', spec["cache_size"])
+    key = spec["signature"]
+    spec["stack_path"] = stacks.get(key)
+    if spec["stack_path"] is not None:
+        with profile('occupancy'):
+            build_occupancy(spec, tile_size, workers)
+        # End with
+        return spec["stack_path"]
+    # End if
+
+    # Layers aligned to the grid (cached)
+    with profile('prepare_layers'):
+        prepare_layers(spec, tile_size, workers)
+    # End with
+    # Windows with feasible cells
+    with profile('occupancy'):
+        build_occupancy(spec, tile_size, workers)
+    # End with
+    # Statistics for the normalization (over the feasible cells)
+    with profile('statistics'):
+        compute_stats(spec, tile_size, workers)
+    # End with
+    # Stack (and result)
+    with profile('stack'):
+        windows = occupied_windows(spec, tile_size)
+        stack = create_stack(stacks.temporary(key), grid, tile_size, spec["bands"])
+        for window, values in zip(windows, map_tiles(stack_tile, spec, windows, workers)):
+            xoff, yoff, xsize, ysize = window
+            stack[yoff // tile_size, xoff // tile_size, :, :ysize, :xsize] = values
+            if result is not None: write_result(result, window, np.tensordot(spec["weights"], values, axes=1))
+        # End for
+        stack.flush()
+        del stack
+    # End with
+    spec["stack_path"] = stacks.commit(key)
+    stacks.evict(keep={key})
+    return spec["stack_path"]
+# End def
+
+def run(spec: dict, output: str, tile_size: int, workers: int = 1, compress: str = 'DEFLATE',
+        dtype: str = 'float32', cog: bool = False) -> str:
+    """Execute the model tile by tile. The memory used depends on the
+    tile size, not on the extent of the model.
+
+    The normalized layers (masked by the feasible region) are cached
+    as a stack keyed by everything but the weights. If the stack of
+    the model exists (e.g. only `importance` or `weight` changed),
+    the result is a weighted reduction of the stack: reading,
+    reprojection, rasterization and normalization are skipped.
+    Otherwise the layers are aligned, their statistics computed and
+    each window is read, normalized, written to the stack and
+    combined into the result. The result is compressed and its
+    overviews are built while the tiles are written.
+
+    Args:
+        spec (dict): model specification (see SMCDAModel).
+        output (str): path_dir/name of the output GeoTIFF.
+        tile_size (int): side of the tile in pixels.
+        workers (int, optional): number of processes that evaluate
+        the tiles. Defaults to 1.
+        compress (str, optional): one of RESULT_COMPRESSIONS. Defaults to 'DEFLATE'.
+        dtype (str, optional): one of RESULT_DTYPES. Defaults to 'float32'.
+        cog (bool, optional): strict Cloud Optimized GeoTIFF layout
+        (see finish_result). Defaults to False.
+
+    Returns:
+        str: path of the output.
+    """
+    grid = spec["grid"]
+    dataset = create_result(output, grid, tile_size, compress, dtype)
+    with profile('plan'):
+        build_stack(spec)
+    # End with
+    cached = FileCache(os.path.join(spec["cache"], 'normalized'), 'npy', spec["cache_size"]).get(spec["signature"])
+    if cached is None:
+        # Stack and result in the same pass
+        ensure_stack(spec, tile_size, workers, dataset)
+    else:
+        # Weights only: reduction of the cached stack
+        spec["stack_path"] = cached
+        with profile('occupancy'):
+            build_occupancy(spec, tile_size, workers)
+        # End with
+        with profile('combine'):
+            windows = occupied_windows(spec, tile_size)
+            for window, values in zip(windows, map_tiles(combine_tile, spec, windows, workers)):
+                write_result(dataset, window, values)
+            # End for
+        # End with
+    # End if
+    with profile('write'):
+        dataset.FlushCache()
+        dataset = None
+        output = finish_result(output, tile_size, compress, cog)
+    # End with
+    return output
+# End def
+
+# ======================================================= #
+# Preview and refinement
+# ------------------------------------------------------- #
+
+def read_values(band, window: tuple) -> np.ndarray:
+    """Read a window of a result band as float64 (the uint16 results
+    are unscaled, see create_result)."""
+    values = band.ReadAsArray(*window).astype(np.float64)
+    return values * (band.GetScale() or 1.0) + (band.GetOffset() or 0.0)
+# End def
+
+def coarse_window(window: tuple, factor: int) -> tuple:
+    """Window of the coarse grid (pixels `factor` times larger, same
+    origin) that covers a window of the fine grid."""
+    xoff, yoff, xsize, ysize = window
+    x0, y0 = xoff // factor, yoff // factor
+    return x0, y0, (xoff + xsize - 1) // factor - x0 + 1, (yoff + ysize - 1) // factor - y0 + 1
+# End def
+
+def preview_tile(band, window: tuple, factor: int) -> np.ndarray:
+    """Values of the preview over a window of the fine grid (each
+    coarse pixel repeated over the fine pixels it covers)."""
+    outer = coarse_window(window, factor)
+    values = np.repeat(np.repeat(read_values(band, outer), factor, axis=0), factor, axis=1)
+    dx, dy = window[0] - outer[0] * factor, window[1] - outer[1] * factor
+    return values[dy:dy + window[3], dx:dx + window[2]]
+# End def
+
+def refine_windows(preview: str, grid: Grid, factor: int, tile_size: int, margin: float) -> list:
+    """Windows of the fine grid to evaluate at full resolution: the
+    ones that cover a coarse pixel of the preview whose indicator is
+    within `margin` of the top (and feasible, > 0). The preview is
+    read by windows (twice: the top, then the candidates).
+
+    Args:
+        preview (str): path of the coarse result.
+        grid (Grid): fine grid.
+        factor (int): coarse pixel size / fine pixel size.
+        tile_size (int): side of the tile in pixels.
+        margin (float): distance to the top of the indicator.
+
+    Returns:
+        list: windows of the fine grid, in order.
+    """
+    dataset = gdal.Open(preview)
+    band = dataset.GetRasterBand(1)
+    coarse = Grid(grid.x_min, grid.y_max, grid.px_size * factor, dataset.RasterXSize, dataset.RasterYSize, grid.wkt)
+    top = 0.0
+    for window in iter_windows(coarse, tile_size):
+        values = read_values(band, window)
+        if not np.isnan(values).all(): top = max(top, float(np.nanmax(values)))
+    # End for
+    candidates = np.zeros((coarse.rows, coarse.cols), dtype=bool)
+    for xoff, yoff, xsize, ysize in iter_windows(coarse, tile_size):
+        values = read_values(band, (xoff, yoff, xsize, ysize))
+        candidates[yoff:yoff + ysize, xoff:xoff + xsize] = (values > 0) & (values >= top - margin)
+    # End for
+    windows = []
+    for window in iter_windows(grid, tile_size):
+        xoff, yoff, xsize, ysize = coarse_window(window, factor)
+        if candidates[yoff:yoff + ysize, xoff:xoff + xsize].any(): windows.append(window)
+    # End for
+    return windows
+# End def
+
+def run_refined(spec: dict, coarse: dict, preview: str, output: str, tile_size: int, workers: int = 1,
+                margin: float = 0.1, compress: str = 'DEFLATE', dtype: str = 'float32', cog: bool = False) -> dict:
+    """Coarse to fine execution. The model is first run on a coarse
+    grid (the warped rasters read the overviews of the sources that
+    match the coarse pixel), which gives a quick preview. Then only
+    the windows of the fine grid whose preview is within `margin` of
+    the top are evaluated at full resolution; the rest of the refined
+    result holds the preview. The fine layers are normalized with the
+    ranges of the coarse run, so no full resolution pass is needed
+    for the statistics, and the vectors (and their proximity or
+    buffer) are only computed over the refined windows (see
+    prepare_layers).
+
+    Args:
+        spec (dict): model specification on the fine grid.
+        coarse (dict): the same model on the coarse grid (pixels an
+        integer factor larger, same origin).
+        preview (str): path_dir/name of the coarse result.
+        output (str): path_dir/name of the refined result.
+        tile_size (int): side of the tile in pixels.
+        workers (int, optional): number of processes. Defaults to 1.
+        margin (float, optional): distance to the top of the indicator
+        of the refined pixels. Defaults to 0.1.
+        compress (str, optional): one of RESULT_COMPRESSIONS. Defaults to 'DEFLATE'.
+        dtype (str, optional): one of RESULT_DTYPES. Defaults to 'float32'.
+        cog (bool, optional): see finish_result. Defaults to False.
+
+    Returns:
+        dict: "preview" and "refined" paths, "tiles" (refined windows)
+        and "total" (windows of the fine grid).
+    """
+    grid = spec["grid"]
+    factor = round(coarse["grid"].px_size / grid.px_size)
+    with profile('preview'):
+        run(coarse, preview, tile_size, workers, compress, dtype)
+    # End with
+
+    with profile('refine'):
+        # Ranges of the normalization (from the coarse run)
+        with profile('plan'):
+            build_stack(spec)
+        # End with
+        if any("stats" not in x for c in coarse["criterias"] for x in c["layers"]):
+            prepare_layers(coarse, tile_size, workers)
+            compute_stats(coarse, tile_size, workers)
+        # End if
+        for fine, rough in zip(spec["criterias"], coarse["criterias"]):
+            for layer, source in zip(fine["layers"], rough["layers"]): layer["stats"] = source["stats"]
+        # End for
+        # Windows near the top at full resolution, the preview elsewhere
+        windows = refine_windows(preview, grid, factor, tile_size, margin)
+        with profile('prepare_layers'):
+            prepare_layers(spec, tile_size, workers, windows)
+        # End with
+        dataset = create_result(output, grid, tile_size, compress, dtype)
+        source = gdal.Open(preview)
+        band = source.GetRasterBand(1)
+        refined = set(windows)
+        with profile('combine'):
+            for window in iter_windows(grid, tile_size):
+                if window not in refined: write_result(dataset, window, preview_tile(band, window, factor))
+            # End for
+            for window, values in zip(windows, map_tiles(compute_tile, spec, windows, workers)):
+                write_result(dataset, window, values)
+            # End for
+        # End with
+        band, source = None, None
+        with profile('write'):
+            dataset.FlushCache()
+            dataset = None
+            output = finish_result(output, tile_size, compress, cog)
+        # End with
+    # End with
+    total = sum(1 for _ in iter_windows(grid, tile_size))
+    return {"preview": preview, "refined": output, "tiles": len(windows), "total": total}
+# End def
+
+# ======================================================= #
+# Top sites
+# ------------------------------------------------------- #
+
+# Candidates kept per requested site (the tiles suppress their own
+# neighbours, but the ones near the borders are suppressed again
+# when the candidates of all the tiles are merged)
+SITE_CANDIDATES = 4
+
+def select_sites(values: np.ndarray, k: int, radius: float, taken: list = ()) -> list:
+    """Greedy selection of the best cells of an array: the highest
+    feasible (> 0) cell is taken and the cells closer than `radius`
+    (pixels) are discarded, until there are `k` cells.
+
+    Args:
+        values (np.ndarray): indicator of a window.
+        k (int): maximum number of cells.
+        radius (float): minimum separation, in pixels (0 for none).
+        taken (list, optional): (row, column) of sites already chosen
+        (they may be out of the array): their neighbours are discarded
+        from the start. Defaults to none.
+
+    Returns:
+        list: (score, row, column) of the cells, best first.
+    """
+    values = np.where(np.isnan(values), 0.0, values)
+    reach = max(0, math.ceil(radius) - 1)
+    alive = np.ones(values.shape, dtype=bool)
+    def discard(row: int, col: int) -> None:
+        r0, c0 = max(0, row - reach), max(0, col - reach)
+        r1, c1 = min(values.shape[0], row + reach + 1), min(values.shape[1], col + reach + 1)
+        if (r0 >= r1) or (c0 >= c1): return
+        rows, cols = np.ogrid[r0:r1, c0:c1]
+        alive[r0:r1, c0:c1] &= ~((rows - row) ** 2 + (cols - col) ** 2 < radius ** 2)
+    # End def
+
+    if radius > 0:
+        for row, col in taken: discard(row, col)
+    # End if
+    feasible = np.flatnonzero((values > 0) & alive)
+    order = feasible[np.argsort(values.flat[feasible])[::-1]]
+    if radius <= 0:
+        return [(float(values.flat[x]), *divmod(int(x), values.shape[1])) for x in order[:k]]
+    # End if
+    sites = []
+    for idx in order:
+        row, col = divmod(int(idx), values.shape[1])
+        if not alive[row, col]: continue
+        sites.append((float(values[row, col]), row, col))
+        if len(sites) == k: break
+        discard(row, col)
+    # End for
+    return sites
+# End def
+
+def sites_tile(spec: dict, window: tuple) -> list:
+    """Best separated cells of a window (see select_sites), with the
+    indicator computed from the cached stack ("stack_path") or from
+    the layers. Nothing is written.
+
+    Args:
+        spec (dict): model specification with "sites" ({"k", "radius"}).
+        window (tuple): xoff, yoff, xsize, ysize.
+
+    Returns:
+        list: (score, row, column) of the cells, in grid coordinates.
+    """
+    if spec.get("stack_path") is not None: values = combine_tile(spec, window)
+    else: values = compute_tile(spec, window)
+    taken = [(row - window[1], col - window[0]) for row, col in spec["sites"].get("taken", ())]
+    sites = select_sites(values, spec["sites"]["k"], spec["sites"]["radius"], taken)
+    return [(score, row + window[1], col + window[0]) for score, row, col in sites]
+# End def
+
+def cell_values(spec: dict, row: int, col: int) -> np.ndarray:
+    """Values of the bands of the stack at a cell (from the cached
+    stack, or read and normalized from the layers)."""
+    window = (col, row, 1, 1)
+    if spec.get("stack_path") is not None: values = read_stack(spec["stack_path"], window)
+    else: values = stack_tile(spec, window)
+    return values.reshape(-1).astype(np.float64)
+# End def
+
+def contributions(spec: dict, values: np.ndarray) -> dict:
+    """Contribution of each criteria to the indicator of a cell,
+    alpha_p * z * sum_k omega_k x_k (they add up to the indicator).
+
+    Args:
+        spec (dict): model specification with the stack (see build_stack).
+        values (np.ndarray): values of the bands of the stack at the cell.
+
+    Returns:
+        dict: {criteria: contribution}.
+    """
+    result = {}
+    for criteria in spec["criterias"]:
+        total = 0.0
+        for layer in criteria["layers"]:
+            value = values[spec["index"][layer["normalized_key"]]]
+            if not layer["positive"]: value = values[-1] - value
+            total += layer["weight"] * value
+        # End for
+        result[criteria["alias"]] = float(criteria["weight"] * total)
+    # End for
+    return result
+# End def
+
+def top_sites(spec: dict, k: int, separation: float, tile_size: int, workers: int = 1) -> list:
+    """Streaming extraction of the best `k` cells of the indicator,
+    at least `separation` apart. The tiles are evaluated (from the
+    cached stack if there is one, else from the layers) and each one
+    gives its best separated cells; only a bounded heap of the best
+    candidates is kept, and the final sites are chosen greedily among
+    them. No raster is written nor held in memory.
+
+    The selection is approximate: a greedy pass over the candidates of
+    the tiles, which may differ from a greedy pass over the whole grid
+    near the borders of the tiles. When the candidates near the borders
+    suppress each other and fewer than `k` sites survive, the tiles are
+    evaluated again for the missing sites, excluding the neighbours of
+    the ones already chosen; so fewer than `k` sites are returned only
+    if no other feasible cell is `separation` away from them.
+
+    Args:
+        spec (dict): model specification (see SMCDAModel).
+        k (int): number of sites.
+        separation (float): minimum distance between sites (units
+        of the grid).
+        tile_size (int): side of the tile in pixels.
+        workers (int, optional): number of processes. Defaults to 1.
+
+    Returns:
+        list: one dict per site, best first: "x", "y" (center of the
+        cell), "row", "col", "score" and "contributions" ({criteria:
+        contribution}).
+    """
+    grid = spec["grid"]
+    with profile('plan'):
+        build_stack(spec)
+    # End with
+    cached = FileCache(os.path.join(spec["cache"], 'normalized'), 'npy', spec["cache_size"]).get(spec["signature"])
+    if cached is None:
+        with profile('prepare_layers'):
+            prepare_layers(spec, tile_size, workers)
+        # End with
+    else:
+        spec["stack_path"] = cached
+    # End if
+    with profile('occupancy'):
+        build_occupancy(spec, tile_size, workers)
+    # End with
+    if cached is None:
+        with profile('statistics'):
+            compute_stats(spec, tile_size, workers)
+        # End with
+    # End if
+    windows = occupied_windows(spec, tile_size)
+
+    radius = separation / grid.px_size
+    chosen = []
+    while len(chosen) < k:
+        # Bounded heap of the candidates (the worst on top), away
+        # from the sites of the previous passes
+        missing = k - len(chosen)
+        taken = [(r, c) for _, r, c in chosen]
+        stage = dict(spec, sites = {"k": missing, "radius": radius, "taken": taken})
+        heap, size = [], missing * SITE_CANDIDATES
+        with profile('sites'):
+            for sites in map_tiles(sites_tile, stage, windows, workers):
+                for site in sites:
+                    if len(heap) < size: heapq.heappush(heap, site)
+                    elif site > heap[0]: heapq.heapreplace(heap, site)
+                # End for
+            # End for
+        # End with
+        # Greedy selection among the candidates of all the tiles (the
+        # best one is always taken, so every pass adds a site; without
+        # separation nothing is suppressed and one pass is enough)
+        before = len(chosen)
+        for score, row, col in sorted(heap, reverse=True):
+            if any((row - r) ** 2 + (col - c) ** 2 < radius ** 2 for _, r, c in chosen): continue
+            chosen.append((score, row, col))
+            if len(chosen) == k: break
+        # End for
+        if (len(chosen) == before) or (radius <= 0): break
+    # End while
+    chosen.sort(reverse=True)
+    result = []
+    for score, row, col in chosen:
+        result.append({
+            "x": grid.x_min + (col + 0.5) * grid.px_size,
+            "y": grid.y_max - (row + 0.5) * grid.px_size,
+            "row": row,
+            "col": col,
+            "score": score,
+            "contributions": contributions(spec, cell_values(spec, row, col))
+            })
+    # End for
+    return result
+# End def
+
+# ======================================================= #
+# Sensitivity
+# ------------------------------------------------------- #
+
+# Number of weight vectors evaluated together (bounds the memory
+# used per tile to SAMPLE_BATCH x pixels of the tile)
+SAMPLE_BATCH = 128
+
+# Pixels of the decimated stack used to estimate the thresholds of
+# the rank stability
+THRESHOLD_PIXELS = 65536
+
+def sample_weights(spec: dict, n_samples: int, perturbation: float, seed: int = None) -> np.ndarray:
+    """Draw perturbed weight vectors of the stack. Every importance
+    and every weight is multiplied by a factor uniform in
+    [1 - perturbation, 1 + perturbation] and renormalized, so each
+    sample is a valid model (alpha and omega add up to 1).
+
+    Args:
+        spec (dict): model specification with the stack (see build_stack).
+        n_samples (int): number of weight vectors.
+        perturbation (float): relative perturbation, in (0, 1).
+        seed (int, optional): seed of the generator. Defaults to None.
+
+    Returns:
+        np.ndarray: float64 matrix (n_samples, bands of the stack).
+    """
+    rng = np.random.default_rng(seed)
+    criterias = spec["criterias"]
+    alpha = np.array([x["weight"] for x in criterias])
+    alpha = alpha * rng.uniform(1 - perturbation, 1 + perturbation, (n_samples, len(criterias)))
+    alpha /= alpha.sum(axis=1, keepdims=True)
+    omegas = []
+    for criteria in criterias:
+        omega = np.array([x["weight"] for x in criteria["layers"]])
+        omega = omega * rng.uniform(1 - perturbation, 1 + perturbation, (n_samples, len(omega)))
+        omegas.append(omega / omega.sum(axis=1, keepdims=True))
+    # End for
+    return stack_weights(spec, alpha, omegas)
+# End def
+
+def sample_thresholds(spec: dict, samples: np.ndarray, top: float, tile_size: int) -> np.ndarray:
+    """Estimate, for every weight vector, the value of the indicator
+    above which a feasible pixel is in the `top` fraction of the
+    feasible region. It uses a strided read of the mapped stack (about
+    THRESHOLD_PIXELS) restricted to the feasible cells (see
+    build_occupancy): the cells out of the region are 0 for every
+    weight vector and would pull the thresholds down to 0. The windows
+    are the ones of the occupancy index, whatever the tiles of the
+    cached stack are (see read_stack).
+
+    Args:
+        spec (dict): model specification with the "stack_path" and
+        the "occupancy".
+        samples (np.ndarray): weight vectors (see sample_weights).
+        top (float): fraction of the best pixels, in (0, 1).
+        tile_size (int): side of the tiles of the occupancy index.
+
+    Returns:
+        np.ndarray: threshold of each weight vector (inf if there are
+        no feasible cells).
+    """
+    grid = spec["grid"]
+    factor = max(1, math.ceil(math.sqrt(grid.cols * grid.rows / THRESHOLD_PIXELS)))
+    parts = []
+    for window in occupied_windows(spec, tile_size):
+        # Strided view of the window (only every factor-th pixel)
+        values = read_stack(spec["stack_path"], window)[:, ::factor, ::factor]
+        mask = tile_mask(spec, window)
+        if mask is None: parts.append(values.reshape((spec["bands"], -1)))
+        else: parts.append(values[:, mask[::factor, ::factor]])
+    # End for
+    if not parts: return np.full(len(samples), np.inf)
+    stack = np.concatenate(parts, axis=1)
+    result = np.empty(len(samples))
+    for start in range(0, len(samples), SAMPLE_BATCH):
+        batch = samples[start:start + SAMPLE_BATCH]
+        result[start:start + SAMPLE_BATCH] = np.quantile(batch @ stack, 1 - top, axis=1)
+    # End for
+    return result
+# End def
+
+def sensitivity_tile(spec: dict, window: tuple) -> np.ndarray:
+    """Evaluate all the weight vectors over the feasible cells of a
+    window of the cached stack and reduce them online (batches of
+    SAMPLE_BATCH vectors are merged with the parallel formulas of the
+    mean and variance). Empty windows are not read.
+
+    Args:
+        spec (dict): model specification with the "stack_path",
+        "samples" and "thresholds".
+        window (tuple): xoff, yoff, xsize, ysize.
+
+    Returns:
+        np.ndarray: float32 array (3, rows, columns) with the mean,
+        the standard deviation and the fraction of the weight vectors
+        for which the pixel is in the top of the model (all 0 out of
+        the feasible region).
+    """
+    samples, thresholds = spec["samples"], spec["thresholds"]
+    shape = (window[3], window[2])
+    # Cells out of the feasible region: never in the top
+    outside = np.zeros((3,) + shape)
+    if spec["occupancy"].get(window, FULL) == EMPTY: return outside.astype(np.float32)
+    mask = tile_mask(spec, window)
+    stack = read_stack(spec["stack_path"], window).reshape((samples.shape[1], -1)).astype(np.float64)
+    if mask is not None: stack = stack[:, mask.ravel()]
+    count = 0
+    mean = np.zeros(stack.shape[1])
+    m2 = np.zeros(stack.shape[1])
+    hits = np.zeros(stack.shape[1])
+    for start in range(0, len(samples), SAMPLE_BATCH):
+        values = samples[start:start + SAMPLE_BATCH] @ stack
+        size = values.shape[0]
+        batch_mean = values.mean(axis=0)
+        batch_m2 = ((values - batch_mean) ** 2).sum(axis=0)
+        delta = batch_mean - mean
+        total = count + size
+        mean += delta * size / total
+        m2 += batch_m2 + delta ** 2 * count * size / total
+        count = total
+        hits += (values >= thresholds[start:start + SAMPLE_BATCH, None]).sum(axis=0)
+    # End for
+    result = np.stack([mean, np.sqrt(m2 / count), hits / count])
+    if mask is None: return result.reshape((3,) + shape).astype(np.float32)
+    outside[:, mask] = result
+    return outside.astype(np.float32)
+# End def
+
+def run_sensitivity(spec: dict, outputs: dict, tile_size: int, workers: int = 1,
+                    n_samples: int = 1000, perturbation: float = 0.2, top: float = 0.1, seed: int = None) -> dict:
+    """Monte Carlo analysis of the sensitivity of the result to the
+    weights. Each window of the stack of normalized layers is read once
+    and multiplied by the whole matrix of perturbed weights; the per
+    pixel statistics are reduced online, so the memory doesn't grow
+    with the number of samples.
+
+    Args:
+        spec (dict): model specification (see SMCDAModel).
+        outputs (dict): path_dir/name of the "mean", "std" and
+        "stability" GeoTIFFs.
+        tile_size (int): side of the tile in pixels.
+        workers (int, optional): number of processes that evaluate
+        the tiles. Defaults to 1.
+        n_samples (int, optional): number of weight vectors. Defaults to 1000.
+        perturbation (float, optional): relative perturbation of the
+        importances and weights. Defaults to 0.2.
+        top (float, optional): fraction of the best pixels used for the
+        rank stability. Defaults to 0.1.
+        seed (int, optional): seed of the generator. Defaults to None.
+
+    Returns:
+        dict: paths of the outputs.
+    """
+    grid = spec["grid"]
+    ensure_stack(spec, tile_size, workers)
+    spec["samples"] = sample_weights(spec, n_samples, perturbation, seed)
+    spec["thresholds"] = sample_thresholds(spec, spec["samples"], top, tile_size)
+
+    names = ["mean", "std", "stability"]
+    datasets = [create_result(outputs[x], grid, tile_size) for x in names]
+    windows = list(iter_windows(grid, tile_size))
+    for window, values in zip(windows, map_tiles(sensitivity_tile, spec, windows, workers)):
+        for idx, dataset in enumerate(datasets):
+            write_result(dataset, window, values[idx])
+        # End for
+    # End for
+    for dataset in datasets: dataset.FlushCache()
+    dataset, datasets = None, None
+    return outputs
+# End def
@@ -17,7 +17,7 @@ import warnings
 # Main code
 # ------------------------------------------------------- #
 
-EXTENSION_ERROR = 'The file extension is not supported by the package. Please use ESRI shapefile (.shp extension) for vectors and GTiff (.tif extension) for rasters.'
+EXTENSION_ERROR = 'The file extension is not supported by the package. Please use ESRI shapefile (.shp), GeoPackage (.gpkg) or FlatGeobuf (.fgb) for vectors and GTiff (.tif extension) for rasters.'
 
 ALIAS_ERROR = 'The alias has non alphanumeric characters, please provide an alias with only alphanumeric chars.'
 
@@ -33,10 +33,60 @@ ALIAS2_ERROR = "The alias already exists in the model"
 
 LAYER_ERROR = "The object in layer parameter is not a SMCDALayer"
 
+CRITERIA_ERROR = "The criteria with that name does not exist"
+
+RUN_ERROR = "The alias and the output_dir have to be declared before running the analysis."
+
+EMPTY_ERROR = "The model has no layers in its criterias. Add at least one layer before running the analysis."
+
+IMPORTANCE_ERROR = "Every criteria with layers needs an importance before running the analysis."
+
+WEIGHT_ERROR = "Every layer needs a weight before running the analysis."
+
+PIXEL_ERROR = "The pixel_size is too small for the extent of the model (more than 10^6 pixels per side)."
+
+TILE_ERROR = "The tile_size has to be a positive multiple of 16."
+
+VECTOR_ERROR = "The buffer and the proximity can only be computed for vector layers."
+
+DIST_ERROR = "The dist parameter has to be a positive number."
+
+CLIP_ERROR = "The clip parameter has to be a pair of percentiles (lower, upper) with 0 <= lower < upper <= 100."
+
+BUFFER_ERROR = 'The buffer method has to be "auto", "raster" or "vector".'
+
+RESAMPLING_ERROR = "The resampling method is not supported. See RESAMPLING_METHODS in core/utils.py."
+
+POINT_ERROR = "The point is out of the extent of the model."
+
+COMPRESS_ERROR = "The compress parameter is not supported. See RESULT_COMPRESSIONS in core/engine.py."
+
+DTYPE_ERROR = "The dtype parameter is not supported. See RESULT_DTYPES in core/engine.py."
+
+CRS_ERROR = "The layer has no spatial reference system."
+
+DIRECTORY_ERROR = "The directory doesn't exist or has no supported layers matching the pattern."
+
+FACTOR_ERROR = "The factor has to be an integer greater than 1."
+
+SEPARATION_ERROR = "The min_separation parameter has to be a number greater or equal than 0."
+
+ZONES_OUTPUT_ERROR = "The output of the zonal statistics has to be a .csv, .shp, .gpkg or .fgb file."
+
+PERCENTILES_ERROR = "The percentiles have to be a list of numbers between 0 and 100."
+
+HOOK_ERROR = "The hook has to be a callable that receives a StageRecord."
+
+SUBLAYER_ERROR = "The vector has no sublayer with that name, or no sublayer with geometries."
+
 def KWARGS_WARNING(element: str) -> str:
     return warnings.warn(f'{element} not allowed, will be omited')
 # End def
 
+def HOOK_WARNING(error: Exception) -> str:
+    return warnings.warn(f'The profiling hook failed ({error!r}), the run continues.')
+# End def
+
 def STR_ERROR(arg: str) -> str: 
     return f'object in {arg} argument is not a string element.'
 # End def
@@ -60,4 +110,12 @@ def PINT_ERROR(arg: str) -> str:
 
 def BOOL_ERROR(arg: str) -> str:
     return f'{arg} is not boolean'
+# End def
+
+def FRACTION_ERROR(arg: str) -> str:
+    return f'{arg} is not a number between 0 and 1 (excluded)'
+# End def
+
+def VALIDATION_ERROR(errors: list) -> str:
+    return 'The model has errors:\n    ' + '\n    '.join(errors)
 # End def
\ No newline at end of file
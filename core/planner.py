@@ -0,0 +1,209 @@
+# ======================================================= #
+'''
+@ProjectName: SpatialMCDA
+@Author: FernandoCastano
+@Email: castano.fernando.martin@gmail.com
+@Version: 0.1.0
+'''
+# ------------------------------------------------------- #
+
+# ======================================================= #
+# Packages
+# ------------------------------------------------------- #
+from typing import NamedTuple
+from core.utils import *
+from core.cache import layer_files, make_key
+
+# ======================================================= #
+# Main code
+# ------------------------------------------------------- #
+
+# Bytes of a pixel of the intermediate layers (float32)
+PIXEL_BYTES = 4
+
+# Layers with at most this number of features are buffered with
+# their geometries when the buffer method is "auto"
+BUFFER_FEATURES = 1000
+
+class PlanNode(NamedTuple):
+    key: str
+    op: str
+    label: str
+    inputs: tuple
+    io: int
+# End class
+
+class Plan:
+    """
+    Dependency graph of the operations of a model (read, reproject,
+    rasterize, buffer/proximity, normalize, transform, feasible and
+    combine). The key of a node is the hash of its operation, its
+    parameters and the keys of its inputs, so identical subgraphs (e.g.
+    the same file, field and grid used by several criterias) are the
+    same node and are computed once. The nodes are kept in topological
+    order, with the estimated bytes read and written by each one.
+    """
+
+    def __init__(self, grid) -> None:
+        self.grid = grid
+        self.nodes = {}
+        self.users = {}
+    # End def
+
+    def add(self, op: str, label: str, params: dict, inputs: tuple = (), io: int = 0) -> str:
+        """Add a node (or reuse the identical one) and get its key."""
+        key = make_key(op = op, params = params, inputs = list(inputs))
+        if key not in self.nodes:
+            self.nodes[key] = PlanNode(key, op, label, tuple(inputs), io)
+            self.users[key] = 0
+        # End if
+        self.users[key] += 1
+        return key
+    # End def
+
+    @property
+    def io(self) -> int:
+        """Estimated bytes read and written by the whole plan."""
+        return sum(x.io for x in self.nodes.values())
+    # End def
+
+    @property
+    def shared(self) -> int:
+        """Number of nodes used more than once."""
+        return sum(1 for x in self.users.values() if x > 1)
+    # End def
+
+    def __str__(self) -> str:
+        index = {key: idx for idx, key in enumerate(self.nodes)}
+        text  = "\n# ==================================== #"
+        text += "\n# Execution plan"
+        text += "\n# ------------------------------------ #"
+        text += f"\n    grid: {self.grid.cols} x {self.grid.rows} px of {self.grid.px_size}"
+        for key, node in self.nodes.items():
+            inputs = ', '.join(str(index[x]) for x in node.inputs)
+            text += f"\n    [{index[key]}] {node.op:<10} {node.label}"
+            if inputs: text += f" <- [{inputs}]"
+            if node.io: text += f"  ~{format_bytes(node.io)}"
+            if self.users[key] > 1: text += f"  (shared x{self.users[key]})"
+        # End for
+        text += "\n# ------------------------------------ #"
+        text += f"\n    nodes: {len(self.nodes)}, shared: {self.shared}, estimated I/O: {format_bytes(self.io)}"
+        return text
+    # End def
+# End class
+
+def format_bytes(size: int) -> str:
+    """Human readable size."""
+    for unit in ['B', 'KB', 'MB', 'GB']:
+        if size < 1024: return f"{size:.0f} {unit}"
+        size /= 1024
+    # End for
+    return f"{size:.1f} TB"
+# End def
+
+def buffer_method(layer: dict) -> str:
+    """Method of the buffer of a vector layer ("raster" or "vector"),
+    or None if it has no buffer (the proximity has priority).
+    """
+    if not layer["buffer"]["compute"] or layer["proximity"]["compute"]: return None
+    method = layer["buffer"]["method"]
+    if method == 'auto': method = 'vector' if layer["features"] <= BUFFER_FEATURES else 'raster'
+    return method
+# End def
+
+def aligned_node(plan: Plan, layer: dict) -> str:
+    """Add the nodes that align a layer to the grid of the plan: read,
+    reproject (rasters always, through a warped VRT; vectors only if
+    they are in another reference system), rasterize and buffer or
+    proximity (same rules as engine.prepare_layers).
+
+    Args:
+        plan (Plan): plan of the model.
+        layer (dict): layer specification (see SMCDAModel).
+
+    Returns:
+        str: key of the node of the layer aligned to the grid.
+    """
+    grid = plan.grid
+    grid_params = [grid.x_min, grid.y_max, grid.px_size, grid.cols, grid.rows, grid.wkt]
+    grid_bytes = grid.cols * grid.rows * PIXEL_BYTES
+    name = os.path.basename(layer["path"])
+
+    # Read: the version of every file of the layer
+    files = [(os.path.abspath(x), os.stat(x).st_mtime_ns, os.stat(x).st_size) for x in layer_files(layer["path"])]
+    params = {"files": files, "kind": layer["kind"], "sublayer": layer["sublayer"]}
+    # Sublayer of a vector with several (a shapefile has only its own)
+    if layer["sublayer"] not in (None, os.path.splitext(name)[0]): name = f"{name}:{layer['sublayer']}"
+    key = plan.add('read', name, params, io = sum(x[2] for x in files))
+
+    if layer["kind"] == 'raster':
+        params = {"grid": grid_params, "resampling": layer["resampling"]}
+        return plan.add('reproject', f"{name} ({layer['resampling']})", params, (key,))
+    # End if
+
+    if not osr.SpatialReference(wkt=layer["wkt"]).IsSame(osr.SpatialReference(wkt=grid.wkt)):
+        key = plan.add('reproject', name, {"wkt": grid.wkt}, (key,))
+    # End if
+    method = buffer_method(layer)
+    if method == 'vector':
+        params = {"grid": grid_params, "dist": layer["buffer"]["dist"]}
+        return plan.add('buffer', f"{name} (vector, {layer['buffer']['dist']})", params, (key,), grid_bytes)
+    # End if
+    label = name if layer["field"] is False else f"{name} ({layer['field']})"
+    key = plan.add('rasterize', label, {"grid": grid_params, "field": layer["field"]}, (key,), grid_bytes)
+    if layer["proximity"]["compute"]:
+        dist = layer["proximity"]["dist"]
+        return plan.add('proximity', f"{name} ({dist})", {"dist": dist}, (key,), 2 * grid_bytes)
+    elif method == 'raster':
+        dist = layer["buffer"]["dist"]
+        return plan.add('buffer', f"{name} (raster, {dist})", {"dist": dist}, (key,), 2 * grid_bytes)
+    # End if
+    return key
+# End def
+
+def build_plan(spec: dict) -> Plan:
+    """Build the plan of a model. Each layer of the spec gets the keys
+    of its nodes: "aligned_key" and, for the criterias, "normalized_key"
+    (the normalized values, before the `positive` transform, which is
+    shared by the layers that only differ in the transform or weight).
+
+    Args:
+        spec (dict): model specification (see SMCDAModel).
+
+    Returns:
+        Plan: the plan.
+    """
+    grid = spec["grid"]
+    grid_bytes = grid.cols * grid.rows * PIXEL_BYTES
+    plan = Plan(grid)
+
+    # Feasible region: product of the layers (index and stack passes)
+    inputs = []
+    for layer in spec["feasible"]:
+        layer["aligned_key"] = aligned_node(plan, layer)
+        inputs.append(layer["aligned_key"])
+    # End for
+    feasible = None
+    if inputs:
+        params = {"na": [x["na"] for x in spec["feasible"]]}
+        feasible = plan.add('feasible', f"{len(inputs)} layers", params, inputs, 2 * len(inputs) * grid_bytes)
+    # End if
+
+    # Criterias: statistics and stack passes read the aligned layer
+    transforms = []
+    for criteria in spec["criterias"]:
+        for layer in criteria["layers"]:
+            layer["aligned_key"] = aligned_node(plan, layer)
+            params = {"clip": layer["clip"], "na": layer["na"]}
+            label = f"{os.path.basename(layer['path'])} (clip {layer['clip']}, na {layer['na']})"
+            layer["normalized_key"] = plan.add('normalize', label, params, (layer["aligned_key"],), 3 * grid_bytes)
+            inputs = (layer["normalized_key"],) if feasible is None else (layer["normalized_key"], feasible)
+            label = f"{criteria['alias']}/{layer.get('alias', os.path.basename(layer['path']))}"
+            label += '' if layer["positive"] else ' (1 - x)'
+            transforms.append(plan.add('transform', label, {"positive": layer["positive"]}, inputs))
+        # End for
+    # End for
+    weights = [c["weight"] * x["weight"] for c in spec["criterias"] for x in c["layers"]]
+    plan.add('combine', f"{len(transforms)} layers", {"weights": weights}, transforms, grid_bytes)
+    return plan
+# End def
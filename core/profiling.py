@@ -0,0 +1,236 @@
+# ======================================================= #
+'''
+@ProjectName: SpatialMCDA
+@Author: FernandoCastano
+@Email: castano.fernando.martin@gmail.com
+@Version: 0.1.0
+'''
+# ------------------------------------------------------- #
+
+# ======================================================= #
+# Packages
+# ------------------------------------------------------- #
+import json
+import sys
+import time
+from contextlib import contextmanager
+from typing import NamedTuple
+from core.utils import *
+from core.messages import *
+
+try:
+    import resource
+except ImportError:
+    # Not available on Windows (no peak RSS)
+    resource = None
+# End try
+
+# ======================================================= #
+# Main code
+# ------------------------------------------------------- #
+
+class Usage(NamedTuple):
+    cpu: float
+    read_bytes: int
+    write_bytes: int
+    peak_rss: int
+# End class
+
+class StageRecord(NamedTuple):
+    stage: str
+    layer: str
+    depth: int
+    start: float
+    wall: float
+    cpu: float
+    read_bytes: int
+    write_bytes: int
+    disk_read_bytes: int
+    peak_rss: int
+    rss_growth: int
+    gdal_cache_used: int
+    gdal_cache_max: int
+# End class
+
+def _proc_io() -> dict:
+    """Counters of /proc/self/io (Linux): bytes read and written by
+    the process (rchar, wchar) and the ones that reached the disk
+    (read_bytes, write_bytes). Empty where it doesn't exist.
+    """
+    try:
+        with open('/proc/self/io') as file:
+            return {key: int(value) for key, value in (line.split(': ') for line in file)}
+        # End with
+    except (OSError, ValueError):
+        return {}
+    # End try
+# End def
+
+def usage() -> Usage:
+    """CPU seconds, bytes read and written and peak RSS (bytes) of this
+    process so far (0 for the counters the platform doesn't have)."""
+    io = _proc_io()
+    peak = 0
+    if resource is not None:
+        peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        # Kilobytes on Linux, bytes on macOS
+        if sys.platform != 'darwin': peak *= 1024
+    # End if
+    return Usage(time.process_time(), io.get('rchar', 0), io.get('wchar', 0), peak)
+# End def
+
+# Profiler of the current run (None when nothing is measured)
+_ACTIVE = None
+
+class Profiler:
+    """
+    Measures the stages of a run. Each stage (see `profile`) records
+    its wall and CPU time, the bytes read and written, the memory and
+    the state of the GDAL block cache. The memory is the peak RSS of
+    the process so far (`peak_rss`, cumulative: the operating system
+    only keeps the peak of the whole life of the process) and how much
+    the stage raised it (`rss_growth`, 0 if an earlier stage used more
+    memory). The work done by the worker processes is measured per
+    tile and added to the stage that is open (see engine.map_tiles).
+    The optional hook receives every record as soon as its stage
+    ends; an error in it is reported as a warning and doesn't stop
+    the run.
+    """
+
+    def __init__(self, hook = None) -> None:
+        self.hook = hook
+        self.records = []
+        self._frames = []
+        self._origin = time.perf_counter()
+    # End def
+
+    def __enter__(self) -> 'Profiler':
+        global _ACTIVE
+        _ACTIVE = self
+        return self
+    # End def
+
+    def __exit__(self, *args) -> None:
+        global _ACTIVE
+        _ACTIVE = None
+    # End def
+
+    def add_usage(self, value: Usage) -> None:
+        """Add the usage of a worker process to the innermost open
+        stage (it is passed to the outer ones when it ends)."""
+        if not self._frames: return
+        frame = self._frames[-1]
+        frame["cpu"] += value.cpu
+        frame["read_bytes"] += value.read_bytes
+        frame["write_bytes"] += value.write_bytes
+        frame["peak_rss"] = max(frame["peak_rss"], value.peak_rss)
+    # End def
+
+    def start(self, stage: str, layer: str = None) -> None:
+        self._frames.append({
+            "stage": stage, "layer": layer, "wall": time.perf_counter(),
+            "usage": usage(), "disk": _proc_io().get('read_bytes', 0),
+            "cpu": 0.0, "read_bytes": 0, "write_bytes": 0, "peak_rss": 0
+            })
+    # End def
+
+    def stop(self) -> StageRecord:
+        frame = self._frames.pop()
+        end = usage()
+        record = StageRecord(
+            stage = frame["stage"],
+            layer = frame["layer"],
+            depth = len(self._frames),
+            start = frame["wall"] - self._origin,
+            wall = time.perf_counter() - frame["wall"],
+            cpu = end.cpu - frame["usage"].cpu + frame["cpu"],
+            read_bytes = end.read_bytes - frame["usage"].read_bytes + frame["read_bytes"],
+            write_bytes = end.write_bytes - frame["usage"].write_bytes + frame["write_bytes"],
+            disk_read_bytes = _proc_io().get('read_bytes', 0) - frame["disk"],
+            peak_rss = max(end.peak_rss, frame["peak_rss"]),
+            rss_growth = max(0, end.peak_rss - frame["usage"].peak_rss),
+            gdal_cache_used = gdal.GetCacheUsed(),
+            gdal_cache_max = gdal.GetCacheMax()
+            )
+        # The outer stage includes the workers of the inner one
+        self.add_usage(Usage(frame["cpu"], frame["read_bytes"], frame["write_bytes"], frame["peak_rss"]))
+        self.records.append(record)
+        if self.hook is not None:
+            try:
+                self.hook(record)
+            except Exception as error:
+                HOOK_WARNING(error)
+            # End try
+        # End if
+        return record
+    # End def
+# End class
+
+def active() -> Profiler:
+    """Profiler of the current run, or None."""
+    return _ACTIVE
+# End def
+
+@contextmanager
+def profile(stage: str, layer: str = None):
+    """Measure a stage (and layer) of the run if a Profiler is active."""
+    if _ACTIVE is None:
+        yield
+        return
+    # End if
+    profiler = _ACTIVE
+    profiler.start(stage, layer)
+    try:
+        yield
+    finally:
+        profiler.stop()
+    # End try
+# End def
+
+class ProfileReport:
+    """
+    Report of a profiled run: the records of every stage (`start` is
+    relative to the beginning of the run and `depth` is the nesting
+    level; 0 is the whole run) and the path of the result.
+    """
+
+    def __init__(self, records: list, output: str = None) -> None:
+        self.records = records
+        self.output = output
+    # End def
+
+    def stages(self, layer: bool = False) -> list:
+        """Records of the stages (with `layer`, only the per layer ones)."""
+        return [x for x in self.records if (x.layer is not None) == layer]
+    # End def
+
+    def to_dict(self) -> dict:
+        return {
+            "output": self.output,
+            "gdal": gdal.__version__,
+            "records": [x._asdict() for x in self.records]
+            }
+    # End def
+
+    def save(self, file_name: str) -> str:
+        """Write the report as JSON."""
+        with open(file_name, 'w') as file:
+            json.dump(self.to_dict(), file, indent=2)
+        # End with
+        return file_name
+    # End def
+
+    def __str__(self) -> str:
+        text  = "\n# ==================================== #"
+        text += "\n# Profile"
+        text += "\n# ------------------------------------ #"
+        text += f"\n    {'stage':<28}{'wall (s)':>10}{'cpu (s)':>10}{'read (MB)':>11}{'write (MB)':>11}"
+        text += f"{'peak so far (MB)':>18}{'+rss (MB)':>11}"
+        for x in sorted(self.records, key=lambda x: (x.start, x.depth)):
+            name = '  ' * x.depth + x.stage + ('' if x.layer is None else f" [{x.layer}]")
+            text += f"\n    {name:<28}{x.wall:>10.2f}{x.cpu:>10.2f}{x.read_bytes / 1024**2:>11.1f}"
+            text += f"{x.write_bytes / 1024**2:>11.1f}{x.peak_rss / 1024**2:>18.0f}{x.rss_growth / 1024**2:>11.0f}"
+        # End for
+        return text
+    # End def
+# End class
@@ -0,0 +1,200 @@
+# ======================================================= #
+'''
+@ProjectName: SpatialMCDA
+@Author: FernandoCastano
+@Email: castano.fernando.martin@gmail.com
+@Version: 0.1.0
+'''
+# ------------------------------------------------------- #
+
+# ======================================================= #
+# Packages
+# ------------------------------------------------------- #
+import json
+import math
+import numpy as np
+from core.utils import *
+
+# ======================================================= #
+# Main code
+# ------------------------------------------------------- #
+
+# Number of bins of the histograms
+HISTOGRAM_BINS = 1024
+
+class StreamingStats:
+    """
+    Statistics of a layer gathered in a single pass: minimum, maximum,
+    number of pixels with and without data, and a histogram with a
+    fixed number of bins. The bins have a width that is a power of 2
+    and start at a multiple of it, so when the range grows (or two
+    partial statistics are merged) the bins are joined exactly, without
+    a second pass over the data.
+    """
+
+    def __init__(self, bins: int = HISTOGRAM_BINS) -> None:
+        self.bins = bins
+        self.min = math.inf
+        self.max = -math.inf
+        self.count = 0
+        self.nodata = 0
+        self.width = None
+        self.low = None
+        self.histogram = np.zeros(bins, dtype=np.int64)
+    # End def
+
+    def _cover(self, low: float, high: float, width: float = None) -> None:
+        """Grow the bins (doubling their width) until [low, high] fits."""
+        if self.width is None:
+            span = max(high - low, abs(high) * 1e-9, 1e-12)
+            new_width = 2.0 ** math.ceil(math.log2(span / self.bins))
+            new_low = None
+        else:
+            low, high = min(low, self.min), max(high, self.max)
+            new_width, new_low = self.width, self.low
+        # End if
+        if width is not None: new_width = max(new_width, width)
+        while True:
+            start = math.floor(low / new_width) * new_width
+            if start + self.bins * new_width >= high: break
+            new_width *= 2
+        # End while
+        if (new_width, start) == (self.width, new_low): return
+        # Join the current bins into the new ones
+        if self.width is not None: self.histogram = self._rebin(new_width, start)
+        self.width, self.low = new_width, start
+    # End def
+
+    def _rebin(self, width: float, low: float) -> np.ndarray:
+        """Histogram expressed in other (wider and aligned) bins."""
+        centers = self.low + (np.arange(self.bins) + 0.5) * self.width
+        idx = np.clip(((centers - low) // width).astype(np.int64), 0, self.bins - 1)
+        return np.bincount(idx, weights=self.histogram, minlength=self.bins).astype(np.int64)
+    # End def
+
+    def update(self, values: np.ndarray) -> None:
+        """Add the values of a window (NaN are counted as no data)."""
+        valid = ~np.isnan(values)
+        data = values[valid]
+        self.nodata += int(values.size - data.size)
+        if data.size == 0: return
+        low, high = float(data.min()), float(data.max())
+        self._cover(low, high)
+        self.min, self.max = min(self.min, low), max(self.max, high)
+        self.count += int(data.size)
+        idx = np.clip(((data - self.low) // self.width).astype(np.int64), 0, self.bins - 1)
+        self.histogram += np.bincount(idx, minlength=self.bins)
+    # End def
+
+    def merge(self, other: 'StreamingStats') -> None:
+        """Add the statistics of other part of the layer."""
+        self.nodata += other.nodata
+        if other.count == 0: return
+        self._cover(other.min, other.max, other.width)
+        self.histogram += other._rebin(self.width, self.low)
+        self.min, self.max = min(self.min, other.min), max(self.max, other.max)
+        self.count += other.count
+    # End def
+
+    def percentile(self, q: float) -> float:
+        """Approximate percentile (0-100) of the layer, interpolated
+        inside the bins and bounded by the exact min and max.
+        """
+        if self.count == 0: return math.nan
+        target = self.count * q / 100
+        cumulative = np.cumsum(self.histogram)
+        idx = int(np.searchsorted(cumulative, target))
+        idx = min(idx, self.bins - 1)
+        before = cumulative[idx - 1] if idx > 0 else 0
+        inside = self.histogram[idx]
+        fraction = (target - before) / inside if inside > 0 else 0.0
+        value = self.low + (idx + fraction) * self.width
+        return float(min(max(value, self.min), self.max))
+    # End def
+
+    def to_dict(self) -> dict:
+        return {
+            "bins": self.bins, "min": self.min, "max": self.max,
+            "count": self.count, "nodata": self.nodata,
+            "width": self.width, "low": self.low,
+            "histogram": self.histogram.tolist()
+            }
+    # End def
+
+    @classmethod
+    def from_dict(cls, data: dict) -> 'StreamingStats':
+        stats = cls(data["bins"])
+        stats.min, stats.max = data["min"], data["max"]
+        stats.count, stats.nodata = data["count"], data["nodata"]
+        stats.width, stats.low = data["width"], data["low"]
+        stats.histogram = np.array(data["histogram"], dtype=np.int64)
+        return stats
+    # End def
+# End class
+
+def stored_stats(file_name: str, bins: int = HISTOGRAM_BINS) -> StreamingStats:
+    """Statistics of a raster from what GDAL already stored: the exact
+    min and max (STATISTICS_* metadata, not the approximate ones) and
+    the histogram, taken from the default histogram or, if there isn't
+    one, from the smallest overview. It doesn't read the full
+    resolution data.
+
+    Args:
+        file_name (str): path_dir/name of the raster.
+        bins (int, optional): number of bins. Defaults to HISTOGRAM_BINS.
+
+    Returns:
+        StreamingStats: the statistics, or None if the raster has no
+        exact stored statistics (or no histogram nor overviews).
+    """
+    band = gdal.Open(file_name).GetRasterBand(1)
+    low = band.GetMetadataItem('STATISTICS_MINIMUM')
+    high = band.GetMetadataItem('STATISTICS_MAXIMUM')
+    if (low is None) or (high is None): return None
+    # Computed from overviews or a subsample: the range may be too short
+    if (band.GetMetadataItem('STATISTICS_APPROXIMATE') or '').upper() == 'YES': return None
+    low, high = float(low), float(high)
+    pixels = band.XSize * band.YSize
+
+    stats = StreamingStats(bins)
+    default = band.GetDefaultHistogram(force=False)
+    if default is not None:
+        # (min, max, number of buckets, counts)
+        h_min, h_max, buckets, counts = default
+        centers = h_min + (np.arange(buckets) + 0.5) * (h_max - h_min) / buckets
+        stats._cover(low, high)
+        idx = np.clip(((centers - stats.low) // stats.width).astype(np.int64), 0, bins - 1)
+        stats.histogram = np.bincount(idx, weights=counts, minlength=bins).astype(np.int64)
+        stats.count = int(sum(counts))
+    elif band.GetOverviewCount() > 0:
+        overview = band.GetOverview(band.GetOverviewCount() - 1)
+        values = overview.ReadAsArray().astype(np.float64)
+        if band.GetNoDataValue() is not None: values[values == band.GetNoDataValue()] = np.nan
+        stats.update(values)
+        # Scale the counts to the full resolution
+        scale = pixels / values.size
+        stats.histogram = np.round(stats.histogram * scale).astype(np.int64)
+        stats.count = int(stats.histogram.sum())
+    else:
+        return None
+    # End if
+    stats._cover(low, high)
+    stats.min, stats.max = low, high
+    stats.nodata = max(0, pixels - stats.count)
+    return stats
+# End def
+
+def load_stats(file_name: str) -> StreamingStats:
+    """Read statistics saved with save_stats (None if they don't exist)."""
+    if not os.path.exists(file_name): return None
+    with open(file_name) as file:
+        return StreamingStats.from_dict(json.load(file))
+    # End with
+# End def
+
+def save_stats(stats: StreamingStats, file_name: str) -> None:
+    """Save statistics as JSON."""
+    with open(file_name, 'w') as file:
+        json.dump(stats.to_dict(), file)
+    # End with
+# End def
@@ -11,15 +11,56 @@
 # Packages
 # ------------------------------------------------------- #
 import os
-from osgeo import gdal, ogr, osr
+import fnmatch
+import importlib
+from concurrent.futures import ThreadPoolExecutor
+from functools import lru_cache
+from typing import NamedTuple
+from xml.sax.saxutils import escape
+from core.messages import SUBLAYER_ERROR
 
-path1 = "C:/Users/casta/Downloads/radios_eph/radios_eph.shp"
-path2 = "C:/Users/casta/Downloads/GeogToWGS84GeoKey5.tif"
+# ======================================================= #
+# Lazy modules
+# ------------------------------------------------------- #
+
+class LazyModule:
+    """
+    Module that is imported the first time one of its attributes is
+    used. GDAL, pyproj (and the engine, with numpy) take a long time
+    to load and are only needed to read layers or run a model, so
+    importing the package or building a model doesn't load them.
+    """
+
+    def __init__(self, name: str) -> None:
+        self._name = name
+        self._module = None
+    # End def
+
+    def __getattr__(self, attr: str):
+        if self._module is None: self._module = importlib.import_module(self._name)
+        return getattr(self._module, attr)
+    # End def
+
+    def __repr__(self) -> str:
+        state = 'loaded' if self._module is not None else 'not loaded'
+        return f"<lazy module '{self._name}' ({state})>"
+    # End def
+# End class
+
+gdal = LazyModule('osgeo.gdal')
+ogr = LazyModule('osgeo.ogr')
+osr = LazyModule('osgeo.osr')
+pyproj = LazyModule('pyproj')
 
 # ======================================================= #
 # Main code
 # ------------------------------------------------------- #
 
+# Supported layers: extension -> GDAL driver. GeoPackage and
+# FlatGeobuf have a built-in spatial index; shapefiles get a .qix
+# (see ensure_spatial_index)
+LAYER_DRIVERS = {'tif': 'GTiff', 'shp': 'ESRI Shapefile', 'gpkg': 'GPKG', 'fgb': 'FlatGeobuf'}
+
 def get_file_extension(file_name: str) -> str:
     """Get the extension of the file. Returns the file extension. Useful for determining if the input layer is a raster or a vector.
 
@@ -36,109 +77,377 @@ def get_file_extension(file_name: str) -> str:
     return ext[1:]
 # End def
 
-def get_vector_data(file_name: str) -> list:
-    """_summary_
+class SublayerMetadata(NamedTuple):
+    """Metadata of a sublayer of a vector dataset (`spatial` is False
+    for the tables without geometries, e.g. the styles that QGIS
+    saves in a GeoPackage)."""
+    name: str
+    projection_name: str
+    srs_wkt: str
+    extent: tuple
+    feature_count: int
+    fields: tuple
+    spatial: bool
+# End class
+
+class LayerMetadata(NamedTuple):
+    """Metadata of a layer, gathered by `probe_layer` with a single
+    open of the dataset. Raster only attributes are None for vectors
+    and vice versa. A vector is read from one of its sublayers
+    (`sublayer`): the reference system, extent, fields and features
+    are the ones of that sublayer; `sublayers` describes all of them.
+    """
+    path: str
+    kind: str
+    driver: str
+    projection_name: str
+    srs_wkt: str
+    extent: tuple
+    geotransform: tuple
+    size: tuple
+    dtype: str
+    nodata: float
+    fields: tuple
+    feature_count: int
+    sublayers: tuple
+    sublayer: str
+# End class
+
+# Side files of an ESRI shapefile that define its content
+SHAPEFILE_PARTS = ['.shp', '.shx', '.dbf', '.prj', '.cpg']
+
+def layer_files(file_name: str) -> list:
+    """Get the files that make up a layer (a shapefile is split in
+    several files with the same name).
 
     Args:
-        file_name (str): _description_
-        SubLayer (str | int, optional): _description_. Defaults to None.
+        file_name (str): path_dir/name of the layer.
 
     Returns:
-        list: _description_
+        list: existing files of the layer.
     """
+    if get_file_extension(file_name) != 'shp': return [file_name]
+    name, ext = os.path.splitext(file_name)
+    return [name + x for x in SHAPEFILE_PARTS if os.path.exists(name + x)]
+# End def
 
-    # Dictionary to populate
-    info_dict = {}
-    # Get the datasource
-    datasource = ogr.Open(file_name)
+# Probed layers: (path, versions of its files) -> LayerMetadata
+_PROBES = {}
 
-    # Number of sublayers and where store the info of each sublayer
-    info_dict["sublayers_count"] = datasource.GetLayerCount()
-    info_dict["sublayers"] = {}
+def _file_key(file_name: str) -> tuple:
+    """Key that identifies a version of a layer: absolute path and
+    modification time and size of each of its files (see layer_files),
+    so an edited side file of a shapefile (e.g. the .dbf or the .prj)
+    changes it too.
+    """
+    stats = [os.stat(x) for x in layer_files(file_name)]
+    return os.path.abspath(file_name), tuple((x.st_mtime_ns, x.st_size) for x in stats)
+# End def
 
+def _probe_raster(file_name: str) -> LayerMetadata:
+    """Open a raster once and gather its metadata."""
+    dataset = gdal.Open(file_name)
+    geom = dataset.GetGeoTransform()
+    cols, rows = dataset.RasterXSize, dataset.RasterYSize
+    x_min, y_max = geom[0], geom[3]
+    x_max = x_min + geom[1] * cols
+    y_min = y_max + geom[5] * rows
+    srs = dataset.GetSpatialRef()
+    band = dataset.GetRasterBand(1)
+    return LayerMetadata(
+        path = file_name,
+        kind = 'raster',
+        driver = dataset.GetDriver().ShortName,
+        projection_name = srs.GetName() if srs is not None else None,
+        srs_wkt = dataset.GetProjection(),
+        extent = (x_min, y_min, x_max, y_max),
+        geotransform = tuple(geom),
+        size = (cols, rows),
+        dtype = gdal.GetDataTypeName(band.DataType),
+        nodata = band.GetNoDataValue(),
+        fields = (),
+        feature_count = None,
+        sublayers = (),
+        sublayer = None
+        )
+# End def
+
+def _probe_vector(file_name: str) -> LayerMetadata:
+    """Open a vector once and gather the metadata of each of its
+    sublayers (the layer is described by one of them, see
+    select_sublayer).
+    """
+    datasource = ogr.Open(file_name)
+    sublayers = []
     # Loop through "sub"layers (thinking the shp as a "layer" and not as a ds)
-    for layer_idx in range(info_dict["sublayers_count"]):
-        
-        #info_dict["sublayers"].append({})
-        
+    for layer_idx in range(datasource.GetLayerCount()):
         layer = datasource.GetLayer(layer_idx)
-        name = layer.GetName()
-        info_dict["sublayers"][name] = {}
-        # Return the name of the spatial reference system
-        SpatialRef = layer.GetSpatialRef().GetName()
-        info_dict["sublayers"][name]["SpatialRef"] = SpatialRef
-        # Return the extent of the layer (measure by crs)
-        info_dict["sublayers"][name]["extent"] = layer.GetExtent()
-        # Return number of features (objects/vectors)
-        FeaturesCount = layer.GetFeatureCount()
-        info_dict["sublayers"][name]["FeaturesCount"] = FeaturesCount
-        # Return number of fields (variables)
+        srs = layer.GetSpatialRef()
         layer_info = layer.GetLayerDefn()
-        FieldsCount = layer_info.GetFieldCount()
-        info_dict["sublayers"][name]["FieldsCount"] = FieldsCount
-        # Loop through the fields in the layer and get his names
-        name_list = []
-        for i in range(FieldsCount):
-            name_list.append(layer_info.GetFieldDefn(i).GetName())
-        # End for
-        info_dict["sublayers"][name]["Fields"] = name_list
+        fields = tuple(layer_info.GetFieldDefn(i).GetName() for i in range(layer_info.GetFieldCount()))
+        spatial = layer.GetGeomType() != ogr.wkbNone
+        x_min, x_max, y_min, y_max = layer.GetExtent() if spatial else (0.0, 0.0, 0.0, 0.0)
+        sublayers.append(SublayerMetadata(
+            name = layer.GetName(),
+            projection_name = srs.GetName() if srs is not None else None,
+            srs_wkt = srs.ExportToWkt() if srs is not None else '',
+            extent = (x_min, y_min, x_max, y_max),
+            feature_count = layer.GetFeatureCount(),
+            fields = fields,
+            spatial = spatial
+            ))
     # End for
+    return LayerMetadata(
+        path = file_name,
+        kind = 'vector',
+        driver = datasource.GetDriver().GetName(),
+        projection_name = None,
+        srs_wkt = '',
+        extent = None,
+        geotransform = None,
+        size = None,
+        dtype = None,
+        nodata = None,
+        fields = (),
+        feature_count = None,
+        sublayers = tuple(sublayers),
+        sublayer = None
+        )
+# End def
+
+def select_sublayer(metadata: LayerMetadata, sublayer: str = None) -> LayerMetadata:
+    """Describe a vector by one of its sublayers: its reference
+    system, extent, fields and number of features.
 
-    name_list = []
-    for x, val in info_dict["sublayers"].items():
-        name_list.extend(val["Fields"])
-        pass
+    Args:
+        metadata (LayerMetadata): metadata of the vector (see probe_layer).
+        sublayer (str, optional): name of the sublayer. Defaults to
+        the one that already describes it or, if none, the first one
+        with geometries (e.g. not the styles of QGIS).
+
+    Returns:
+        LayerMetadata: metadata of the vector read from the sublayer.
+    """
+    if metadata.kind != 'vector': return metadata
+    if sublayer is None: sublayer = metadata.sublayer
+    if sublayer is None: sublayer = next((x.name for x in metadata.sublayers if x.spatial), None)
+    chosen = [x for x in metadata.sublayers if (x.name == sublayer) and x.spatial]
+    if not chosen: raise RuntimeError(SUBLAYER_ERROR)
+    sub = chosen[0]
+    return metadata._replace(
+        projection_name = sub.projection_name,
+        srs_wkt = sub.srs_wkt,
+        extent = sub.extent,
+        fields = sub.fields,
+        feature_count = sub.feature_count,
+        sublayer = sub.name
+        )
+# End def
+
+def probe_layer(file_name: str, sublayer: str = None) -> LayerMetadata:
+    """Get the metadata of a layer opening the dataset only once. The
+    result is cached in the process by path and the modification time
+    and size of its files, so reusing a file (in several criterias or layers, or other
+    sublayer of it) doesn't open it again, and a modified file is
+    probed again.
+
+    Args:
+        file_name (str): path_dir/name of the layer.
+        sublayer (str, optional): sublayer of a vector (see
+        select_sublayer). Defaults to the first one with geometries.
+
+    Returns:
+        LayerMetadata: metadata of the layer.
+    """
+    key = _file_key(file_name)
+    if key not in _PROBES:
+        if get_file_extension(file_name) == 'tif':
+            _PROBES[key] = _probe_raster(file_name)
+        else:
+            _PROBES[key] = _probe_vector(file_name)
+        # End if
+    # End if
+    return select_sublayer(_PROBES[key], sublayer)
+# End def
+
+# Threads that probe layers at once (GDAL releases the GIL while it
+# opens and reads the files, so their latencies overlap)
+PROBE_WORKERS = 16
+
+def probe_layers(file_names: list, workers: int = PROBE_WORKERS) -> dict:
+    """Probe several layers concurrently (see probe_layer). The errors
+    are returned instead of raised, so every file is probed and the
+    caller can report all the problems together.
+
+    Args:
+        file_names (list): paths of the layers (repeated paths are
+            probed once).
+        workers (int, optional): number of threads. Defaults to
+            PROBE_WORKERS.
+
+    Returns:
+        dict: path -> LayerMetadata, or the exception raised probing it.
+    """
+    def probe(file_name: str):
+        try:
+            return probe_layer(file_name)
+        except Exception as error:
+            return error
+        # End try
+    # End def
+    file_names = list(dict.fromkeys(file_names))
+    if not file_names: return {}
+    with ThreadPoolExecutor(max(1, min(workers, len(file_names)))) as pool:
+        return dict(zip(file_names, pool.map(probe, file_names)))
+    # End with
+# End def
+
+def find_layers(directory: str, pattern: str = '*') -> list:
+    """Supported layers (see LAYER_DRIVERS) of a directory whose name
+    matches a pattern, sorted by name.
+
+    Args:
+        directory (str): folder of the layers.
+        pattern (str, optional): glob pattern of the names (e.g.
+            "census_*"). Defaults to '*'.
+
+    Returns:
+        list: paths of the layers.
+    """
+    names = fnmatch.filter(sorted(os.listdir(directory)), pattern)
+    return [
+        os.path.join(directory, x) for x in names
+        if get_file_extension(x) in LAYER_DRIVERS and os.path.isfile(os.path.join(directory, x))
+        ]
+# End def
+
+def file_alias(file_name: str) -> str:
+    """Alias of a layer from its file name: the name without the
+    extension, with '_' instead of the non alphanumeric chars.
+    """
+    name = os.path.splitext(os.path.basename(file_name))[0]
+    return ''.join(x if x.isalnum() else '_' for x in name)
+# End def
+
+def ensure_spatial_index(file_name: str) -> bool:
+    """Build the spatial index (.qix) of a shapefile if it doesn't
+    have one, so the spatial filters only decode the features that
+    intersect them. GeoPackage and FlatGeobuf already have an index.
+    Read only files are left as they are.
+
+    Args:
+        file_name (str): path_dir/name of the vector.
+
+    Returns:
+        bool: whether the layer has a spatial index.
+    """
+    if get_file_extension(file_name) != 'shp': return True
+    if os.path.exists(os.path.splitext(file_name)[0] + '.qix'): return True
+    try:
+        datasource = ogr.Open(file_name, 1)
+    except Exception:
+        return False
+    # End try
+    if datasource is None: return False
+    for layer_idx in range(datasource.GetLayerCount()):
+        name = datasource.GetLayer(layer_idx).GetName()
+        datasource.ExecuteSQL(f'CREATE SPATIAL INDEX ON "{name}"')
+    # End for
+    datasource = None
+    return os.path.exists(os.path.splitext(file_name)[0] + '.qix')
+# End def
+
+def count_features(file_name: str, extent: tuple, sublayer: str = None) -> int:
+    """Number of features of a vector (of the sublayer it is read
+    from, see select_sublayer) that intersect an extent. The spatial
+    index of the layer is used, so only the features inside it are
+    read.
+
+    Args:
+        file_name (str): path_dir/name of the vector.
+        extent (tuple): x_min, y_min, x_max, y_max in the reference
+            system of the vector.
+        sublayer (str, optional): name of the sublayer. Defaults to
+            the first one with geometries.
+
+    Returns:
+        int: number of features.
+    """
+    datasource = ogr.Open(file_name)
+    layer = datasource.GetLayerByName(probe_layer(file_name, sublayer).sublayer)
+    layer.SetSpatialFilterRect(*extent)
+    return layer.GetFeatureCount()
+# End def
+
+def get_vector_data(file_name: str, sublayer: str = None) -> list:
+    """Get the information of the sublayers of a vector and the names
+    of the fields of the sublayer it is read from.
+
+    Args:
+        file_name (str): path_dir/name of the vector.
+        sublayer (str, optional): name of the sublayer. Defaults to
+        the first one with geometries.
+
+    Returns:
+        list: dictionary with the info of the sublayers, list of the
+        fields' names.
+    """
+    metadata = probe_layer(file_name, sublayer)
+    # Dictionary to populate
+    info_dict = {}
+    info_dict["sublayers_count"] = len(metadata.sublayers)
+    info_dict["sublayers"] = {}
+    for sub in metadata.sublayers:
+        x_min, y_min, x_max, y_max = sub.extent
+        info_dict["sublayers"][sub.name] = {
+            "SpatialRef": sub.projection_name,
+            # Same order as ogr.Layer.GetExtent
+            "extent": (x_min, x_max, y_min, y_max),
+            "FeaturesCount": sub.feature_count,
+            "FieldsCount": len(sub.fields),
+            "Fields": list(sub.fields)
+            }
     # End for
     # Return the list of fields' names
-    return info_dict, name_list
+    return info_dict, list(metadata.fields)
 # End def
 
 
 def get_vector_proj(file_name: str) -> str:
-    """_summary_
+    """Get the name of the spatial reference system of a vector.
 
     Args:
-        file_name (str): _description_
+        file_name (str): path_dir/name of the vector.
 
     Returns:
-        str: _description_
+        str: name of the spatial reference system.
     """
-    # Get spatial reference information
-    dataset = ogr.Open(file_name)    
-    layer = dataset.GetLayer()
-    spatialRef = layer.GetSpatialRef()
-    # Return the name of the spatial reference system
-    return spatialRef.GetName()
+    return probe_layer(file_name).projection_name
 # End def
 
 
 def get_raster_proj(file_name: str):
-    """_summary_
+    """Get the name of the spatial reference system of a raster.
 
     Args:
-        file_name (str): _description_
+        file_name (str): path_dir/name of the raster.
 
     Returns:
-        _type_: _description_
+        str: name of the spatial reference system.
     """
-    # Get spatial reference information
-    dataset = gdal.Open(file_name)
-    # Return the name of the spatial reference system
-    return dataset.GetSpatialRef().GetName()
+    return probe_layer(file_name).projection_name
 # End defs
 
 def get_raster_macrogeom(file_name: str) -> tuple:
-    """_summary_
+    """Get the origin and the pixel size of a raster.
 
     Args:
-        file_name (str): _description_
+        file_name (str): path_dir/name of the raster.
 
     Returns:
-        tuple: _description_
+        tuple: x_min, y_max, px_size.
     """
-    # Get spatial reference information
-    dataset = gdal.Open(file_name)
-    geom = dataset.GetGeoTransform()
+    geom = probe_layer(file_name).geotransform
     # Set data needed
     x_min = geom[0]
     px_size = geom[1]
@@ -147,26 +456,127 @@ def get_raster_macrogeom(file_name: str) -> tuple:
 # End def
 
 def get_vector_macrogeom(file_name: str) ->tuple:
-    """_summary_
+    """Get the extent of a vector.
 
     Args:
-        file_name (str): _description_
+        file_name (str): path_dir/name of the vector.
 
     Returns:
-        tuple: _description_
+        tuple: x_min, y_min, x_max, y_max.
     """
-    # Get spatial reference information
-    dataset = ogr.Open(file_name)    
-    layer = dataset.GetLayer()
-    geom = layer.GetExtent()
-    # Set data needed
-    x_min = geom[0]
-    x_max = geom[1]
-    y_min = geom[2]
-    y_max = geom[3]
-    return x_min, y_min, x_max, y_max
+    return probe_layer(file_name).extent
+# End def
+
+@lru_cache(maxsize=None)
+def check_epsg(epsg: int) -> None:
+    """Validate an EPSG code (pyproj raises a CRSError if it doesn't
+    exist). The valid codes are memoized, so building models or
+    changing their crs doesn't build the CRS again. None is valid
+    (the model uses the reference system of its first layer).
+
+    Args:
+        epsg (int): EPSG code.
+    """
+    if epsg is not None: pyproj.CRS(epsg)
+# End def
+
+@lru_cache(maxsize=None)
+def get_epsg_wkt(epsg: int) -> str:
+    """Get the WKT of an EPSG code (memoized).
+
+    Args:
+        epsg (int): EPSG code.
+
+    Returns:
+        str: WKT of the spatial reference system.
+    """
+    srs = osr.SpatialReference()
+    srs.ImportFromEPSG(epsg)
+    return srs.ExportToWkt()
 # End def
 
-def reproject():
-    pass
+def transform_extent(extent: tuple, src_wkt: str, dst_wkt: str) -> tuple:
+    """Transform an extent between two spatial reference systems. The
+    result is the bounding box of the transformed extent (densified
+    along the edges, so curved borders are covered).
+
+    Args:
+        extent (tuple): x_min, y_min, x_max, y_max in src_wkt units.
+        src_wkt (str): WKT of the source spatial reference system.
+        dst_wkt (str): WKT of the target spatial reference system.
+
+    Returns:
+        tuple: x_min, y_min, x_max, y_max in dst_wkt units.
+    """
+    src = osr.SpatialReference(wkt=src_wkt)
+    dst = osr.SpatialReference(wkt=dst_wkt)
+    # Same system, nothing to do
+    if src.IsSame(dst): return tuple(extent)
+    # Always x/y (east/north) order, regardless of the authority
+    src.SetAxisMappingStrategy(osr.OAMS_TRADITIONAL_GIS_ORDER)
+    dst.SetAxisMappingStrategy(osr.OAMS_TRADITIONAL_GIS_ORDER)
+    transform = osr.CoordinateTransformation(src, dst)
+    x_min, y_min, x_max, y_max = extent
+    return transform.TransformBounds(x_min, y_min, x_max, y_max, 21)
+# End def
+
+# Resampling methods allowed to align rasters to the grid of the model
+RESAMPLING_METHODS = ['near', 'bilinear', 'cubic', 'cubicspline', 'lanczos', 'average', 'mode', 'max', 'min', 'med']
+
+# Template of a vector layer transformed on the fly (OGR VRT)
+_WARPED_LAYER = """  <OGRVRTWarpedLayer>
+    <OGRVRTLayer name="{name}">
+      <SrcDataSource>{source}</SrcDataSource>
+      <SrcLayer>{name}</SrcLayer>
+    </OGRVRTLayer>
+    <TargetSRS>{wkt}</TargetSRS>
+  </OGRVRTWarpedLayer>
+"""
+
+def reproject(file_name: str, output: str, wkt: str, bounds: tuple, size: tuple, resampling: str = 'near',
+              sublayer: str = None) -> str:
+    """Write a VRT that aligns a layer to a grid on the fly, without
+    writing a reprojected copy of the data. Rasters are warped to the
+    reference system, origin and pixel size of the grid (float32, NaN
+    outside the data). Vectors (the sublayer they are read from, with
+    the same name) are transformed to the reference system of the
+    grid while their features are read (the grid parameters are not
+    used).
+
+    Args:
+        file_name (str): path_dir/name of the layer.
+        output (str): path_dir/name of the VRT.
+        wkt (str): WKT of the reference system of the grid.
+        bounds (tuple): x_min, y_min, x_max, y_max of the grid.
+        size (tuple): columns, rows of the grid.
+        resampling (str, optional): resampling method for rasters (one
+        of RESAMPLING_METHODS). Defaults to 'near'.
+        sublayer (str, optional): sublayer of a vector. Defaults to the
+        first one with geometries.
+
+    Returns:
+        str: path of the VRT.
+    """
+    source = os.path.abspath(file_name)
+    if get_file_extension(file_name) == 'tif':
+        options = gdal.WarpOptions(
+            format = 'VRT',
+            dstSRS = wkt,
+            outputBounds = bounds,
+            width = size[0],
+            height = size[1],
+            resampleAlg = resampling,
+            outputType = gdal.GDT_Float32,
+            dstNodata = float('nan')
+            )
+        dataset = gdal.Warp(output, source, options=options)
+        dataset = None
+    else:
+        name = probe_layer(file_name, sublayer).sublayer
+        layers = _WARPED_LAYER.format(name=escape(name), source=escape(source), wkt=escape(wkt))
+        with open(output, 'w') as file:
+            file.write(f"<OGRVRTDataSource>\n{layers}</OGRVRTDataSource>\n")
+        # End with
+    # End if
+    return output
 # End def
\ No newline at end of file
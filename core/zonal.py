@@ -0,0 +1,334 @@
+# ======================================================= #
+'''
+@ProjectName: SpatialMCDA
+@Author: FernandoCastano
+@Email: castano.fernando.martin@gmail.com
+@Version: 0.1.0
+'''
+# ------------------------------------------------------- #
+
+# ======================================================= #
+# Packages
+# ------------------------------------------------------- #
+import csv
+import numpy as np
+from core.utils import *
+from core.cache import FileCache, file_fingerprint, make_key
+from core.engine import Grid, burn_tile, iter_windows, map_tiles, open_dataset, read_values, write_tiles
+from core.profiling import profile
+
+# ======================================================= #
+# Main code
+# ------------------------------------------------------- #
+
+# Field with the number of each zone (1..n, 0 is out of every zone)
+ZONE_FIELD = 'zone_id'
+
+# Bins of the histograms of the indicator in [0, 1] (percentiles
+# with a resolution of 1 / ZONE_BINS)
+ZONE_BINS = 256
+
+# Metadata item of the GeoPackage of the zones with their number
+ZONE_COUNT = 'ZONE_COUNT'
+
+# Zones whose percentiles are computed at once (bounds the memory
+# of the cumulative histograms)
+ZONE_CHUNK = 4096
+
+def zone_layer(file_name: str, grid: Grid, output: str, sublayer: str) -> int:
+    """Copy the polygons of the zones (a sublayer of the vector) to a
+    GeoPackage in the reference system of the grid, with their number
+    (1..n, in reading order) in ZONE_FIELD. The number of zones read
+    (the features without geometry are numbered too) is stored in the
+    ZONE_COUNT metadata item of the layer.
+
+    Args:
+        file_name (str): path_dir/name of the zones.
+        grid (Grid): grid of the result.
+        output (str): path_dir/name of the GeoPackage.
+        sublayer (str): name of the sublayer of the zones.
+
+    Returns:
+        int: number of zones.
+    """
+    zones = ogr.Open(file_name)
+    layer = zones.GetLayerByName(sublayer)
+    src = layer.GetSpatialRef()
+    dst = osr.SpatialReference(wkt=grid.wkt)
+    transform = None
+    if (src is not None) and not src.IsSame(dst):
+        # Always x/y (east/north) order, regardless of the authority
+        src.SetAxisMappingStrategy(osr.OAMS_TRADITIONAL_GIS_ORDER)
+        dst.SetAxisMappingStrategy(osr.OAMS_TRADITIONAL_GIS_ORDER)
+        transform = osr.CoordinateTransformation(src, dst)
+    # End if
+    datasource = ogr.GetDriverByName('GPKG').CreateDataSource(output)
+    target = datasource.CreateLayer('zones', dst, ogr.wkbUnknown)
+    target.CreateField(ogr.FieldDefn(ZONE_FIELD, ogr.OFTInteger))
+    definition = target.GetLayerDefn()
+    count = 0
+    target.StartTransaction()
+    layer.ResetReading()
+    for feature in layer:
+        count += 1
+        geometry = feature.GetGeometryRef()
+        if geometry is None: continue
+        geometry = geometry.Clone()
+        if transform is not None: geometry.Transform(transform)
+        zone = ogr.Feature(definition)
+        zone.SetField(ZONE_FIELD, count)
+        zone.SetGeometry(geometry)
+        target.CreateFeature(zone)
+    # End for
+    target.CommitTransaction()
+    target.SetMetadataItem(ZONE_COUNT, str(count))
+    datasource = None
+    return count
+# End def
+
+def rasterize_zones(file_name: str, grid: Grid, cache: str, cache_size: int, tile_size: int, workers: int = 1,
+                    sublayer: str = None) -> tuple:
+    """Burn the number of each zone onto the grid of the result, once:
+    the raster is cached by the content of the zones, their sublayer
+    and the grid.
+
+    Args:
+        file_name (str): path_dir/name of the zones.
+        grid (Grid): grid of the result.
+        cache (str): cache folder of the model.
+        cache_size (int): maximum size of the cache (bytes).
+        tile_size (int): side of the tile in pixels.
+        workers (int, optional): number of processes. Defaults to 1.
+        sublayer (str, optional): sublayer of the zones. Defaults to
+        the first one with geometries.
+
+    Returns:
+        tuple: path of the raster of zones, number of zones.
+    """
+    metadata = probe_layer(file_name, sublayer)
+    key = make_key(
+        zones = file_fingerprint(file_name, cache),
+        sublayer = metadata.sublayer,
+        grid = [grid.x_min, grid.y_max, grid.px_size, grid.cols, grid.rows, grid.wkt]
+        )
+    layers = FileCache(os.path.join(cache, 'zones'), 'gpkg', cache_size)
+    rasters = FileCache(os.path.join(cache, 'zones'), 'tif', cache_size)
+    # Number of zones as they were read (the feature count of some
+    # drivers is approximate or -1), stored with the copy
+    source, count = layers.get(key), None
+    if source is not None: count = ogr.Open(source).GetLayerByName('zones').GetMetadataItem(ZONE_COUNT)
+    if count is None:
+        count = zone_layer(file_name, grid, layers.temporary(key), metadata.sublayer)
+        source = layers.commit(key)
+    # End if
+    count = int(count)
+    path = rasters.get(key)
+    if path is None:
+        spec = {"grid": grid, "source": source, "field": ZONE_FIELD, "sublayer": 'zones'}
+        write_tiles(zones_tile, spec, rasters.temporary(key), tile_size, workers)
+        path = rasters.commit(key)
+    # End if
+    rasters.evict(keep={key})
+    return path, count
+# End def
+
+def zones_tile(spec: dict, window: tuple) -> np.ndarray:
+    """Number of the zone of each cell of a window (NaN out of them)."""
+    return burn_tile(spec["source"], spec["field"], spec["grid"], window, spec["sublayer"]).astype(np.float32)
+# End def
+
+def zone_partials(zones: np.ndarray, values: np.ndarray) -> tuple:
+    """Partial statistics of the zones present in an array: cells,
+    feasible cells (indicator > 0), sum and maximum of the indicator
+    and the histogram of the feasible cells (sparse: flat keys
+    zone_index * ZONE_BINS + bin and their counts).
+
+    Args:
+        zones (np.ndarray): number of the zone of each cell (NaN out
+        of them).
+        values (np.ndarray): indicator of each cell (NaN is 0).
+
+    Returns:
+        tuple: zones present and their cells, feasible cells, sum,
+        maximum, histogram keys and counts (None if there are no zones).
+    """
+    inside = ~np.isnan(zones)
+    if not inside.any(): return None
+    values = np.nan_to_num(values[inside], nan=0.0)
+    present, inverse = np.unique(zones[inside].astype(np.int64), return_inverse=True)
+    size = len(present)
+    feasible = values > 0
+    cells = np.bincount(inverse, minlength=size)
+    counts = np.bincount(inverse[feasible], minlength=size)
+    total = np.bincount(inverse[feasible], weights=values[feasible], minlength=size)
+    top = np.zeros(size)
+    np.maximum.at(top, inverse, values)
+    bins = np.minimum((values[feasible] * ZONE_BINS).astype(np.int64), ZONE_BINS - 1)
+    keys, frequency = np.unique(inverse[feasible] * ZONE_BINS + bins, return_counts=True)
+    return present, cells, counts, total, top, keys, frequency
+# End def
+
+def zonal_tile(spec: dict, window: tuple) -> tuple:
+    """Partial statistics of the zones present in a window (see
+    zone_partials).
+
+    Args:
+        spec (dict): {"zones", "result"} paths of the stage.
+        window (tuple): xoff, yoff, xsize, ysize.
+    """
+    zones = open_dataset(spec["zones"]).GetRasterBand(1).ReadAsArray(*window)
+    if np.isnan(zones).all(): return None
+    # The result may be rewritten by another run: opened every time
+    values = read_values(gdal.Open(spec["result"]).GetRasterBand(1), window)
+    return zone_partials(zones, values)
+# End def
+
+def reduce_zones(partials, count: int, px_size: float, percentiles: tuple = (50, 90)) -> dict:
+    """Add up the partial statistics of the tiles (see zone_partials)
+    with bincount-like reductions and compute the statistics of each
+    zone.
+
+    Args:
+        partials (iterable): partial statistics (or None) of each tile.
+        count (int): number of zones.
+        px_size (float): side of the cells.
+        percentiles (tuple, optional): percentiles of the indicator
+        in the feasible cells. Defaults to (50, 90).
+
+    Returns:
+        dict: see zonal_statistics.
+    """
+    cells = np.zeros(count + 1, dtype=np.int64)
+    counts = np.zeros(count + 1, dtype=np.int64)
+    total = np.zeros(count + 1)
+    top = np.zeros(count + 1)
+    histogram = np.zeros((count + 1) * ZONE_BINS, dtype=np.uint32)
+    for partial in partials:
+        if partial is None: continue
+        present, part_cells, part_counts, part_total, part_top, keys, frequency = partial
+        cells[present] += part_cells
+        counts[present] += part_counts
+        total[present] += part_total
+        top[present] = np.maximum(top[present], part_top)
+        histogram[present[keys // ZONE_BINS] * ZONE_BINS + keys % ZONE_BINS] += frequency.astype(np.uint32)
+    # End for
+
+    # Percentiles from the cumulative histograms (center of the bin)
+    histogram = histogram.reshape((count + 1, ZONE_BINS))
+    quantiles = {q: np.full(count + 1, np.nan) for q in percentiles}
+    for start in range(1, count + 1, ZONE_CHUNK):
+        stop = min(count + 1, start + ZONE_CHUNK)
+        cumulative = histogram[start:stop].cumsum(axis=1)
+        for q in percentiles:
+            reached = cumulative >= np.maximum(1, np.ceil(q / 100 * counts[start:stop]))[:, None]
+            bins = reached.argmax(axis=1)
+            quantiles[q][start:stop] = np.where(counts[start:stop] > 0, (bins + 0.5) / ZONE_BINS, np.nan)
+        # End for
+    # End for
+
+    with np.errstate(invalid='ignore', divide='ignore'):
+        stats = {
+            "area": cells[1:] * px_size ** 2,
+            "feasible": counts[1:] / cells[1:],
+            "mean": total[1:] / counts[1:],
+            "max": np.where(counts[1:] > 0, top[1:], np.nan)
+            }
+    # End with
+    for q in percentiles: stats[f"p{q:g}"] = quantiles[q][1:]
+    return stats
+# End def
+
+def zonal_statistics(result: str, zones: str, grid: Grid, cache: str, cache_size: int, tile_size: int,
+                     workers: int = 1, percentiles: tuple = (50, 90), sublayer: str = None) -> dict:
+    """Statistics of the indicator in each zone, aggregated tile by
+    tile with bincount reductions (the cost depends on the cells of
+    the grid, not on the number of zones). The zones are burned onto
+    the grid once (see rasterize_zones); a cell belongs to the zone
+    that covers its center.
+
+    Args:
+        result (str): path of the result of the model.
+        zones (str): path_dir/name of the polygons of the zones.
+        grid (Grid): grid of the result.
+        cache (str): cache folder of the model.
+        cache_size (int): maximum size of the cache (bytes).
+        tile_size (int): side of the tile in pixels.
+        workers (int, optional): number of processes. Defaults to 1.
+        percentiles (tuple, optional): percentiles of the indicator
+        in the feasible cells. Defaults to (50, 90).
+        sublayer (str, optional): sublayer of the zones. Defaults to
+        the first one with geometries.
+
+    Returns:
+        dict: arrays (one value per zone, in reading order): "area",
+        "feasible" (share of feasible area), "mean" and "max" (of the
+        feasible cells) and "p<q>" for each percentile.
+    """
+    with profile('rasterize_zones'):
+        path, count = rasterize_zones(zones, grid, cache, cache_size, tile_size, workers, sublayer)
+    # End with
+    spec = {"zones": path, "result": result}
+    with profile('zonal'):
+        partials = map_tiles(zonal_tile, spec, iter_windows(grid, tile_size), workers)
+        stats = reduce_zones(partials, count, grid.px_size, percentiles)
+    # End with
+    return stats
+# End def
+
+def write_zones(zones: str, stats: dict, output: str, sublayer: str = None) -> str:
+    """Write the statistics of the zones: a table (.csv, with the
+    attributes of the zones) or a copy of the polygons with the
+    statistics as fields (.shp, .gpkg or .fgb).
+
+    Args:
+        zones (str): path_dir/name of the polygons of the zones.
+        stats (dict): statistics of each zone (see zonal_statistics).
+        output (str): path_dir/name of the output.
+        sublayer (str, optional): sublayer of the zones. Defaults to
+        the first one with geometries.
+
+    Returns:
+        str: path of the output.
+    """
+    sublayer = probe_layer(zones, sublayer).sublayer
+    zones = ogr.Open(zones)
+    layer = zones.GetLayerByName(sublayer)
+    source = layer.GetLayerDefn()
+    names = [source.GetFieldDefn(i).GetName() for i in range(source.GetFieldCount())]
+    def value(x) -> float:
+        return None if np.isnan(x) else float(x)
+    # End def
+
+    layer.ResetReading()
+    if get_file_extension(output) == 'csv':
+        with open(output, 'w', newline='') as file:
+            writer = csv.writer(file)
+            writer.writerow(['fid'] + names + list(stats))
+            for idx, feature in enumerate(layer):
+                row = [feature.GetFID()] + [feature.GetField(x) for x in names]
+                writer.writerow(row + [value(stats[x][idx]) for x in stats])
+            # End for
+        # End with
+        return output
+    # End if
+
+    driver = ogr.GetDriverByName(LAYER_DRIVERS[get_file_extension(output)])
+    if os.path.exists(output): driver.DeleteDataSource(output)
+    datasource = driver.CreateDataSource(output)
+    target = datasource.CreateLayer(layer.GetName(), layer.GetSpatialRef(), layer.GetGeomType())
+    for i in range(source.GetFieldCount()): target.CreateField(source.GetFieldDefn(i))
+    for name in stats: target.CreateField(ogr.FieldDefn(name, ogr.OFTReal))
+    definition = target.GetLayerDefn()
+    target.StartTransaction()
+    for idx, feature in enumerate(layer):
+        zone = ogr.Feature(definition)
+        zone.SetFrom(feature)
+        for name in stats:
+            if not np.isnan(stats[name][idx]): zone.SetField(name, float(stats[name][idx]))
+        # End for
+        target.CreateFeature(zone)
+    # End for
+    target.CommitTransaction()
+    datasource = None
+    return output
+# End def
@@ -0,0 +1,52 @@
+# ======================================================= #
+'''
+@ProjectName: SpatialMCDA
+@Author: FernandoCastano
+@Email: castano.fernando.martin@gmail.com
+@Version: 0.1.0
+'''
+# ------------------------------------------------------- #
+
+# ======================================================= #
+# Packages
+# ------------------------------------------------------- #
+import numpy as np
+import pytest
+from core.cache import CACHE_SIZE
+from core.engine import Grid, build_occupancy, create_stack
+
+# ======================================================= #
+# Fixtures
+# ------------------------------------------------------- #
+
+@pytest.fixture
+def make_stack(tmp_path):
+    """Build a model specification over an in-memory stack (bands,
+    rows, columns): the grid has pixels of 1 unit, the stack is
+    written tile-major and the occupancy index is built from it (the
+    cells where any band is not 0 are feasible).
+    """
+    def build(values: np.ndarray, tile_size: int, feasible: bool = True) -> dict:
+        bands, rows, cols = values.shape
+        grid = Grid(0.0, float(rows), 1.0, cols, rows, '')
+        path = str(tmp_path / 'stack.npy')
+        stack = create_stack(path, grid, tile_size, bands)
+        for yoff in range(0, rows, tile_size):
+            for xoff in range(0, cols, tile_size):
+                tile = values[:, yoff:yoff + tile_size, xoff:xoff + tile_size]
+                stack[yoff // tile_size, xoff // tile_size, :, :tile.shape[1], :tile.shape[2]] = tile
+            # End for
+        # End for
+        stack.flush()
+        del stack
+        spec = {
+            "grid": grid, "bands": bands, "stack_path": path,
+            "feasible": [{}] if feasible else [],
+            "cache": str(tmp_path / 'cache'), "cache_size": CACHE_SIZE,
+            "signature": 'test'
+            }
+        build_occupancy(spec, tile_size)
+        return spec
+    # End def
+    return build
+# End def
@@ -0,0 +1,50 @@
+# ======================================================= #
+'''
+@ProjectName: SpatialMCDA
+@Author: FernandoCastano
+@Email: castano.fernando.martin@gmail.com
+@Version: 0.1.0
+'''
+# ------------------------------------------------------- #
+
+# ======================================================= #
+# Packages
+# ------------------------------------------------------- #
+import os
+from core.cache import FileCache, disk_usage
+
+# ======================================================= #
+# Tests
+# ------------------------------------------------------- #
+
+def fill(cache: FileCache, keys: list) -> None:
+    """Write an entry of 64 KB for each key, the first one the least
+    recently used."""
+    for age, key in enumerate(keys):
+        with open(cache.temporary(key), 'wb') as file: file.write(os.urandom(65536))
+        cache.commit(key)
+        os.utime(cache.path(key), (1000000 + age, 1000000 + age))
+    # End for
+# End def
+
+def test_evict_lru(tmp_path):
+    cache = FileCache(str(tmp_path), 'bin')
+    keys = ['a', 'b', 'c', 'd', 'e']
+    fill(cache, keys)
+    # A hit makes the oldest entry the most recently used
+    assert cache.get('a') == cache.path('a')
+    size = disk_usage(cache.path('a'))
+    cache.max_bytes = 3 * size
+    cache.evict()
+    assert sorted(os.listdir(str(tmp_path))) == ['a.bin', 'd.bin', 'e.bin']
+# End def
+
+def test_evict_keep(tmp_path):
+    cache = FileCache(str(tmp_path), 'bin')
+    fill(cache, ['a', 'b', 'c', 'd'])
+    cache.max_bytes = disk_usage(cache.path('a'))
+    cache.evict(keep={'a', 'b'})
+    # Over the limit, but the kept entries are never removed
+    assert sorted(os.listdir(str(tmp_path))) == ['a.bin', 'b.bin']
+    assert cache.get('c') is None
+# End def
@@ -0,0 +1,66 @@
+# ======================================================= #
+'''
+@ProjectName: SpatialMCDA
+@Author: FernandoCastano
+@Email: castano.fernando.martin@gmail.com
+@Version: 0.1.0
+'''
+# ------------------------------------------------------- #
+
+# ======================================================= #
+# Packages
+# ------------------------------------------------------- #
+import numpy as np
+from core.engine import EMPTY, FULL, PARTIAL, build_occupancy, occupied_windows, tile_mask
+
+# ======================================================= #
+# Tests
+# ------------------------------------------------------- #
+
+def region() -> np.ndarray:
+    """Stack of 2 bands over 20 x 30 cells (tiles of 10): the first
+    row of tiles is feasible, the middle one is half feasible and the
+    last one is empty."""
+    values = np.zeros((2, 30, 20))
+    values[0, :10] = 0.5
+    values[1, 10:20, :7] = 1.0
+    values[1, 12, 15] = 1.0
+    return values
+# End def
+
+def test_states(make_stack):
+    spec = make_stack(region(), 10)
+    assert spec["occupancy"] == {
+        (0, 0, 10, 10): FULL, (10, 0, 10, 10): FULL,
+        (0, 10, 10, 10): PARTIAL, (10, 10, 10, 10): PARTIAL,
+        (0, 20, 10, 10): EMPTY, (10, 20, 10, 10): EMPTY
+        }
+    assert occupied_windows(spec, 10) == [(0, 0, 10, 10), (10, 0, 10, 10), (0, 10, 10, 10), (10, 10, 10, 10)]
+# End def
+
+def test_partial_masks(make_stack):
+    values = region()
+    spec = make_stack(values, 10)
+    assert tile_mask(spec, (0, 0, 10, 10)) is None
+    feasible = (values != 0).any(axis=0)
+    for window in [(0, 10, 10, 10), (10, 10, 10, 10)]:
+        xoff, yoff, xsize, ysize = window
+        assert (tile_mask(spec, window) == feasible[yoff:yoff + ysize, xoff:xoff + xsize]).all()
+    # End for
+# End def
+
+def test_cached_index(make_stack):
+    spec = make_stack(region(), 10)
+    cached = dict(spec)
+    # The stack is not read again: the index is loaded from the cache
+    cached["stack_path"] = None
+    build_occupancy(cached, 10)
+    assert cached["occupancy"] == spec["occupancy"]
+    assert all((cached["masks"][x] == spec["masks"][x]).all() for x in spec["masks"])
+# End def
+
+def test_without_feasible_layers(make_stack):
+    spec = make_stack(region(), 10, feasible=False)
+    assert spec["occupancy"] == {}
+    assert len(occupied_windows(spec, 10)) == 6
+# End def
@@ -0,0 +1,35 @@
+# ======================================================= #
+'''
+@ProjectName: SpatialMCDA
+@Author: FernandoCastano
+@Email: castano.fernando.martin@gmail.com
+@Version: 0.1.0
+'''
+# ------------------------------------------------------- #
+
+# ======================================================= #
+# Packages
+# ------------------------------------------------------- #
+import os
+from core.utils import _file_key, layer_files
+
+# ======================================================= #
+# Tests
+# ------------------------------------------------------- #
+
+def test_shapefile_parts(tmp_path):
+    base = str(tmp_path / 'roads')
+    for ext in ['.shp', '.shx', '.dbf', '.prj']:
+        with open(base + ext, 'w') as file: file.write('x')
+        os.utime(base + ext, ns=(10 ** 18, 10 ** 18))
+    # End for
+    assert sorted(layer_files(base + '.shp')) == sorted(base + x for x in ['.shp', '.shx', '.dbf', '.prj'])
+    key = _file_key(base + '.shp')
+    assert _file_key(base + '.shp') == key
+    # Only a side file changes: other version of the layer
+    for ext in ['.dbf', '.prj']:
+        with open(base + ext, 'w') as file: file.write('xy')
+        assert _file_key(base + '.shp') != key
+        key = _file_key(base + '.shp')
+    # End for
+# End def
@@ -0,0 +1,70 @@
+# ======================================================= #
+'''
+@ProjectName: SpatialMCDA
+@Author: FernandoCastano
+@Email: castano.fernando.martin@gmail.com
+@Version: 0.1.0
+'''
+# ------------------------------------------------------- #
+
+# ======================================================= #
+# Packages
+# ------------------------------------------------------- #
+import numpy as np
+from core.engine import build_occupancy, iter_windows, sample_thresholds, sensitivity_tile
+
+# ======================================================= #
+# Tests
+# ------------------------------------------------------- #
+
+def stability(spec: dict, tile_size: int) -> np.ndarray:
+    """Assemble the rank stability of the whole grid."""
+    grid = spec["grid"]
+    result = np.zeros((grid.rows, grid.cols))
+    for window in iter_windows(grid, tile_size):
+        xoff, yoff, xsize, ysize = window
+        result[yoff:yoff + ysize, xoff:xoff + xsize] = sensitivity_tile(spec, window)[2]
+    # End for
+    return result
+# End def
+
+def test_mostly_infeasible_stack(make_stack):
+    # 2% of the grid is feasible, less than the top fraction
+    rng = np.random.default_rng(0)
+    values = np.zeros((2, 50, 50))
+    values[0, 3:10, 5:10] = rng.uniform(0.01, 1.0, (7, 5))
+    values[1, 3:10, 5:10] = 1.0
+    spec = make_stack(values, 16)
+    spec["samples"] = np.array([[1.0, 0.0], [0.5, 0.2], [0.2, 0.5]])
+    spec["thresholds"] = sample_thresholds(spec, spec["samples"], 0.1, 16)
+    assert (spec["thresholds"] > 0).all()
+
+    result = stability(spec, 16)
+    feasible = values[1] != 0
+    assert (result[~feasible] == 0).all()
+    # About the top 10% of the feasible cells
+    assert 0.05 <= result[feasible].mean() <= 0.2
+# End def
+
+def test_thresholds_without_feasible_cells(make_stack):
+    spec = make_stack(np.zeros((1, 20, 20)), 8)
+    spec["samples"] = np.ones((4, 1))
+    spec["thresholds"] = sample_thresholds(spec, spec["samples"], 0.1, 8)
+    assert np.isinf(spec["thresholds"]).all()
+    assert (stability(spec, 8) == 0).all()
+# End def
+
+def test_stack_of_other_tile_size(make_stack):
+    # The cached stack has tiles of 16, the run uses tiles of 24
+    values = np.zeros((2, 60, 60))
+    values[0, 20:30, 40:52] = np.linspace(0.1, 1.0, 120).reshape((10, 12))
+    values[1, 20:30, 40:52] = 1.0
+    spec = make_stack(values, 16)
+    build_occupancy(spec, 24)
+    spec["samples"] = np.array([[1.0, 0.0], [0.0, 1.0]])
+    thresholds = spec["thresholds"] = sample_thresholds(spec, spec["samples"], 0.5, 24)
+    feasible = values[1] != 0
+    assert np.isclose(thresholds[0], np.quantile(values[0][feasible], 0.5))
+    assert thresholds[1] == 1.0
+    assert (stability(spec, 24)[~feasible] == 0).all()
+# End def
@@ -0,0 +1,60 @@
+# ======================================================= #
+'''
+@ProjectName: SpatialMCDA
+@Author: FernandoCastano
+@Email: castano.fernando.martin@gmail.com
+@Version: 0.1.0
+'''
+# ------------------------------------------------------- #
+
+# ======================================================= #
+# Packages
+# ------------------------------------------------------- #
+import numpy as np
+from core.engine import select_sites
+
+# ======================================================= #
+# Tests
+# ------------------------------------------------------- #
+
+def surface() -> np.ndarray:
+    """Indicator of 40 x 40 cells that decreases away from a peak at
+    (10, 10), with an infeasible band and a no data cell."""
+    rows, cols = np.mgrid[0:40, 0:40]
+    values = 1.0 / (1.0 + np.hypot(rows - 10, cols - 10))
+    values[:, 30:] = 0.0
+    values[0, 0] = np.nan
+    return values
+# End def
+
+def test_separation():
+    values = surface()
+    sites = select_sites(values, 8, 6.0)
+    assert len(sites) == 8
+    assert sites[0][1:] == (10, 10)
+    assert [x[0] for x in sites] == sorted([x[0] for x in sites], reverse=True)
+    for i, (_, r0, c0) in enumerate(sites):
+        assert values[r0, c0] > 0
+        for _, r1, c1 in sites[i + 1:]: assert (r0 - r1) ** 2 + (c0 - c1) ** 2 >= 36
+    # End for
+# End def
+
+def test_without_separation():
+    values = surface()
+    sites = select_sites(values, 5, 0)
+    best = np.sort(np.nan_to_num(values).ravel())[::-1][:5]
+    assert np.allclose([x[0] for x in sites], best)
+    # Fewer feasible cells than requested
+    assert len(select_sites(np.zeros((5, 5)), 3, 0)) == 0
+# End def
+
+def test_taken():
+    values = surface()
+    # A site chosen out of the array still discards its neighbours
+    sites = select_sites(values, 3, 6.0, taken=[(10, 10), (-3, 20)])
+    for _, row, col in sites:
+        assert (row - 10) ** 2 + (col - 10) ** 2 >= 36
+        assert (row + 3) ** 2 + (col - 20) ** 2 >= 36
+    # End for
+    assert len(sites) == 3
+# End def
@@ -0,0 +1,51 @@
+# ======================================================= #
+'''
+@ProjectName: SpatialMCDA
+@Author: FernandoCastano
+@Email: castano.fernando.martin@gmail.com
+@Version: 0.1.0
+'''
+# ------------------------------------------------------- #
+
+# ======================================================= #
+# Packages
+# ------------------------------------------------------- #
+import numpy as np
+from core.engine import iter_windows, open_stack, read_stack
+
+# ======================================================= #
+# Tests
+# ------------------------------------------------------- #
+
+def layers() -> np.ndarray:
+    """Stack of 3 bands over 19 x 21 cells (not a multiple of the
+    tiles), every cell different."""
+    return np.arange(3 * 19 * 21, dtype=np.float32).reshape((3, 19, 21))
+# End def
+
+def test_aligned_views(make_stack):
+    values = layers()
+    spec = make_stack(values, 8)
+    for window in iter_windows(spec["grid"], 8):
+        xoff, yoff, xsize, ysize = window
+        tile = read_stack(spec["stack_path"], window)
+        # A tile of the stack is not copied
+        assert np.shares_memory(tile, open_stack(spec["stack_path"]))
+        assert (tile == values[:, yoff:yoff + ysize, xoff:xoff + xsize]).all()
+    # End for
+# End def
+
+def test_other_tile_sizes(make_stack):
+    values = layers()
+    spec = make_stack(values, 8)
+    # Windows of other tilings, smaller or larger than the tiles of
+    # the stack and crossing several of them
+    windows = list(iter_windows(spec["grid"], 5)) + list(iter_windows(spec["grid"], 16))
+    windows += [(3, 2, 17, 15), (7, 7, 2, 2), (0, 0, 21, 19), (20, 18, 1, 1)]
+    for window in windows:
+        xoff, yoff, xsize, ysize = window
+        tile = read_stack(spec["stack_path"], window)
+        assert tile.shape == (3, ysize, xsize)
+        assert (tile == values[:, yoff:yoff + ysize, xoff:xoff + xsize]).all()
+    # End for
+# End def
@@ -0,0 +1,85 @@
+# ======================================================= #
+'''
+@ProjectName: SpatialMCDA
+@Author: FernandoCastano
+@Email: castano.fernando.martin@gmail.com
+@Version: 0.1.0
+'''
+# ------------------------------------------------------- #
+
+# ======================================================= #
+# Packages
+# ------------------------------------------------------- #
+import numpy as np
+from core.engine import Grid, same_pixels
+from core.stats import StreamingStats, load_stats, save_stats
+
+# ======================================================= #
+# Tests
+# ------------------------------------------------------- #
+
+def sample() -> np.ndarray:
+    """Values in very different ranges, with no data."""
+    rng = np.random.default_rng(7)
+    values = np.concatenate([rng.normal(5, 1, 20000), rng.uniform(100, 900, 5000), [-3.0]])
+    values[::97] = np.nan
+    return values
+# End def
+
+def test_merge():
+    values = sample()
+    whole = StreamingStats()
+    whole.update(values)
+    merged = StreamingStats()
+    # Parts with growing ranges, merged in any order
+    for part in [values[20000:], values[:1000], values[1000:20000]]:
+        stats = StreamingStats()
+        stats.update(part)
+        merged.merge(stats)
+    # End for
+    merged.merge(StreamingStats())
+    valid = values[~np.isnan(values)]
+    for stats in [whole, merged]:
+        assert stats.count == valid.size
+        assert stats.nodata == values.size - valid.size
+        assert stats.histogram.sum() == valid.size
+        assert (stats.min, stats.max) == (valid.min(), valid.max())
+    # End for
+    assert (merged.width, merged.low) == (whole.width, whole.low)
+    assert (merged.histogram == whole.histogram).all()
+# End def
+
+def test_percentiles():
+    values = sample()
+    stats = StreamingStats()
+    for part in np.array_split(values, 7): stats.update(part)
+    valid = values[~np.isnan(values)]
+    for q in [1, 25, 50, 75, 90, 99]:
+        # Within a bin of the exact percentile
+        assert abs(stats.percentile(q) - np.percentile(valid, q)) <= stats.width
+    # End for
+    assert stats.percentile(0) == valid.min()
+    assert stats.percentile(100) == valid.max()
+    assert np.isnan(StreamingStats().percentile(50))
+# End def
+
+def test_round_trip(tmp_path):
+    stats = StreamingStats()
+    stats.update(sample())
+    save_stats(stats, str(tmp_path / 'stats.json'))
+    loaded = load_stats(str(tmp_path / 'stats.json'))
+    assert loaded.to_dict() == stats.to_dict()
+    assert load_stats(str(tmp_path / 'missing.json')) is None
+# End def
+
+def test_stored_stats_grid():
+    # Stored statistics are only exact for rasters on the pixels of the grid
+    grid = Grid(1000.0, 5000.0, 30.0, 100, 100, '')
+    assert same_pixels((1000.0, 30.0, 0.0, 5000.0, 0.0, -30.0), grid)
+    assert same_pixels((1300.0, 30.0, 0.0, 4400.0, 0.0, -30.0), grid)
+    # Coarser grid, shifted origin or rotated raster
+    assert not same_pixels((1000.0, 10.0, 0.0, 5000.0, 0.0, -10.0), grid)
+    assert not same_pixels((1015.0, 30.0, 0.0, 5000.0, 0.0, -30.0), grid)
+    assert not same_pixels((1000.0, 30.0, 0.0, 4990.0, 0.0, -30.0), grid)
+    assert not same_pixels((1000.0, 30.0, 0.5, 5000.0, 0.5, -30.0), grid)
+# End def
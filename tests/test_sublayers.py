@@ -0,0 +1,55 @@
+# ======================================================= #
+'''
+@ProjectName: SpatialMCDA
+@Author: FernandoCastano
+@Email: castano.fernando.martin@gmail.com
+@Version: 0.1.0
+'''
+# ------------------------------------------------------- #
+
+# ======================================================= #
+# Packages
+# ------------------------------------------------------- #
+import pytest
+from core.utils import LayerMetadata, SublayerMetadata, select_sublayer
+
+# ======================================================= #
+# Tests
+# ------------------------------------------------------- #
+
+def geopackage() -> LayerMetadata:
+    """Metadata of a GeoPackage with the styles table of QGIS before
+    two tables of features."""
+    sublayers = (
+        SublayerMetadata('layer_styles', None, '', (0.0, 0.0, 0.0, 0.0), 1, ('styleName', 'styleQML'), False),
+        SublayerMetadata('roads', 'WGS 84', 'WKT84', (0.0, 0.0, 10.0, 5.0), 30, ('kind',), True),
+        SublayerMetadata('schools', 'POSGAR', 'WKT22185', (1.0, 2.0, 3.0, 4.0), 7, ('name', 'pupils'), True)
+        )
+    return LayerMetadata('data.gpkg', 'vector', 'GPKG', None, '', None, None, None, None, None, (), None, sublayers, None)
+# End def
+
+def test_first_spatial_sublayer():
+    metadata = select_sublayer(geopackage())
+    assert metadata.sublayer == 'roads'
+    assert (metadata.srs_wkt, metadata.extent) == ('WKT84', (0.0, 0.0, 10.0, 5.0))
+    assert (metadata.fields, metadata.feature_count) == (('kind',), 30)
+# End def
+
+def test_named_sublayer():
+    metadata = select_sublayer(geopackage(), 'schools')
+    assert (metadata.sublayer, metadata.projection_name) == ('schools', 'POSGAR')
+    # Only the fields of that sublayer
+    assert metadata.fields == ('name', 'pupils')
+    assert metadata.feature_count == 7
+    # The default of a described layer is its own sublayer
+    assert select_sublayer(metadata).sublayer == 'schools'
+# End def
+
+def test_invalid_sublayers():
+    with pytest.raises(RuntimeError):
+        select_sublayer(geopackage(), 'layer_styles')
+    # End with
+    with pytest.raises(RuntimeError):
+        select_sublayer(geopackage(), 'rivers')
+    # End with
+# End def
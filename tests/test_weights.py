@@ -0,0 +1,62 @@
+# ======================================================= #
+'''
+@ProjectName: SpatialMCDA
+@Author: FernandoCastano
+@Email: castano.fernando.martin@gmail.com
+@Version: 0.1.0
+'''
+# ------------------------------------------------------- #
+
+# ======================================================= #
+# Packages
+# ------------------------------------------------------- #
+import numpy as np
+from core.engine import contributions, stack_weights
+
+# ======================================================= #
+# Tests
+# ------------------------------------------------------- #
+
+def model() -> dict:
+    """Two criterias over the bands a and b: the layer b is used as
+    positive in one criteria and as not positive in the other, so
+    they share its band; the last band is the feasible region z."""
+    layer = lambda key, weight, positive: {"normalized_key": key, "weight": weight, "positive": positive}
+    return {
+        "criterias": [
+            {"alias": 'c1', "weight": 0.6, "layers": [layer('a', 0.7, True), layer('b', 0.3, True)]},
+            {"alias": 'c2', "weight": 0.4, "layers": [layer('b', 0.5, False), layer('a', 0.5, False)]}
+            ],
+        "index": {'a': 0, 'b': 1},
+        "bands": 3
+        }
+# End def
+
+def test_complement():
+    spec = model()
+    rng = np.random.default_rng(3)
+    x = rng.uniform(0, 1, (2, 50))
+    z = (rng.uniform(0, 1, 50) > 0.3).astype(float)
+    stack = np.vstack([x * z, z])
+    alpha = rng.dirichlet([1, 1], 4)
+    omegas = [rng.dirichlet([1, 1], 4), rng.dirichlet([1, 1], 4)]
+    weights = stack_weights(spec, alpha, omegas)
+    assert weights.shape == (4, 3)
+    for s in range(4):
+        # z * (1 - x) = z - z * x
+        expected = alpha[s, 0] * (omegas[0][s, 0] * x[0] + omegas[0][s, 1] * x[1]) * z
+        expected += alpha[s, 1] * (omegas[1][s, 0] * (1 - x[1]) + omegas[1][s, 1] * (1 - x[0])) * z
+        assert np.allclose(weights[s] @ stack, expected)
+    # End for
+# End def
+
+def test_contributions():
+    spec = model()
+    values = np.array([0.2, 0.9, 1.0])
+    alpha = np.array([[0.6, 0.4]])
+    omegas = [np.array([[0.7, 0.3]]), np.array([[0.5, 0.5]])]
+    result = contributions(spec, values)
+    assert np.isclose(result['c1'], 0.6 * (0.7 * 0.2 + 0.3 * 0.9))
+    assert np.isclose(result['c2'], 0.4 * (0.5 * 0.1 + 0.5 * 0.8))
+    assert np.isclose(sum(result.values()), stack_weights(spec, alpha, omegas)[0] @ values)
+# End def
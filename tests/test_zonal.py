@@ -0,0 +1,81 @@
+# ======================================================= #
+'''
+@ProjectName: SpatialMCDA
+@Author: FernandoCastano
+@Email: castano.fernando.martin@gmail.com
+@Version: 0.1.0
+'''
+# ------------------------------------------------------- #
+
+# ======================================================= #
+# Packages
+# ------------------------------------------------------- #
+import numpy as np
+from core.zonal import ZONE_BINS, reduce_zones, zone_partials
+
+# ======================================================= #
+# Tests
+# ------------------------------------------------------- #
+
+def layout() -> tuple:
+    """Zones 1..5 over 40 x 50 cells (NaN out of them) and an
+    indicator with infeasible (0) and no data cells; the zone 6 has
+    no cells."""
+    rng = np.random.default_rng(11)
+    zones = rng.integers(1, 6, (40, 50)).astype(np.float32)
+    zones[:, :6] = np.nan
+    values = rng.uniform(0, 1, (40, 50)).astype(np.float32)
+    values[rng.uniform(0, 1, values.shape) < 0.3] = 0.0
+    values[::7, ::3] = np.nan
+    # Every cell of the zone 5 is infeasible
+    values[zones == 5] = 0.0
+    return zones, values
+# End def
+
+def tiles(zones: np.ndarray, values: np.ndarray, size: int):
+    for yoff in range(0, zones.shape[0], size):
+        for xoff in range(0, zones.shape[1], size):
+            window = np.s_[yoff:yoff + size, xoff:xoff + size]
+            yield zone_partials(zones[window], values[window])
+        # End for
+    # End for
+# End def
+
+def test_aggregation():
+    zones, values = layout()
+    stats = reduce_zones(tiles(zones, values, 16), 6, 2.0, (50, 90))
+    values = np.nan_to_num(values, nan=0.0)
+    for zone in range(1, 7):
+        inside = values[zones == zone]
+        feasible = inside[inside > 0]
+        i = zone - 1
+        assert stats["area"][i] == inside.size * 4.0
+        if inside.size == 0:
+            assert np.isnan(stats["feasible"][i])
+            continue
+        # End if
+        assert np.isclose(stats["feasible"][i], feasible.size / inside.size)
+        if feasible.size == 0:
+            assert all(np.isnan(stats[x][i]) for x in ["mean", "max", "p50", "p90"])
+            continue
+        # End if
+        assert np.isclose(stats["mean"][i], feasible.mean())
+        assert stats["max"][i] == feasible.max()
+        for q in [50, 90]:
+            # Center of the bin of the exact percentile
+            exact = np.percentile(feasible, q, method='inverted_cdf')
+            assert abs(stats[f"p{q}"][i] - exact) <= 0.5 / ZONE_BINS + 1e-6
+        # End for
+    # End for
+# End def
+
+def test_tilings_agree():
+    zones, values = layout()
+    whole = reduce_zones([zone_partials(zones, values)], 6, 1.0)
+    for size in [7, 16, 64]:
+        stats = reduce_zones(tiles(zones, values, size), 6, 1.0)
+        for name in whole: assert np.allclose(stats[name], whole[name], equal_nan=True)
+    # End for
+    # Windows out of every zone
+    assert zone_partials(np.full((3, 3), np.nan), np.ones((3, 3))) is None
+# End def